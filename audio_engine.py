@@ -0,0 +1,330 @@
+"""audio_engine.py — Threaded mixer front-end for the racing game.
+
+The game thread only calls the cheap, non-blocking methods (play, engine_*),
+which drop a command on a queue or overwrite the latest engine parameters. A
+worker thread owns every pygame.mixer call: it opens the device (so a slow
+audio driver never stalls a frame), loads sounds the first time they're
+needed, hands out channels by priority and keeps engine loops in tune with
+each car's speed.
+
+Works with SDL's dummy driver (SDL_AUDIODRIVER=dummy) for headless runs;
+`python3 audio_engine.py` checks the engine crossfade that way.
+"""
+
+import os
+import queue
+import sys
+import threading
+import time
+from array import array
+
+import pygame
+
+# name -> (file stem, volume, priority, min ms between triggers)
+EFFECTS = {
+    "start": ("start", 0.7, 3, 0),
+    "crash": ("crash", 0.7, 2, 250),
+    "drift": ("skid", 0.4, 1, 400),
+}
+# Long one-shots go through pygame.mixer.music so they are decoded as they play
+STREAMED = {"start"}
+ENGINES = {
+    "eng_v6": "eng_v6",
+    "eng_v8": "eng_v8",
+    "eng_v10": "eng_v10",
+    "eng_w16": "eng_w16",
+}
+EXTENSIONS = [".wav", ".mp3", ".ogg"]
+
+# Playback rates of the pre-resampled engine loops, low to high revs
+ENGINE_PITCHES = (0.8, 1.0, 1.25, 1.6)
+ENGINE_LOOP_SECONDS = 1.5
+LOOP_FADE_FRAMES = 2048
+ENGINE_VOICES = 4 # Cars that can have an engine running at once
+EFFECT_CHANNELS = 4
+
+
+def find_sound_file(stem):
+    for ext in EXTENSIONS:
+        if os.path.exists(stem + ext):
+            return stem + ext
+    return None
+
+
+def resample_loop(raw, channels, rate, frames):
+    """Nearest-sample resample of interleaved 16-bit audio into a seamless loop.
+
+    `raw` must hold at least frames*rate + LOOP_FADE_FRAMES frames; the head of
+    the loop is crossfaded with what follows its tail so the wrap doesn't click.
+    """
+    src = array("h")
+    src.frombytes(raw)
+    fade = LOOP_FADE_FRAMES
+    out = array("h", bytes(2 * frames * channels))
+    starts = [int(i * rate) * channels for i in range(frames)]
+    for c in range(channels):
+        out[c::channels] = array("h", [src[s + c] for s in starts])
+    for i in range(min(fade, frames)):
+        w = i / fade
+        s = int((frames + i) * rate) * channels
+        o = i * channels
+        for c in range(channels):
+            out[o + c] = int(out[o + c] * w + src[s + c] * (1 - w))
+    return out.tobytes()
+
+
+class _EngineVoice:
+    """Two channels crossfading between neighbouring pitch loops."""
+
+    def __init__(self, channels):
+        self.channels = channels
+        self.loops = None
+        self.sfx = None
+        self.slots = [None, None] # Loop index playing on each channel
+        self.ratio = 0.0
+        self.volume = 0.0
+        self.dirty = False
+
+
+class AudioEngine:
+    def __init__(self):
+        self.enabled = False
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._last_trigger = {}
+        self._engine_params = {} # voice id -> (ratio, volume), latest wins
+        self._thread = None
+
+    # --- GAME THREAD API ---
+    def start(self):
+        """Open the mixer on the worker thread; safe to call more than once."""
+        if self._thread: return
+        self.enabled = True # Commands queue up while the device opens
+        self._thread = threading.Thread(target=self._run, name="audio", daemon=True)
+        self._thread.start()
+
+    def play(self, name):
+        """Fire a one-shot effect; repeats inside its rate limit are dropped."""
+        if not self.enabled or name not in EFFECTS: return
+        now = time.monotonic()
+        limit = EFFECTS[name][3] / 1000.0
+        if now - self._last_trigger.get(name, -limit) < limit: return
+        self._last_trigger[name] = now
+        self._queue.put(("play", name))
+
+    def engine_start(self, voice, sfx):
+        if self.enabled: self._queue.put(("engine_start", voice, sfx))
+
+    def engine_update(self, voice, speed_ratio, volume):
+        """Latest speed (0..1 of max) and volume for a running engine."""
+        if not self.enabled: return
+        with self._lock:
+            self._engine_params[voice] = (speed_ratio, volume)
+
+    def engine_stop(self, voice, fade_ms=500):
+        if self.enabled: self._queue.put(("engine_stop", voice, fade_ms))
+
+    def shutdown(self):
+        if not self._thread: return
+        self._queue.put(("quit",))
+        self._thread.join(timeout=2.0)
+        self._thread = None
+        self.enabled = False
+
+    # --- WORKER THREAD ---
+    def _run(self):
+        try:
+            if not pygame.mixer.get_init():
+                pygame.mixer.init()
+        except pygame.error as e:
+            print(f"Audio disabled: {e}")
+            self.enabled = False
+            return
+        self._sounds = {}
+        self._loops = {}
+        freq, fmt, channels = pygame.mixer.get_init()
+        self._mix_format = (freq, fmt, channels)
+        pygame.mixer.set_num_channels(ENGINE_VOICES * 2 + EFFECT_CHANNELS)
+        pygame.mixer.set_reserved(ENGINE_VOICES * 2)
+        self._voices = [_EngineVoice((pygame.mixer.Channel(2*i), pygame.mixer.Channel(2*i + 1)))
+                        for i in range(ENGINE_VOICES)]
+        self._pool = [pygame.mixer.Channel(ENGINE_VOICES * 2 + i) for i in range(EFFECT_CHANNELS)]
+        self._pool_state = [(0, 0.0)] * EFFECT_CHANNELS # (priority, start time)
+
+        running = True
+        while running:
+            cmds = []
+            try:
+                cmds.append(self._queue.get(timeout=1 / 60))
+                while True: cmds.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            for cmd in cmds:
+                if cmd[0] == "quit":
+                    running = False
+                    break
+                try:
+                    getattr(self, "_do_" + cmd[0])(*cmd[1:])
+                except pygame.error as e:
+                    print(f"Audio error ({cmd[0]}): {e}")
+            self._apply_engines()
+        pygame.mixer.stop()
+
+    def _load(self, name):
+        if name not in self._sounds:
+            stem, volume, _, _ = EFFECTS[name]
+            path = find_sound_file(stem)
+            sound = None
+            if path:
+                try:
+                    sound = pygame.mixer.Sound(path)
+                    sound.set_volume(volume)
+                except pygame.error as e:
+                    print(f"Error loading {path}: {e}")
+            self._sounds[name] = sound
+        return self._sounds[name]
+
+    def _do_play(self, name):
+        if name in STREAMED:
+            path = find_sound_file(EFFECTS[name][0])
+            if path:
+                pygame.mixer.music.load(path)
+                pygame.mixer.music.set_volume(EFFECTS[name][1])
+                pygame.mixer.music.play()
+            return
+        sound = self._load(name)
+        if not sound: return
+        priority = EFFECTS[name][2]
+        now = time.monotonic()
+        slot = None
+        for i, ch in enumerate(self._pool):
+            if not ch.get_busy():
+                slot = i
+                break
+        if slot is None:
+            # Steal the oldest voice of the lowest priority, never a higher one
+            victim = min(range(len(self._pool)), key=lambda i: self._pool_state[i])
+            if self._pool_state[victim][0] > priority: return
+            slot = victim
+        self._pool[slot].play(sound)
+        self._pool_state[slot] = (priority, now)
+
+    def _engine_loops(self, sfx):
+        """Pitch-shifted copies of an engine sample, built once per sample."""
+        if sfx in self._loops: return self._loops[sfx]
+        loops = []
+        path = find_sound_file(ENGINES.get(sfx, sfx))
+        if path:
+            try:
+                base = pygame.mixer.Sound(path)
+                freq, fmt, channels = self._mix_format
+                raw = base.get_raw()
+                total = len(raw) // (2 * channels)
+                frames = int(freq * ENGINE_LOOP_SECONDS)
+                # Shorten the loop if the sample can't feed the fastest rate
+                frames = min(frames, int(total / max(ENGINE_PITCHES)) - LOOP_FADE_FRAMES - 2)
+                if abs(fmt) != 16 or frames <= LOOP_FADE_FRAMES:
+                    loops = [base]
+                else:
+                    for rate in ENGINE_PITCHES:
+                        n = frames
+                        need = (int((n + LOOP_FADE_FRAMES) * rate) + 1) * 2 * channels
+                        loops.append(pygame.mixer.Sound(buffer=resample_loop(raw[:need], channels, rate, n)))
+                for s in loops: s.set_volume(0.7)
+            except pygame.error as e:
+                print(f"Error loading {path}: {e}")
+                loops = []
+        self._loops[sfx] = loops
+        return loops
+
+    def _do_engine_start(self, voice, sfx):
+        v = self._voices[voice % ENGINE_VOICES]
+        v.sfx = sfx
+        v.loops = self._engine_loops(sfx)
+        v.slots = [None, None]
+        v.dirty = True
+        for ch in v.channels:
+            ch.stop()
+
+    def _do_engine_stop(self, voice, fade_ms):
+        v = self._voices[voice % ENGINE_VOICES]
+        for ch in v.channels:
+            ch.fadeout(fade_ms)
+        v.loops = None
+        with self._lock:
+            self._engine_params.pop(voice, None)
+
+    def _apply_engines(self):
+        with self._lock:
+            params, self._engine_params = self._engine_params, {}
+        for voice, (ratio, volume) in params.items():
+            v = self._voices[voice % ENGINE_VOICES]
+            if not v.loops: continue
+            if abs(ratio - v.ratio) < 0.005 and abs(volume - v.volume) < 0.01 and not v.dirty:
+                continue
+            v.ratio, v.volume, v.dirty = ratio, volume, False
+            # Position between the two loops that bracket the current revs
+            pos = max(0.0, min(1.0, ratio)) * (len(v.loops) - 1)
+            low = min(int(pos), len(v.loops) - 1)
+            high = min(low + 1, len(v.loops) - 1)
+            frac = pos - low if high != low else 0.0
+            # Loop i always sits on channel i % 2, so crossing into the next
+            # band only restarts the channel that is fading in from silence
+            for loop_i, gain in [(low, 1.0 - frac), (high, frac)]:
+                ch_i = loop_i % 2
+                ch = v.channels[ch_i]
+                if v.slots[ch_i] != loop_i:
+                    ch.play(v.loops[loop_i], loops=-1)
+                    v.slots[ch_i] = loop_i
+                ch.set_volume(min(1.0, volume * gain))
+                if high == low:
+                    # At the very top (or with a single loop) one channel plays
+                    # alone; silence the other or it keeps its last gain
+                    v.channels[1 - ch_i].set_volume(0.0)
+                    break
+
+
+# --- SELF TEST ---
+def selftest(sfx="eng_v10"):
+    """Drive one engine voice through the pitch bands and check each channel's gain."""
+    engine = AudioEngine()
+    engine.start()
+    engine.engine_start(0, sfx)
+    # The worker opens the device and builds the loops first
+    deadline = time.monotonic() + 5.0
+    while engine.enabled and time.monotonic() < deadline:
+        voices = getattr(engine, "_voices", None)
+        if voices and voices[0].loops: break
+        time.sleep(0.05)
+    # speed ratio -> {loop index: gain}, for the four ENGINE_PITCHES loops
+    cases = [
+        (0.0, {0: 1.0, 1: 0.0}),
+        (0.5, {1: 0.5, 2: 0.5}),
+        (0.9, {2: 0.3, 3: 0.7}),
+        (1.0, {3: 1.0}),
+        (0.6, {1: 0.2, 2: 0.8}),
+    ]
+    ok = True
+    for ratio, expected in cases:
+        engine.engine_update(0, ratio, 1.0)
+        time.sleep(0.1) # A few worker frames
+        if not engine.enabled:
+            print("Audio could not be opened")
+            return False
+        v = engine._voices[0]
+        if not v.loops or len(v.loops) != len(ENGINE_PITCHES):
+            print(f"No pitched loops for {sfx}")
+            return False
+        gains = {v.slots[i]: ch.get_volume() for i, ch in enumerate(v.channels)}
+        good = all(abs(gains.get(loop, 0.0) - want) < 0.02 for loop, want in expected.items())
+        good = good and all(gains[loop] < 0.02 for loop in gains if loop not in expected)
+        ok = ok and good
+        heard = "  ".join(f"loop {loop}: {gain:.2f}" for loop, gain in sorted(gains.items(), key=str))
+        print(f"revs {ratio:.2f}  {heard}  {'ok' if good else 'WRONG'}")
+    engine.shutdown()
+    return ok
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    sys.exit(0 if selftest() else 1)
@@ -0,0 +1,176 @@
+"""ghost.py — Best-lap traces for time trial ghosts.
+
+A lap is stored as one pose every SAMPLE_MS of lap time: position in whole
+pixels and heading in 1/65536ths of a turn, each a uint16. On disk every
+channel is delta-coded (consecutive samples differ by a few units) and the
+lot is zlib-compressed, which brings a one-minute lap to about 2 kB, so a
+handful of laps per driver, track and car is cheap to keep.
+
+Playback is O(1): the sample index is just lap time // SAMPLE_MS, and poses
+in between are interpolated.
+"""
+
+import sqlite3
+import struct
+import sys
+import threading
+import zlib
+from array import array
+
+from race_db import DB_FILE, connect
+
+SAMPLE_MS = 100  # One pose every 100 ms of lap time (6 frames at 60 FPS)
+GHOST_KEEP = 5   # Best laps kept per driver, track and car
+ANGLE_UNITS = 65536 / 360
+
+BLOB_VERSION = 1
+_HEADER = struct.Struct("<BHII") # version, sample_ms, lap_ms, sample count
+
+
+class LapTrace:
+    __slots__ = ("xs", "ys", "angles", "lap_ms", "sample_ms")
+
+    def __init__(self, xs, ys, angles, lap_ms, sample_ms=SAMPLE_MS):
+        self.xs = array("H", xs)
+        self.ys = array("H", ys)
+        self.angles = array("H", angles)
+        self.lap_ms = lap_ms
+        self.sample_ms = sample_ms
+
+    def __len__(self):
+        return len(self.xs)
+
+    def pose_at(self, t_ms):
+        """(x, y, angle in degrees) at `t_ms` into the lap, or None if empty."""
+        n = len(self.xs)
+        if n == 0: return None
+        pos = max(0.0, t_ms / self.sample_ms)
+        i = int(pos)
+        if i >= n - 1:
+            i, f = n - 1, 0.0
+        else:
+            f = pos - i
+        j = min(i + 1, n - 1)
+        xs, ys, angles = self.xs, self.ys, self.angles
+        x = xs[i] + (xs[j] - xs[i]) * f
+        y = ys[i] + (ys[j] - ys[i]) * f
+        # Turn the short way round, e.g. 350 -> 10 degrees goes through 0
+        da = (angles[j] - angles[i] + 32768) % 65536 - 32768
+        return x, y, (angles[i] + da * f) / ANGLE_UNITS
+
+    def to_blob(self):
+        planes = array("H")
+        for channel in (self.xs, self.ys, self.angles):
+            prev = 0
+            for v in channel:
+                planes.append((v - prev) & 0xFFFF)
+                prev = v
+        if sys.byteorder == "big": planes.byteswap()
+        header = _HEADER.pack(BLOB_VERSION, self.sample_ms, self.lap_ms, len(self.xs))
+        return header + zlib.compress(planes.tobytes(), 9)
+
+    @classmethod
+    def from_blob(cls, blob):
+        version, sample_ms, lap_ms, n = _HEADER.unpack_from(blob)
+        if version != BLOB_VERSION:
+            raise ValueError(f"unknown ghost trace version {version}")
+        planes = array("H")
+        planes.frombytes(zlib.decompress(blob[_HEADER.size:]))
+        if sys.byteorder == "big": planes.byteswap()
+        if len(planes) != 3 * n:
+            raise ValueError("truncated ghost trace")
+        channels = []
+        for c in range(3):
+            out = array("H", bytes(2 * n))
+            acc = 0
+            for k in range(n):
+                acc = (acc + planes[c * n + k]) & 0xFFFF
+                out[k] = acc
+            channels.append(out)
+        return cls(*channels, lap_ms, sample_ms)
+
+
+class LapRecorder:
+    """Turns per-frame poses into samples at exact multiples of sample_ms."""
+
+    def __init__(self, sample_ms=SAMPLE_MS):
+        self.sample_ms = sample_ms
+        self.xs = []
+        self.ys = []
+        self.angles = []
+        self.prev = None # (t, x, y, angle) of the last frame
+
+    def add(self, t_ms, x, y, angle):
+        if self.prev is None:
+            self._sample(x, y, angle) # The lap's first frame is sample 0
+            self.prev = (t_ms, x, y, angle)
+            return
+        t0, x0, y0, a0 = self.prev
+        if t_ms <= t0: return
+        next_t = len(self.xs) * self.sample_ms
+        da = (angle - a0 + 180) % 360 - 180
+        while next_t <= t_ms:
+            f = (next_t - t0) / (t_ms - t0)
+            self._sample(x0 + (x - x0) * f, y0 + (y - y0) * f, a0 + da * f)
+            next_t += self.sample_ms
+        self.prev = (t_ms, x, y, angle)
+
+    def _sample(self, x, y, angle):
+        self.xs.append(min(65535, max(0, round(x))))
+        self.ys.append(min(65535, max(0, round(y))))
+        self.angles.append(round(angle * ANGLE_UNITS) % 65536)
+
+    def finish(self, lap_ms):
+        return LapTrace(self.xs, self.ys, self.angles, lap_ms, self.sample_ms)
+
+
+# --- STORAGE ---
+def save_lap(writer, track, car_type, driver, trace):
+    """Queue a lap on a race_db.ResultWriter and trim the driver to GHOST_KEEP laps."""
+    writer.execute("INSERT INTO ghost_laps (track, car_type, driver, lap_ms, trace) VALUES (?, ?, ?, ?, ?)",
+                   (track, car_type, driver, trace.lap_ms, trace.to_blob()))
+    writer.execute('''DELETE FROM ghost_laps WHERE track = ? AND car_type = ? AND driver = ? AND id NOT IN
+                      (SELECT id FROM ghost_laps WHERE track = ? AND car_type = ? AND driver = ?
+                       ORDER BY lap_ms LIMIT ?)''',
+                   (track, car_type, driver, track, car_type, driver, GHOST_KEEP))
+
+
+def load_best_laps(track, path=DB_FILE):
+    """{car_type: (driver, LapTrace)} of the fastest stored lap for each car on `track`."""
+    try:
+        conn = connect(path, readonly=True)
+        try:
+            # With min() sqlite takes the other columns from the row holding the minimum
+            rows = conn.execute("SELECT car_type, driver, trace, min(lap_ms) FROM ghost_laps "
+                                "WHERE track = ? GROUP BY car_type", (track,)).fetchall()
+        finally:
+            conn.close()
+        return {car: (driver, LapTrace.from_blob(trace)) for car, driver, trace, _ in rows}
+    except (sqlite3.Error, ValueError, zlib.error) as e:
+        # No database yet, or one written before ghosts existed
+        if "no such table" not in str(e) and "unable to open" not in str(e):
+            print(f"Could not load ghost: {e}")
+        return {}
+
+
+class BestLapLookup:
+    """load_best_laps() on a background thread, so the game's main thread never waits on sqlite.
+
+    Started when the track is known; best() is answered once done() is True.
+    """
+
+    def __init__(self, track, path=DB_FILE):
+        self.track = track
+        self._laps = None
+        self._thread = threading.Thread(target=self._run, args=(path,), name="ghost-lookup", daemon=True)
+        self._thread.start()
+
+    def _run(self, path):
+        self._laps = load_best_laps(self.track, path)
+
+    def done(self):
+        return self._laps is not None
+
+    def best(self, car_type):
+        """(driver, LapTrace) of the fastest stored lap for `car_type`, or None."""
+        return (self._laps or {}).get(car_type)
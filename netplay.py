@@ -0,0 +1,625 @@
+#!/usr/bin/env python3
+"""netplay.py — LAN races with a server-authoritative tick.
+
+The server runs the shared car physics at a fixed 60 Hz over UDP (asyncio).
+Clients send one input byte per tick (plus a few recent ones again, in case
+of loss) and get delta-compressed snapshots back 30 times a second. The
+client predicts its own car locally and, on every snapshot, rewinds to the
+server state and replays the inputs the server hasn't seen yet.
+
+Run:
+  python3 netplay.py server [--port 47800] [--track Classic] [--players 2] [--record replays]
+  python3 netplay.py bot HOST[:PORT] [--name Bot]
+  python3 netplay.py selftest [--bots 2] [--seconds 10] [--lag MS]
+
+Join from the game with:  python3 "racing game.py" --connect HOST[:PORT]
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import socket
+import struct
+import time
+
+from physics import (BRAKES, CHASSIS_STATS, COUNTDOWN_TICKS, ENGINES, TICK_RATE, TYRES, CarPhysics, Parts,
+                     decode_input, step_race)
+from replay import Replay
+from track_library import load_library, load_layout
+
+SNAPSHOT_EVERY = 2       # Ticks between snapshots (30 Hz)
+DEFAULT_PORT = 47800
+TOTAL_LAPS = 3
+MAX_PLAYERS = 4
+HISTORY = 64             # Snapshots kept on both ends as delta baselines
+INPUT_REDUNDANCY = 4     # Recent inputs repeated in every input packet
+INPUT_BUFFER = 6         # Queued inputs beyond this are skipped to cap latency
+TIMEOUT = 5.0            # Seconds of silence before a client is dropped
+REPORT_EVERY = 5.0
+
+PHASE_LOBBY, PHASE_COUNTDOWN, PHASE_RACE, PHASE_FINISHED = range(4)
+NO_WINNER = 255
+
+# --- WIRE FORMAT ---
+HELLO = struct.Struct("!c16s8sBBB")      # 'H' name, car type, engine, tyre, brake
+WELCOME = struct.Struct("!cB32sHB")      # 'W' player id, track name, tick rate, laps
+ROSTER_HEAD = struct.Struct("!cB")       # 'R' count
+ROSTER_ITEM = struct.Struct("!B16s8s")   # player id, name, car type
+INPUT_HEAD = struct.Struct("!cIdHB")     # 'I' acked snapshot tick, ping time, rtt ms, count
+INPUT_ITEM = struct.Struct("!IB")        # input seq, bits
+SNAP_HEAD = struct.Struct("!cIIIdfBIBB") # 'S' tick, baseline, last input seq, ping echo,
+                                         #     ping hold, phase, clock, winner, car count
+CAR_HEAD = struct.Struct("!BB")          # player id, changed-field mask
+BYE = b"B"
+
+# Snapshot fields, in wire order: bit -> packer
+F_POS, F_VEL, F_ANGLE, F_LAP = 1, 2, 4, 8
+FIELDS = [(F_POS, struct.Struct("!ff")), (F_VEL, struct.Struct("!ff")),
+          (F_ANGLE, struct.Struct("!f")), (F_LAP, struct.Struct("!BB"))]
+
+
+def pack_fields(state):
+    """CarPhysics.get_state() -> {field bit: packed bytes}."""
+    x, y, vx, vy, angle, laps, next_check = state
+    return {F_POS: FIELDS[0][1].pack(x, y), F_VEL: FIELDS[1][1].pack(vx, vy),
+            F_ANGLE: FIELDS[2][1].pack(angle), F_LAP: FIELDS[3][1].pack(laps, next_check)}
+
+
+def unpack_fields(fields):
+    x, y = FIELDS[0][1].unpack(fields[F_POS])
+    vx, vy = FIELDS[1][1].unpack(fields[F_VEL])
+    angle, = FIELDS[2][1].unpack(fields[F_ANGLE])
+    laps, next_check = FIELDS[3][1].unpack(fields[F_LAP])
+    return (x, y, vx, vy, angle, laps, next_check)
+
+
+def encode_cars(cars, baseline):
+    """Only the fields that differ from the baseline snapshot are sent."""
+    out = []
+    for pid, fields in cars.items():
+        base = baseline.get(pid) if baseline else None
+        mask = 0
+        body = b""
+        for bit, _ in FIELDS:
+            if base is None or base[bit] != fields[bit]:
+                mask |= bit
+                body += fields[bit]
+        if mask:
+            out.append(CAR_HEAD.pack(pid, mask) + body)
+    return out
+
+
+def decode_cars(data, offset, count, baseline):
+    cars = {pid: dict(f) for pid, f in baseline.items()} if baseline else {}
+    for _ in range(count):
+        pid, mask = CAR_HEAD.unpack_from(data, offset)
+        offset += CAR_HEAD.size
+        fields = cars.setdefault(pid, {})
+        for bit, packer in FIELDS:
+            if mask & bit:
+                fields[bit] = data[offset:offset + packer.size]
+                offset += packer.size
+    return cars
+
+
+def text(raw):
+    return raw.rstrip(b"\0").decode("utf-8", "replace")
+
+
+def parse_addr(addr):
+    host, _, port = addr.partition(":")
+    return host or "127.0.0.1", int(port) if port else DEFAULT_PORT
+
+
+class Traffic:
+    """Byte/packet counters with a rate since the last report."""
+
+    def __init__(self):
+        self.bytes_in = self.bytes_out = 0
+        self.packets_in = self.packets_out = 0
+        self._mark = (time.perf_counter(), 0, 0)
+
+    def rates(self):
+        now = time.perf_counter()
+        t0, bin0, bout0 = self._mark
+        dt = max(now - t0, 1e-6)
+        self._mark = (now, self.bytes_in, self.bytes_out)
+        return (self.bytes_in - bin0) / dt / 1024, (self.bytes_out - bout0) / dt / 1024
+
+
+# --- SERVER ---
+class _Player:
+    def __init__(self, pid, addr, name, car_type, parts):
+        self.pid = pid
+        self.addr = addr
+        self.name = name
+        self.car_type = car_type
+        self.parts = parts
+        self.car = None
+        self.inputs = {}       # seq -> bits not yet simulated
+        self.last_seq = 0      # Last input seq applied to the simulation
+        self.last_bits = 0
+        self.skipped = 0       # Inputs that never arrived and were skipped over
+        self.acked_tick = 0
+        self.ping = (0.0, 0.0) # (client time, server time received)
+        self.rtt_ms = 0
+        self.last_seen = time.perf_counter()
+        self.traffic = Traffic()
+
+
+class RaceServer(asyncio.DatagramProtocol):
+    def __init__(self, track_name=None, players=2, laps=TOTAL_LAPS, verbose=True, record_dir=None):
+        specs = load_library()
+        self.spec = specs[track_name] if track_name else next(iter(specs.values()))
+        self.track = load_layout(self.spec)
+        self.players_needed = players
+        self.laps = laps
+        self.verbose = verbose
+        self.players = {}      # addr -> _Player
+        self.phase = PHASE_LOBBY
+        self.tick_no = 0
+        self.clock = 0         # Ticks since the countdown started
+        self.winner = NO_WINNER
+        self.history = {}      # snapshot tick -> {pid: fields}
+        self.transport = None
+        self.running = True
+        self.record_dir = record_dir # Save a replay of every race here (see replay.py)
+        self.replay = None
+
+    # Network
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def send(self, player, data):
+        self.transport.sendto(data, player.addr)
+        player.traffic.bytes_out += len(data)
+        player.traffic.packets_out += 1
+
+    def datagram_received(self, data, addr):
+        kind = data[:1]
+        player = self.players.get(addr)
+        if player:
+            player.traffic.bytes_in += len(data)
+            player.traffic.packets_in += 1
+            player.last_seen = time.perf_counter()
+        try:
+            if kind == b"H":
+                self.on_hello(data, addr)
+            elif kind == b"I" and player:
+                self.on_input(player, data)
+            elif data == BYE and player:
+                self.drop(player, "left")
+        except struct.error:
+            pass # Truncated or junk packet: drop it
+
+    def on_hello(self, data, addr):
+        player = self.players.get(addr)
+        if not player:
+            if self.phase != PHASE_LOBBY or len(self.players) >= MAX_PLAYERS: return
+            _, name, car_type, eng, tyre, brk = HELLO.unpack(data)
+            car_type = text(car_type)
+            # CarPhysics indexes the stat tables with these when the countdown starts
+            if (car_type not in CHASSIS_STATS or not 0 <= eng < len(ENGINES)
+                    or not 0 <= tyre < len(TYRES) or not 0 <= brk < len(BRAKES)):
+                return
+            used = {p.pid for p in self.players.values()}
+            pid = min(set(range(MAX_PLAYERS)) - used)
+            player = _Player(pid, addr, text(name), car_type, Parts(eng, tyre, brk))
+            self.players[addr] = player
+            if self.verbose: print(f"{player.name} joined as player {pid + 1} from {addr[0]}:{addr[1]}")
+        # Re-sent on every HELLO so a lost WELCOME doesn't strand the client
+        self.send(player, WELCOME.pack(b"W", player.pid, self.spec.name.encode()[:32], TICK_RATE, self.laps))
+        self.send_roster()
+
+    def on_input(self, player, data):
+        _, acked, ping, rtt_ms, count = INPUT_HEAD.unpack_from(data)
+        player.acked_tick = max(player.acked_tick, acked)
+        player.ping = (ping, time.perf_counter())
+        player.rtt_ms = rtt_ms
+        offset = INPUT_HEAD.size
+        for _ in range(count):
+            seq, bits = INPUT_ITEM.unpack_from(data, offset)
+            offset += INPUT_ITEM.size
+            if seq > player.last_seq:
+                player.inputs[seq] = bits
+
+    def send_roster(self):
+        items = b"".join(ROSTER_ITEM.pack(p.pid, p.name.encode()[:16], p.car_type.encode()[:8])
+                         for p in self.players.values())
+        packet = ROSTER_HEAD.pack(b"R", len(self.players)) + items
+        for p in self.players.values():
+            self.send(p, packet)
+
+    def drop(self, player, why):
+        self.players.pop(player.addr, None)
+        if self.verbose: print(f"{player.name} {why}")
+        if self.replay and player.car:
+            # The replay can't follow a car leaving; keep what led up to it
+            self.save_replay({"ended": f"{player.name} {why}"})
+        self.send_roster()
+
+    # Simulation
+    def next_input(self, player):
+        seq = player.last_seq + 1
+        while len(player.inputs) > INPUT_BUFFER:
+            # Client is running ahead of our clock: drop the oldest
+            player.inputs.pop(min(player.inputs))
+            player.skipped += 1
+        if seq not in player.inputs and player.inputs:
+            # That one was lost; jump to the oldest input we do have
+            oldest = min(player.inputs)
+            player.skipped += oldest - seq
+            seq = oldest
+        if seq in player.inputs:
+            player.last_bits = player.inputs.pop(seq)
+            player.last_seq = seq
+        # Otherwise the client is behind: hold the last input for this tick
+        return player.last_bits
+
+    def start_countdown(self):
+        meta = self.track["meta"]
+        for p in self.players.values():
+            x, y = meta["spawns"][p.pid]
+            p.car = CarPhysics(x, y, meta["start_angle"], p.car_type, p.parts)
+        self.phase = PHASE_COUNTDOWN
+        self.clock = 0
+        if self.record_dir:
+            self.replay = Replay(self.spec.name, self.spec.digest(),
+                                 [(p.car_type, p.parts.key(), p.pid) for p in self.players.values()], self.laps)
+
+    def tick(self):
+        self.tick_no += 1
+        now = time.perf_counter()
+        for p in list(self.players.values()):
+            if now - p.last_seen > TIMEOUT: self.drop(p, "timed out")
+
+        if self.phase == PHASE_LOBBY:
+            if len(self.players) >= self.players_needed: self.start_countdown()
+        elif self.phase in (PHASE_COUNTDOWN, PHASE_RACE):
+            self.clock += 1
+            if self.phase == PHASE_COUNTDOWN and self.clock >= COUNTDOWN_TICKS:
+                self.phase = PHASE_RACE
+            if self.phase == PHASE_RACE:
+                self.simulate()
+        elif self.phase == PHASE_FINISHED and not self.players:
+            self.phase = PHASE_LOBBY # Everyone went home: open the lobby again
+            self.winner = NO_WINNER
+
+        if self.tick_no % SNAPSHOT_EVERY == 0: self.send_snapshots()
+        if self.tick_no % TICK_RATE == 0: self.send_roster()
+
+    def simulate(self):
+        collision, meta = self.track["collision"], self.track["meta"]
+        racers = [p for p in self.players.values() if p.car]
+        cars = [p.car for p in racers]
+        inputs = [self.next_input(p) for p in racers]
+        step_race(cars, inputs, collision, meta)
+        if self.replay: self.replay.record(inputs, cars)
+        for p in racers:
+            if p.car.laps > self.laps and self.winner == NO_WINNER:
+                self.winner = p.pid
+                self.phase = PHASE_FINISHED
+                if self.verbose:
+                    print(f"{p.name} wins in {(self.clock - COUNTDOWN_TICKS) / TICK_RATE:.2f}s")
+                if self.replay: self.save_replay({"winner": p.name, "car": p.car_type})
+
+    def save_replay(self, result):
+        replay, self.replay = self.replay, None
+        replay.result = result
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{self.spec.name}.rpl".replace(" ", "_")
+        path = os.path.join(self.record_dir, name)
+        try:
+            replay.save(path)
+            if self.verbose: print(f"Replay saved to {path}")
+        except OSError as e:
+            print(f"Could not save replay: {e}")
+
+    def send_snapshots(self):
+        cars = {p.pid: pack_fields(p.car.get_state()) for p in self.players.values() if p.car}
+        self.history[self.tick_no] = cars
+        self.history.pop(self.tick_no - HISTORY * SNAPSHOT_EVERY, None)
+        now = time.perf_counter()
+        for p in self.players.values():
+            baseline_tick = p.acked_tick if p.acked_tick in self.history else 0
+            body = encode_cars(cars, self.history.get(baseline_tick))
+            ping, received = p.ping
+            head = SNAP_HEAD.pack(b"S", self.tick_no, baseline_tick, p.last_seq, ping,
+                                  now - received if ping else 0.0, self.phase, self.clock,
+                                  self.winner, len(body))
+            self.send(p, head + b"".join(body))
+
+    def report(self):
+        for p in sorted(self.players.values(), key=lambda p: p.pid):
+            down, up = p.traffic.rates()
+            print(f"  P{p.pid + 1} {p.name:<12} rtt {p.rtt_ms:4d} ms | up {down:6.2f} kB/s "
+                  f"down {up:6.2f} kB/s | inputs skipped {p.skipped}")
+
+    async def serve(self, host="0.0.0.0", port=DEFAULT_PORT):
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(lambda: self, local_addr=(host, port))
+        if self.verbose: print(f"Serving {self.spec.name} on {host}:{port}, waiting for {self.players_needed} player(s)")
+        step = 1.0 / TICK_RATE
+        next_tick = time.perf_counter()
+        next_report = next_tick + REPORT_EVERY
+        try:
+            while self.running:
+                self.tick()
+                now = time.perf_counter()
+                if self.verbose and self.players and now >= next_report:
+                    print(f"tick {self.tick_no}:")
+                    self.report()
+                    next_report = now + REPORT_EVERY
+                next_tick += step
+                await asyncio.sleep(max(0.0, next_tick - time.perf_counter()))
+        finally:
+            transport.close()
+
+
+# --- CLIENT ---
+class NetClient:
+    """Non-blocking UDP client, polled once per frame by the game loop.
+
+    `car` is the locally predicted car (any CarPhysics); it is attached once
+    the track is loaded. Other players are exposed through remote_state().
+    """
+
+    def __init__(self, addr, name, car_type, parts, lag_ms=0):
+        self.addr = parse_addr(addr) if isinstance(addr, str) else addr
+        self.car_type = car_type
+        self.parts = parts
+        self.hello = HELLO.pack(b"H", name.encode()[:16], car_type.encode()[:8],
+                                *parts.key())
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.lag = lag_ms / 2000.0 # Artificial one-way delay for testing
+        self._outbox = []
+        self._inbox = []
+        self.traffic = Traffic()
+
+        self.pid = None
+        self.track_name = None
+        self.laps = TOTAL_LAPS
+        self.roster = {}       # pid -> (name, car type)
+        self.phase = PHASE_LOBBY
+        self.clock = 0
+        self.winner = NO_WINNER
+        self.car = None
+        self.collision = None
+        self.meta = None
+
+        self.snapshots = {}    # tick -> {pid: fields}
+        self.acked_tick = 0
+        self.seq = 0
+        self.pending = []      # (seq, bits) not yet confirmed by the server
+        self.remote = {}       # pid -> (previous state, latest state, arrival time)
+        self.rtt_ms = 0.0
+        self.corrections = 0
+        self.correction_px = 0.0
+        self._last_hello = 0.0
+
+    def attach(self, car, collision, meta):
+        self.car, self.collision, self.meta = car, collision, meta
+
+    def _send(self, data):
+        self.traffic.bytes_out += len(data)
+        self.traffic.packets_out += 1
+        if self.lag: self._outbox.append((time.perf_counter() + self.lag, data))
+        else: self.sock.sendto(data, self.addr)
+
+    def close(self):
+        try:
+            self.sock.sendto(BYE, self.addr)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def poll(self):
+        now = time.perf_counter()
+        if self.pid is None and now - self._last_hello > 0.5:
+            self._send(self.hello)
+            self._last_hello = now
+        while self._outbox and self._outbox[0][0] <= now:
+            self.sock.sendto(self._outbox.pop(0)[1], self.addr)
+        while True:
+            try:
+                data = self.sock.recv(2048)
+            except (BlockingIOError, ConnectionRefusedError):
+                break
+            self.traffic.bytes_in += len(data)
+            self.traffic.packets_in += 1
+            self._inbox.append((now + self.lag, data))
+        while self._inbox and self._inbox[0][0] <= now:
+            self._handle(self._inbox.pop(0)[1])
+
+    def _handle(self, data):
+        kind = data[:1]
+        if kind == b"W":
+            _, self.pid, track, _, self.laps = WELCOME.unpack(data)
+            self.track_name = text(track)
+        elif kind == b"R":
+            _, count = ROSTER_HEAD.unpack_from(data)
+            roster = {}
+            for i in range(count):
+                pid, name, car_type = ROSTER_ITEM.unpack_from(data, ROSTER_HEAD.size + i * ROSTER_ITEM.size)
+                roster[pid] = (text(name), text(car_type))
+            self.roster = roster
+        elif kind == b"S":
+            self._on_snapshot(data)
+
+    def _on_snapshot(self, data):
+        (_, tick, baseline, last_seq, ping, hold, phase,
+         clock, winner, count) = SNAP_HEAD.unpack_from(data)
+        if baseline and baseline not in self.snapshots: return # Can't rebuild it
+        if tick <= self.acked_tick: return # Late duplicate
+        cars = decode_cars(data, SNAP_HEAD.size, count, self.snapshots.get(baseline))
+        self.snapshots[tick] = cars
+        for old in [t for t in self.snapshots if t < tick - HISTORY * SNAPSHOT_EVERY]:
+            del self.snapshots[old]
+        self.acked_tick = tick
+        self.phase, self.clock, self.winner = phase, clock, winner
+        if ping:
+            sample = (time.perf_counter() - ping - hold) * 1000
+            self.rtt_ms = sample if not self.rtt_ms else self.rtt_ms * 0.9 + sample * 0.1
+
+        now = time.perf_counter()
+        for pid, fields in cars.items():
+            if len(fields) < len(FIELDS): continue
+            state = unpack_fields(fields)
+            if pid == self.pid:
+                self._reconcile(state, last_seq)
+            else:
+                prev = self.remote.get(pid)
+                self.remote[pid] = (prev[1] if prev else state, state, now)
+
+    def _reconcile(self, state, last_seq):
+        """Rewind to the server's state and replay inputs it hasn't applied yet."""
+        if not self.car: return
+        self.pending = [(s, b) for s, b in self.pending if s > last_seq]
+        before = (self.car.pos.x, self.car.pos.y)
+        self.car.set_state(state)
+        for _, bits in self.pending:
+            self.car.step(*decode_input(bits), self.collision, self.meta)
+        error = math.hypot(self.car.pos.x - before[0], self.car.pos.y - before[1])
+        if error > 0.5:
+            self.corrections += 1
+            self.correction_px += error
+
+    def tick(self, bits):
+        """Send this tick's input and predict the local car. Returns its sound events."""
+        events = []
+        items = b""
+        if self.phase == PHASE_RACE and self.car:
+            self.seq += 1
+            self.pending.append((self.seq, bits))
+            events = self.car.step(*decode_input(bits), self.collision, self.meta)
+            items = b"".join(INPUT_ITEM.pack(s, b) for s, b in self.pending[-INPUT_REDUNDANCY:])
+        if self.pid is not None:
+            head = INPUT_HEAD.pack(b"I", self.acked_tick, time.perf_counter(),
+                                   min(int(self.rtt_ms), 65535), len(items) // INPUT_ITEM.size)
+            self._send(head + items)
+        return events
+
+    def remote_state(self, pid):
+        """Other players, interpolated one snapshot behind for smooth motion."""
+        entry = self.remote.get(pid)
+        if not entry: return None
+        prev, latest, arrived = entry
+        t = min(1.0, (time.perf_counter() - arrived) * TICK_RATE / SNAPSHOT_EVERY)
+        lerp = lambda a, b: a + (b - a) * t
+        da = (latest[4] - prev[4] + 180) % 360 - 180
+        return (lerp(prev[0], latest[0]), lerp(prev[1], latest[1]), latest[2], latest[3],
+                prev[4] + da * t, latest[5], latest[6])
+
+    def report(self):
+        down, up = self.traffic.rates()
+        avg = self.correction_px / self.corrections if self.corrections else 0.0
+        return (f"rtt {self.rtt_ms:6.1f} ms | up {up:6.2f} kB/s down {down:6.2f} kB/s | "
+                f"corrections {self.corrections} (avg {avg:.1f} px)")
+
+
+# --- HEADLESS BOT ---
+class Bot:
+    """Drives a NetClient round the centreline, for tests and empty seats."""
+
+    def __init__(self, client):
+        self.client = client
+        self.track = None
+        self.progress = 0
+
+    def bits(self):
+        c = self.client
+        if c.track_name and not self.track:
+            self.track = load_layout(load_library()[c.track_name])
+            meta = self.track["meta"]
+            x, y = meta["spawns"][c.pid]
+            c.attach(CarPhysics(x, y, meta["start_angle"], c.car_type, c.parts),
+                     self.track["collision"], meta)
+        if not c.car: return 0
+        line = self.track["centreline"]
+        car = c.car
+        # Track progress along the centreline, then aim a little ahead
+        best = self.progress
+        best_d = float("inf")
+        for i in range(self.progress, self.progress + 40):
+            px, py = line[i % len(line)]
+            d = (px - car.pos.x) ** 2 + (py - car.pos.y) ** 2
+            if d < best_d: best, best_d = i, d
+        self.progress = best % len(line)
+        tx, ty = line[(self.progress + 12) % len(line)]
+        want = math.degrees(math.atan2(-(ty - car.pos.y), tx - car.pos.x))
+        diff = (want - car.angle + 180) % 360 - 180
+        bits = 1 # Throttle
+        if diff > 3: bits |= 4
+        elif diff < -3: bits |= 8
+        return bits
+
+
+async def run_bot(client, seconds=None):
+    bot = Bot(client)
+    step = 1.0 / TICK_RATE
+    end = time.perf_counter() + seconds if seconds else None
+    next_tick = time.perf_counter()
+    while end is None or time.perf_counter() < end:
+        client.poll()
+        client.tick(bot.bits())
+        if client.phase == PHASE_FINISHED and seconds is None: break
+        next_tick += step
+        await asyncio.sleep(max(0.0, next_tick - time.perf_counter()))
+
+
+async def selftest(bots, seconds, lag_ms, port):
+    server = RaceServer(players=bots, verbose=False)
+    serve = asyncio.create_task(server.serve("127.0.0.1", port))
+    await asyncio.sleep(0.1)
+    clients = [NetClient(("127.0.0.1", port), f"Bot{i + 1}", "F1",
+                         Parts(), lag_ms=lag_ms) for i in range(bots)]
+    await asyncio.gather(*(run_bot(c, seconds) for c in clients))
+    print(f"Selftest: {bots} bot(s), {seconds}s, {lag_ms} ms simulated round trip, track {server.spec.name}")
+    print("Server view:")
+    server.report()
+    print("Client view (whole-run averages):")
+    cars = {p.pid: p.car for p in server.players.values()}
+    for c in clients:
+        lap = cars[c.pid].laps if cars.get(c.pid) else 0
+        print(f"  {text(c.hello[1:17]):<12} {c.report()} | lap {lap}")
+        c.close()
+    server.running = False
+    await serve
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LAN races for the racing game")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_server = sub.add_parser("server", help="Run an authoritative race server")
+    p_server.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p_server.add_argument("--track", help="Track name from tracks/ (default: first)")
+    p_server.add_argument("--players", type=int, default=2, help="Players needed to start")
+    p_server.add_argument("--laps", type=int, default=TOTAL_LAPS)
+    p_server.add_argument("--record", metavar="DIR", help="Save a replay of every race into DIR")
+    p_bot = sub.add_parser("bot", help="Join a server with a self-driving car")
+    p_bot.add_argument("addr", help="HOST[:PORT]")
+    p_bot.add_argument("--name", default="Bot")
+    p_test = sub.add_parser("selftest", help="Server plus bots on localhost, then a traffic report")
+    p_test.add_argument("--bots", type=int, default=2)
+    p_test.add_argument("--seconds", type=float, default=10)
+    p_test.add_argument("--lag", type=int, default=0, help="Simulated round trip in ms")
+    p_test.add_argument("--port", type=int, default=DEFAULT_PORT + 1)
+    args = parser.parse_args()
+
+    try:
+        if args.cmd == "server":
+            asyncio.run(RaceServer(args.track, args.players, args.laps, record_dir=args.record).serve(port=args.port))
+        elif args.cmd == "bot":
+            client = NetClient(args.addr, args.name, "F1", Parts())
+            asyncio.run(run_bot(client))
+            print(client.report())
+            client.close()
+        else:
+            asyncio.run(selftest(args.bots, args.seconds, args.lag, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
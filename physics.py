@@ -0,0 +1,276 @@
+"""physics.py — Car stats and the per-tick driving model.
+
+Kept free of input, audio and drawing so the same code runs in the game,
+on a headless LAN server (netplay.py) and in client-side prediction.
+
+The model is deterministic: a race is a function of the track, the cars
+and one input byte per car per tick. Nothing here reads the clock or draws
+random numbers, and every tick goes through step_race() in the same order,
+so the same inputs give bit-identical doubles on the same platform.
+state_hash() fingerprints a car after each tick; replay.py records and
+re-checks them.
+"""
+
+import math
+import struct
+import zlib
+from functools import lru_cache
+
+import pygame
+
+TICK_RATE = 60                 # Steps per second the model is tuned for
+COUNTDOWN_TICKS = 4 * TICK_RATE # Start lights, before anyone may move
+
+
+# --- RECORDS ---
+class Chassis:
+    __slots__ = ("name", "base_spd", "accel", "turn", "base_grip", "mass", "sfx")
+
+    def __init__(self, name, base_spd, accel, turn, base_grip, mass, sfx):
+        self.name = name
+        self.base_spd = base_spd
+        self.accel = accel
+        self.turn = turn
+        self.base_grip = base_grip
+        self.mass = mass
+        self.sfx = sfx
+
+
+class Engine:
+    __slots__ = ("name", "spd_mult", "acc_mult")
+
+    def __init__(self, name, spd_mult, acc_mult):
+        self.name = name
+        self.spd_mult = spd_mult
+        self.acc_mult = acc_mult
+
+
+class Tyre:
+    __slots__ = ("name", "grip_mult", "turn_mult")
+
+    def __init__(self, name, grip_mult, turn_mult):
+        self.name = name
+        self.grip_mult = grip_mult
+        self.turn_mult = turn_mult
+
+
+class Brake:
+    __slots__ = ("name", "power")
+
+    def __init__(self, name, power):
+        self.name = name
+        self.power = power
+
+
+class Parts:
+    """A player's part choices, as indices into ENGINES, TYRES and BRAKES."""
+    __slots__ = ("eng", "tyre", "brk")
+
+    def __init__(self, eng=0, tyre=1, brk=0):
+        self.eng = eng
+        self.tyre = tyre
+        self.brk = brk
+
+    def key(self):
+        return (self.eng, self.tyre, self.brk)
+
+
+class CarSetup:
+    """A chassis with its parts fitted and the numbers the physics reads every tick.
+
+    Built once per distinct choice by car_setup() and shared by every car that
+    uses it, so treat it as read-only.
+    """
+    __slots__ = ("car_type", "chassis", "engine", "tyre", "brake",
+                 "max_speed", "accel", "grip", "turn_rate", "brake_power", "mass", "sfx")
+
+    def __init__(self, car_type, eng, tyre, brk):
+        stats = CHASSIS_STATS[car_type]
+        self.car_type = car_type
+        self.chassis = stats
+        self.engine = ENGINES[eng]
+        self.tyre = TYRES[tyre]
+        self.brake = BRAKES[brk]
+        self.max_speed = stats.base_spd * self.engine.spd_mult
+        self.accel = stats.accel * self.engine.acc_mult
+        self.grip = stats.base_grip * self.tyre.grip_mult
+        self.turn_rate = stats.turn * self.tyre.turn_mult
+        self.brake_power = self.brake.power
+        self.mass = stats.mass
+        self.sfx = stats.sfx
+
+
+@lru_cache(maxsize=None)
+def car_setup(car_type, eng, tyre, brk):
+    return CarSetup(car_type, eng, tyre, brk)
+
+
+# --- STATS & AUDIO MAPPING ---
+CHASSIS_STATS = {
+    "F1":       Chassis("F1",      19.5, 0.6,  0.8, 0.99, 800,  "eng_v10"),
+    "SUPER":    Chassis("SUPER",   20.0, 0.55, 2.0, 0.96, 1400, "eng_w16"),
+    "NASCAR":   Chassis("NASCAR",  18.5, 0.50, 1.8, 0.97, 1800, "eng_v8"),
+    "LE_MANS":  Chassis("LE_MANS", 16.0, 0.45, 1.9, 0.98, 1000, "eng_v6"),
+    "DRIFT":    Chassis("DRIFT",   15.0, 0.7,  2.5, 0.90, 1200, "eng_v6"),
+}
+
+ENGINES = [
+    Engine("V6 Turbo", 1.0, 1.0),
+    Engine("V8 Super", 1.1, 1.1),
+    Engine("V10 Race", 1.2, 1.2),
+    Engine("W16 Quad", 1.3, 1.3),
+]
+
+TYRES = [
+    Tyre("Street",       1.0,  1.0),
+    Tyre("Semi-Slick",   1.1,  1.0),
+    Tyre("Racing Slick", 1.2,  1.0),
+    Tyre("Drift Comp",   0.85, 1.2),
+]
+
+BRAKES = [
+    Brake("Steel",   0.05),
+    Brake("Ceramic", 0.08),
+    Brake("Carbon",  0.12),
+]
+
+# --- INPUT BITS (one byte per tick on the wire) ---
+IN_THROTTLE = 1
+IN_BRAKE = 2
+IN_LEFT = 4
+IN_RIGHT = 8
+
+
+def encode_input(turning, throttle, brake):
+    bits = 0
+    if throttle > 0: bits |= IN_THROTTLE
+    if brake: bits |= IN_BRAKE
+    if turning > 0: bits |= IN_LEFT
+    if turning < 0: bits |= IN_RIGHT
+    return bits
+
+
+def decode_input(bits):
+    """Inverse of encode_input -> (turning, throttle, brake)."""
+    turning = 1 if bits & IN_LEFT else (-1 if bits & IN_RIGHT else 0)
+    return turning, (1 if bits & IN_THROTTLE else 0), bool(bits & IN_BRAKE)
+
+
+class CarPhysics:
+    __slots__ = ("pos", "vel", "angle", "type", "setup", "laps", "next_check",
+                 "checkpoint_passed", "finished")
+
+    def __init__(self, x, y, angle, car_type, parts):
+        self.pos = pygame.math.Vector2(x, y)
+        self.vel = pygame.math.Vector2(0, 0)
+        self.angle = angle
+        self.type = car_type
+        self.setup = car_setup(car_type, *parts.key())
+
+        self.laps = 1
+        self.next_check = 0
+        self.checkpoint_passed = False
+        self.finished = False
+
+    def step(self, turning, throttle, brake, collision, meta_data):
+        """Advance one tick. Returns the names of sound events it triggered."""
+        events = []
+        if self.finished:
+            self.vel *= 0.95
+            self.pos += self.vel
+            return events
+
+        setup = self.setup
+        rad = math.radians(self.angle)
+        forward = pygame.math.Vector2(math.cos(rad), -math.sin(rad))
+        right = pygame.math.Vector2(-math.sin(rad), -math.cos(rad))
+
+        if throttle > 0:
+            self.vel += forward * setup.accel * throttle
+
+        if brake:
+            if self.vel.dot(forward) > 0.5:
+                self.vel -= self.vel * setup.brake_power
+            else:
+                self.vel -= forward * (setup.accel * 0.5)
+
+        if throttle == 0 and not brake:
+            self.vel *= 0.99
+
+        if self.vel.length() > 0.5:
+            d = 1 if self.vel.dot(forward) > -0.1 else -1
+            self.angle += turning * setup.turn_rate * (self.vel.length() / (setup.max_speed * 0.8)) * d
+
+        vel_forward = self.vel.dot(forward)
+        vel_lateral = self.vel.dot(right)
+        vel_lateral *= (1.0 - setup.grip)
+        if abs(vel_lateral) > 2.0:
+            events.append("drift")
+        self.vel = (forward * vel_forward) + (right * vel_lateral)
+
+        if self.vel.length() > setup.max_speed:
+            self.vel.scale_to_length(setup.max_speed)
+
+        next_pos = self.pos + self.vel
+        if collision.is_wall(next_pos.x, next_pos.y):
+            self.vel *= -0.5
+            events.append("crash")
+
+        self.pos += self.vel
+
+        car_rect = pygame.Rect(self.pos.x, self.pos.y, 40, 40)
+        # Checkpoints must be crossed in order before the start line counts
+        checks = meta_data["check_rects"]
+        if self.next_check < len(checks) and car_rect.colliderect(checks[self.next_check]):
+            self.next_check += 1
+        self.checkpoint_passed = self.next_check == len(checks)
+        if car_rect.colliderect(meta_data["start_rect"]) and self.checkpoint_passed:
+            self.laps += 1
+            self.next_check = 0
+            self.checkpoint_passed = False
+        return events
+
+    def get_state(self):
+        return (self.pos.x, self.pos.y, self.vel.x, self.vel.y, self.angle, self.laps, self.next_check)
+
+    def set_state(self, state):
+        self.pos.update(state[0], state[1])
+        self.vel.update(state[2], state[3])
+        self.angle = state[4]
+        self.laps = state[5]
+        self.next_check = state[6]
+
+
+def step_race(cars, inputs, collision, meta_data):
+    """Advance every car one tick on its input byte, then resolve contacts.
+
+    The one place a race tick happens, for the game, the server and replay
+    checks alike. Returns (sound events per car, whether any cars touched).
+    """
+    events = [car.step(*decode_input(bits), collision, meta_data) for car, bits in zip(cars, inputs)]
+    touched = False
+    for i, car in enumerate(cars):
+        for other in cars[i+1:]:
+            touched = resolve_contact(car, other) or touched
+    return events, touched
+
+
+_STATE = struct.Struct("<5dII")
+
+def state_hash(car):
+    """CRC32 of a car's exact position, velocity, heading and lap progress."""
+    return zlib.crc32(_STATE.pack(*car.get_state()))
+
+
+def resolve_contact(car1, car2):
+    """Push two touching cars apart by mass. Returns True if they collided."""
+    if car1.pos.distance_to(car2.pos) < 45:
+        col_vec = (car1.pos - car2.pos).normalize()
+        force = 10.0
+        m1, m2 = car1.setup.mass, car2.setup.mass
+        total = m1 + m2
+        car1.vel += col_vec * (force * (m2/total))
+        car2.vel -= col_vec * (force * (m1/total))
+        car1.pos += col_vec * 5
+        return True
+    return False
@@ -0,0 +1,107 @@
+"""quality.py — Render detail levels and the controller that picks one.
+
+The race renders at whatever detail the machine can hold at the target frame
+rate. QualityController watches frame times and steps one level at a time:
+
+- down when the median frame of a window is over budget
+- up only when the median frame's own work (the time before the frame
+  limiter waits) leaves plenty of room, for several windows in a row
+
+An upgrade that has to be taken back straight away makes the next one wait
+twice as long, so a machine sitting on the edge of two levels settles on the
+lower one instead of flipping between them.
+
+Levels only change what the renderer draws (trees, sprite sizes, panels);
+the simulation runs on fixed ticks and is the same at every level.
+"""
+
+from collections import deque
+
+FRAME_WINDOW = 30     # Frames per decision
+SLOW_OVER = 1.10      # Median frame above budget * this: drop a level
+FAST_UNDER = 0.60     # Median work below budget * this...
+FAST_WINDOWS = 3      # ...for this many windows in a row: raise a level
+MAX_FAST_WINDOWS = 48 # Longest wait for an upgrade after repeated bounces
+
+
+class QualityLevel:
+    __slots__ = ("name", "tree_density", "tree_range", "tree_scale", "glass")
+
+    def __init__(self, name, tree_density, tree_range, tree_scale, glass):
+        self.name = name
+        self.tree_density = tree_density # Fraction of trees drawn (a fixed subset)
+        self.tree_range = tree_range     # Trees further than this x half the view diagonal are skipped
+        self.tree_scale = tree_scale     # Tree sprite size, 1.0 = full
+        self.glass = glass               # Translucent HUD panels, or solid ones
+
+
+# Best first
+QUALITY_LEVELS = [
+    QualityLevel("ULTRA",   1.0,  1.2, 1.0,  True),
+    QualityLevel("HIGH",    1.0,  1.0, 0.75, True),
+    QualityLevel("MEDIUM",  0.6,  0.9, 0.75, False),
+    QualityLevel("LOW",     0.3,  0.8, 0.5,  False),
+    QualityLevel("MINIMAL", 0.0,  0.0, 0.5,  False),
+]
+
+
+def level_index(name):
+    """Index of the level called `name` (any case); ValueError if there's none."""
+    for i, level in enumerate(QUALITY_LEVELS):
+        if level.name == name.upper(): return i
+    raise ValueError(f"unknown quality level {name!r}")
+
+
+def keeps_tree(x, y, density):
+    """Whether the tree at (x, y) is in the `density` subset; the same trees every frame."""
+    if density >= 1.0: return True
+    return ((x * 73856093) ^ (y * 19349663)) & 1023 < density * 1024
+
+
+class QualityController:
+    """Picks a level from frame times; `lock` (a level index) pins it instead."""
+
+    def __init__(self, target_fps, lock=None):
+        self.budget = 1000 / target_fps
+        self.locked = lock is not None
+        self.index = lock if self.locked else 0
+        self.frames = deque(maxlen=FRAME_WINDOW) # (frame ms, work ms)
+        self.fast_windows = 0
+        self.patience = FAST_WINDOWS
+        self.just_raised = False
+
+    @property
+    def level(self):
+        return QUALITY_LEVELS[self.index]
+
+    def reset(self):
+        """Forget the frames so far, e.g. after loading, which says nothing about drawing."""
+        self.frames.clear()
+        self.fast_windows = 0
+
+    def frame(self, frame_ms, work_ms):
+        """Feed one frame: clock.tick()'s result and clock.get_rawtime(). True if the level changed."""
+        if self.locked: return False
+        self.frames.append((frame_ms, work_ms))
+        if len(self.frames) < FRAME_WINDOW: return False
+        frame = sorted(f for f, _ in self.frames)[FRAME_WINDOW // 2]
+        work = sorted(w for _, w in self.frames)[FRAME_WINDOW // 2]
+        self.frames.clear()
+
+        if frame > self.budget * SLOW_OVER and self.index < len(QUALITY_LEVELS) - 1:
+            if self.just_raised: self.patience = min(MAX_FAST_WINDOWS, self.patience * 2)
+            self.index += 1
+            self.fast_windows = 0
+            self.just_raised = False
+            return True
+        self.just_raised = False
+        if work < self.budget * FAST_UNDER and self.index > 0:
+            self.fast_windows += 1
+            if self.fast_windows >= self.patience:
+                self.index -= 1
+                self.fast_windows = 0
+                self.just_raised = True
+                return True
+        else:
+            self.fast_windows = 0
+        return False
@@ -0,0 +1,190 @@
+"""race_db.py — SQLite access shared by the game and show_race_data.py.
+
+The database runs in WAL mode, so readers (show_race_data.py, another game
+on the same machine) never block the writer and the writer never blocks
+them. The game does no sqlite work on its main thread: ResultWriter owns a
+connection on a worker thread, commits whatever has been queued in one
+transaction and retries while another process holds the write lock.
+"""
+
+import queue
+import sqlite3
+import threading
+import time
+from urllib.parse import quote
+
+DB_FILE = "racing_data.db"
+BUSY_TIMEOUT_MS = 2000 # How long sqlite itself waits on a lock before raising
+WRITE_RETRIES = 5      # Extra attempts after that, with backoff
+
+
+def lap_ms_sql(col):
+    """SQL turning a "MM:SS:CC" lap_time column into milliseconds."""
+    # Minutes can run past two digits, so cut from the right
+    return (f"(CAST(substr({col}, 1, length({col}) - 6) AS INTEGER) * 60000"
+            f" + CAST(substr({col}, -5, 2) AS INTEGER) * 1000"
+            f" + CAST(substr({col}, -2) AS INTEGER) * 10)")
+
+
+# Keep the running best when either side is NULL (min() would return NULL)
+_BEST = "min(ifnull(best_ms, excluded.best_ms), ifnull(excluded.best_ms, best_ms))"
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS race_results
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        winner_name TEXT, car_type TEXT, lap_time TEXT,
+        date TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''',
+    # Natural key of a result: imports dedup on it and, led by date, it also
+    # serves the "most recent N" listing
+    '''CREATE INDEX IF NOT EXISTS race_results_natural
+       ON race_results (date, winner_name, car_type, lap_time)''',
+    # --- SUMMARIES (kept current by the trigger below) ---
+    "CREATE TABLE IF NOT EXISTS car_wins (car_type TEXT PRIMARY KEY, wins INTEGER NOT NULL)",
+    '''CREATE TABLE IF NOT EXISTS driver_stats
+       (winner_name TEXT PRIMARY KEY, wins INTEGER NOT NULL, total_ms INTEGER NOT NULL, best_ms INTEGER)''',
+    '''CREATE TABLE IF NOT EXISTS daily_stats
+       (day TEXT PRIMARY KEY, races INTEGER NOT NULL, total_ms INTEGER NOT NULL, best_ms INTEGER)''',
+    f'''CREATE TRIGGER IF NOT EXISTS race_results_summarize AFTER INSERT ON race_results
+        BEGIN
+            INSERT INTO car_wins VALUES (ifnull(NEW.car_type, '?'), 1)
+                ON CONFLICT (car_type) DO UPDATE SET wins = wins + 1;
+            INSERT INTO driver_stats VALUES (ifnull(NEW.winner_name, '?'), 1,
+                                             ifnull({lap_ms_sql("NEW.lap_time")}, 0), {lap_ms_sql("NEW.lap_time")})
+                ON CONFLICT (winner_name) DO UPDATE SET
+                    wins = wins + 1, total_ms = total_ms + excluded.total_ms, best_ms = {_BEST};
+            INSERT INTO daily_stats VALUES (ifnull(substr(NEW.date, 1, 10), '?'), 1,
+                                            ifnull({lap_ms_sql("NEW.lap_time")}, 0), {lap_ms_sql("NEW.lap_time")})
+                ON CONFLICT (day) DO UPDATE SET
+                    races = races + 1, total_ms = total_ms + excluded.total_ms, best_ms = {_BEST};
+        END''',
+    # --- GHOSTS (see ghost.py) ---
+    '''CREATE TABLE IF NOT EXISTS ghost_laps
+       (id INTEGER PRIMARY KEY AUTOINCREMENT, track TEXT, car_type TEXT, driver TEXT,
+        lap_ms INTEGER, trace BLOB, date TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''',
+    "CREATE INDEX IF NOT EXISTS ghost_laps_best ON ghost_laps (track, car_type, lap_ms)",
+    "CREATE INDEX IF NOT EXISTS ghost_laps_driver ON ghost_laps (track, car_type, driver, lap_ms)",
+]
+
+
+def connect(path=DB_FILE, readonly=False):
+    """Open the results DB with the pragmas every connection should use."""
+    if readonly:
+        conn = sqlite3.connect(f"file:{quote(path)}?mode=ro", uri=True, timeout=BUSY_TIMEOUT_MS / 1000)
+    else:
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000)
+        conn.execute("PRAGMA journal_mode=WAL")
+    # In WAL mode NORMAL only syncs at checkpoints: a crash of the game can't
+    # lose committed results, a power cut can lose the last few
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return conn
+
+
+def ensure_schema(conn):
+    """Create anything missing; summaries are backfilled the first time."""
+    fresh = not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='driver_stats'").fetchone()
+    with conn:
+        for sql in SCHEMA:
+            conn.execute(sql)
+    if fresh:
+        rebuild_summaries(conn)
+
+
+def rebuild_summaries(conn):
+    """Recompute the summary tables with one scan of race_results."""
+    ms = lap_ms_sql("lap_time")
+    with conn:
+        for table in ("car_wins", "driver_stats", "daily_stats"):
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute("INSERT INTO car_wins SELECT ifnull(car_type, '?'), count(*) FROM race_results GROUP BY 1")
+        conn.execute(f'''INSERT INTO driver_stats
+                         SELECT ifnull(winner_name, '?'), count(*), ifnull(sum(ms), 0), min(ms)
+                         FROM (SELECT winner_name, {ms} AS ms FROM race_results) GROUP BY 1''')
+        conn.execute(f'''INSERT INTO daily_stats
+                         SELECT ifnull(substr(date, 1, 10), '?'), count(*), ifnull(sum(ms), 0), min(ms)
+                         FROM (SELECT date, {ms} AS ms FROM race_results) GROUP BY 1''')
+
+
+def is_locked(error):
+    msg = str(error).lower()
+    return "locked" in msg or "busy" in msg
+
+
+class ResultWriter:
+    """Queue of writes drained by one background thread.
+
+    save_result() and execute() never block. The thread, and with it the
+    database, is only opened by the first write, so a session that saves
+    nothing never touches the disk. close() flushes what is queued and
+    waits for the thread, so call it before the process exits.
+    """
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self.written = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        if self._thread: return
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def save_result(self, name, car, time_str):
+        self.execute("INSERT INTO race_results (winner_name, car_type, lap_time) VALUES (?, ?, ?)",
+                     (name, car, time_str))
+
+    def execute(self, sql, params=()):
+        if not self._thread: self.start()
+        self._queue.put((sql, params))
+
+    def close(self, timeout=5.0):
+        if not self._thread: return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print(f"Database writer still busy after {timeout}s; {self._queue.qsize()} write(s) may be lost")
+        self._thread = None
+
+    # --- WORKER THREAD ---
+    def _run(self):
+        try:
+            conn = connect(self.path)
+            ensure_schema(conn)
+        except sqlite3.Error as e:
+            print(f"Results will not be saved: {e}")
+            conn = None
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            try:
+                while True: batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if None in batch:
+                running = False
+                batch = [w for w in batch if w is not None]
+            if batch and conn:
+                self._commit(conn, batch)
+            elif batch:
+                self.failed += len(batch)
+        if conn: conn.close()
+
+    def _commit(self, conn, batch):
+        for attempt in range(WRITE_RETRIES + 1):
+            try:
+                with conn: # One transaction; rolled back if anything fails
+                    for sql, params in batch:
+                        conn.execute(sql, params)
+                self.written += len(batch)
+                return
+            except sqlite3.OperationalError as e:
+                error = e
+                if not is_locked(e): break
+                time.sleep(0.05 * 2 ** attempt)
+            except sqlite3.Error as e:
+                error = e
+                break
+        self.failed += len(batch)
+        print(f"Could not save {len(batch)} result(s): {error}")
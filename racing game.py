@@ -1,9 +1,23 @@
+import time
+STARTUP_MARKS = [("start", time.perf_counter())] # See --profile-startup
 import pygame
-import math
+STARTUP_MARKS.append(("import pygame", time.perf_counter()))
 import sys
 import os
-import random
-import sqlite3
+import argparse
+
+from audio_engine import AudioEngine
+from ghost import BestLapLookup, LapRecorder, save_lap
+from physics import (CHASSIS_STATS, ENGINES, TYRES, BRAKES, COUNTDOWN_TICKS, TICK_RATE, CarPhysics, Parts,
+                     decode_input, encode_input, step_race)
+from quality import QUALITY_LEVELS, QualityController, keeps_tree, level_index
+from race_db import ResultWriter
+from replay import LAST_RACE, Replay
+from scenery import SCALE_MAX
+import surfaces
+from track_library import TrackLoader
+# netplay is imported when a LAN race is joined
+STARTUP_MARKS.append(("import game modules", time.perf_counter()))
 
 # --- PATH FIX ---
 if getattr(sys, 'frozen', False):
@@ -17,6 +31,14 @@ SCREEN_WIDTH = 1366
 SCREEN_HEIGHT = 720
 FPS = 60
 TOTAL_LAPS = 3
+MINIMAP_SIZE = 250
+MINIMAP_TRAILS = True   # Fading dots behind each car on the minimap
+MINIMAP_SECTORS = True  # Colour the minimap track by checkpoint sector
+MAX_LOCAL_PLAYERS = 4   # Split-screen views on one machine
+GHOST_ALPHA = 110       # Opacity of the time trial ghost (0-255)
+MAX_CATCHUP = 5         # Race ticks one frame may run; a longer stall is skipped
+QUALITY_LOCK = None     # Render at this quality level (e.g. "HIGH", see quality.py); None adapts to the machine
+DEBUG_OVERLAY = False   # FPS and quality level in the corner; F3 toggles it
 
 # COLORS
 WHITE = (255, 255, 255)
@@ -33,68 +55,65 @@ NEON_CYAN = (0, 255, 255)
 NEON_ORANGE = (255, 140, 0) 
 NEON_TEAL = (0, 200, 200)
 GLASS_BG = (20, 20, 30, 230)
+GLASS_SOLID = (20, 20, 30, 255) # Panels at quality levels without translucency
+KEY_COLOR = (255, 0, 255) # See-through colour of hard-edged sprites
+PLAYER_COLORS = [NEON_ORANGE, NEON_TEAL, YELLOW, BLUE]
+DEFAULT_CARS = ["F1", "DRIFT", "SUPER", "NASCAR"]
+CAR_FILES = {
+    "F1": "f1.png", "LE_MANS": "lemans.png",
+    "NASCAR": "nascar.png", "SUPER": "super.png", "DRIFT": "drift.png"
+}
+
+# --- STARTUP PROFILE ---
+# Audio, the results DB, car images and the track are all set up on first
+# use, so the menu only waits for pygame, a window and three fonts
+PROFILE_STARTUP = False # Set by --profile-startup
+
+def startup_mark(label):
+    STARTUP_MARKS.append((label, time.perf_counter()))
+
+def report_startup():
+    """Print the time between marks once, when the first menu frame is up."""
+    if not STARTUP_MARKS: return
+    startup_mark("first menu frame")
+    if PROFILE_STARTUP:
+        print("Startup (ms):")
+        for (_, t0), (label, t1) in zip(STARTUP_MARKS, STARTUP_MARKS[1:]):
+            print(f"  {label:<22}{1000 * (t1 - t0):8.1f}")
+        print(f"  {'menu interactive':<22}{1000 * (STARTUP_MARKS[-1][1] - STARTUP_MARKS[0][1]):8.1f}")
+    STARTUP_MARKS.clear()
+
+def report_deferred(label, started):
+    if PROFILE_STARTUP: print(f"  deferred: {label:<12}{1000 * (time.perf_counter() - started):8.1f} ms")
 
 # --- GLOBAL HELPER FUNCTIONS ---
-def draw_glass_panel(screen, x, y, w, h, color):
-    s = pygame.Surface((w, h), pygame.SRCALPHA)
-    s.fill(GLASS_BG)
-    screen.blit(s, (x, y))
+_panel_cache = {} # (w, h, rgba) -> filled panel, shared by every view and screen
+
+def panel_surface(w, h, rgba):
+    s = _panel_cache.get((w, h, rgba))
+    if s is None:
+        s = surfaces.translucent((w, h)) if rgba[3] < 255 else surfaces.opaque((w, h))
+        s.fill(rgba)
+        surfaces.check(s, "panel")
+        _panel_cache[(w, h, rgba)] = s
+    return s
+
+def draw_glass_panel(screen, x, y, w, h, color, glass=True):
+    screen.blit(panel_surface(w, h, GLASS_BG if glass else GLASS_SOLID), (x, y))
     pygame.draw.rect(screen, color, (x, y, w, h), 2)
 
+def format_time(ms):
+    if ms is None: return "--:--:--"
+    return f"{ms // 60000:02}:{(ms // 1000) % 60:02}:{(ms % 1000) // 10:02}"
+
 def draw_text(screen, text, font, color, x, y, center=False):
     surf = font.render(text, True, color)
+    surfaces.check(surf, "text", dynamic=True)
     rect = surf.get_rect()
     if center: rect.center = (x, y)
     else: rect.topleft = (x, y)
     screen.blit(surf, rect)
 
-# --- STATS & AUDIO MAPPING ---
-CHASSIS_STATS = {
-    "F1":       {"base_spd": 19.5, "accel": 0.6, "turn": 0.8, "base_grip": 0.99, "mass": 800,  "sfx": "eng_v10"},
-    "SUPER":    {"base_spd": 20.0, "accel": 0.55, "turn": 2.0, "base_grip": 0.96, "mass": 1400, "sfx": "eng_w16"},
-    "NASCAR":   {"base_spd": 18.5, "accel": 0.50, "turn": 1.8, "base_grip": 0.97, "mass": 1800, "sfx": "eng_v8"},
-    "LE_MANS":  {"base_spd": 16.0, "accel": 0.45, "turn": 1.9, "base_grip": 0.98, "mass": 1000, "sfx": "eng_v6"},
-    "DRIFT":    {"base_spd": 15.0, "accel": 0.7, "turn": 2.5, "base_grip": 0.90, "mass": 1200, "sfx": "eng_v6"},
-}
-
-ENGINES = [
-    {"name": "V6 Turbo",   "spd_mult": 1.0, "acc_mult": 1.0},
-    {"name": "V8 Super",   "spd_mult": 1.1, "acc_mult": 1.1},
-    {"name": "V10 Race",   "spd_mult": 1.2, "acc_mult": 1.2},
-    {"name": "W16 Quad",   "spd_mult": 1.3, "acc_mult": 1.3}
-]
-
-TYRES = [
-    {"name": "Street",     "grip_mult": 1.0,  "turn_mult": 1.0},
-    {"name": "Semi-Slick", "grip_mult": 1.1,  "turn_mult": 1.0},
-    {"name": "Racing Slick", "grip_mult": 1.2, "turn_mult": 1.0},
-    {"name": "Drift Comp", "grip_mult": 0.85, "turn_mult": 1.2} 
-]
-
-BRAKES = [
-    {"name": "Steel",      "power": 0.05},
-    {"name": "Ceramic",    "power": 0.08},
-    {"name": "Carbon",     "power": 0.12}
-]
-
-# --- DATABASE ---
-class DatabaseManager:
-    def __init__(self):
-        self.conn = sqlite3.connect('racing_data.db')
-        self.create_table()
-    def create_table(self):
-        c = self.conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS race_results
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                      winner_name TEXT, car_type TEXT, lap_time TEXT, 
-                      date TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-        self.conn.commit()
-    def save_result(self, name, car, time_str):
-        c = self.conn.cursor()
-        c.execute("INSERT INTO race_results (winner_name, car_type, lap_time) VALUES (?, ?, ?)", 
-                  (name, car, time_str))
-        self.conn.commit()
-
 # --- ASSETS ---
 class AssetManager:
     def __init__(self, screen):
@@ -102,42 +121,74 @@ class AssetManager:
         self.font_header = pygame.font.SysFont("Impact", 60)
         self.font_ui = pygame.font.SysFont("Arial", 20)
         self.font_big = pygame.font.SysFont("Arial", 30, bold=True)
-        self.sounds = SoundManager()
-        self.car_sprites = {}
+        startup_mark("fonts")
+        self.sounds = AudioEngine() # Started on the way into setup
+        self.car_sprites = {} # Filled per car type on first use
         self.car_previews = {}
-        self.scenery_objects = [] 
-        
-        self.screen.fill(BLACK)
-        txt = self.font_header.render("INITIALIZING...", True, NEON_ORANGE)
-        self.screen.blit(txt, (SCREEN_WIDTH//2 - txt.get_width()//2, SCREEN_HEIGHT//2))
-        pygame.display.flip()
-
-        self.load_cars()
-        
-        # Load Tree
-        self.tree_img = None
-        for t_name in ["tree.png", "tree.jpg"]:
-            if os.path.exists(t_name):
-                try:
-                    raw_tree = pygame.image.load(t_name)
-                    raw_tree = self.aggressive_clean_image(raw_tree)
-                    self.tree_img = self.scale_keep_aspect(raw_tree, 180, 180)
-                    break
-                except: pass
-
-        self.track_data = self.generate_procedural_track()
-        
-        if self.tree_img:
-            self.generate_scenery(self.track_data["mask"], 1500)
+        self._tree_img = False # Not loaded yet
+        self.tree_lods = {} # Scale -> resized tree sprite (tree sizes x quality levels)
+        self.tracks = TrackLoader()
+        self.track_names = self.tracks.names()
+        self.track_index = 0
+        self._track_requested = None
+        startup_mark("track specs")
+
+    @property
+    def track_data(self):
+        """The selected track once it is built, otherwise None."""
+        track = self.tracks.poll()
+        if not track or track["name"] != self.track_names[self.track_index]: return None
+        if self._track_requested:
+            report_deferred(f"track {track['name']}", self._track_requested)
+            self._track_requested = None
+        return track
+
+    def select_track(self, direction):
+        if not self.track_names: return
+        self.track_index = (self.track_index + direction) % len(self.track_names)
+
+    def select_track_by_name(self, name):
+        if name in self.track_names:
+            self.track_index = self.track_names.index(name)
+
+    def load_track(self):
+        """Build the selected track in the background unless it's built or building."""
+        if not self.track_names: return
+        name = self.track_names[self.track_index]
+        if name != self.tracks.current_name or self.tracks.error:
+            self._track_requested = time.perf_counter()
+        self.tracks.request(name)
+
+    def car_sprite(self, car_type):
+        if car_type not in self.car_sprites: self.load_car(car_type)
+        return self.car_sprites[car_type]
+
+    def car_preview(self, car_type):
+        if car_type not in self.car_sprites: self.load_car(car_type)
+        return self.car_previews.get(car_type)
+
+    @property
+    def tree_img(self):
+        if self._tree_img is False: self._tree_img = self.load_tree()
+        return self._tree_img
+
+    def tree_sprite(self, scale):
+        """The tree at `scale` of its full size, or None if there's no tree image."""
+        tree = self.tree_img
+        scale = round(scale, 2) # Scenery scales x level scales: keep the cache small
+        if not tree or scale == 1.0: return tree
+        if scale not in self.tree_lods:
+            w, h = tree.get_size()
+            small = pygame.transform.smoothscale(tree, (max(1, int(w * scale)), max(1, int(h * scale))))
+            self.tree_lods[scale] = surfaces.prepare_sprite(small, f"tree x{scale}")
+        return self.tree_lods[scale]
 
     def aggressive_clean_image(self, image):
+        """Make every pixel with R, G and B all above 200 fully transparent."""
         image = image.convert_alpha()
-        width, height = image.get_size()
-        for x in range(width):
-            for y in range(height):
-                r, g, b, a = image.get_at((x, y))
-                if r > 200 and g > 200 and b > 200:
-                    image.set_at((x, y), (0, 0, 0, 0)) 
+        # Channels within 28 of 228 means 201..255; any alpha matches
+        white = pygame.mask.from_threshold(image, (228, 228, 228, 128), (28, 28, 28, 255))
+        white.to_surface(image, setcolor=(0, 0, 0, 0), unsetcolor=None)
         return image
 
     def scale_keep_aspect(self, image, max_w, max_h, rotate=False):
@@ -148,202 +199,35 @@ class AssetManager:
         if rotate: img = pygame.transform.rotate(img, -90)
         return img
 
-    def load_cars(self):
-        car_files = {
-            "F1": "f1.png", "LE_MANS": "lemans.png",
-            "NASCAR": "nascar.png", "SUPER": "super.png", "DRIFT": "drift.png"
-        }
-        for type_key, filename in car_files.items():
-            if os.path.exists(filename):
-                try:
-                    raw = pygame.image.load(filename)
-                    raw = self.aggressive_clean_image(raw) 
-                    self.car_sprites[type_key] = self.scale_keep_aspect(raw, 55, 100, rotate=True)
-                    self.car_previews[type_key] = self.scale_keep_aspect(raw, 180, 300, rotate=False)
-                except: self.car_sprites[type_key] = None
-            else: self.car_sprites[type_key] = None
-
-    def catmull_rom_spline(self, points, steps=30):
-        points = [points[-1]] + points + [points[0], points[1]]
-        curve = []
-        for i in range(len(points) - 3):
-            p0, p1, p2, p3 = points[i], points[i+1], points[i+2], points[i+3]
-            for t in range(steps):
-                t /= steps
-                q0 = -t**3 + 2*t**2 - t
-                q1 = 3*t**3 - 5*t**2 + 2
-                q2 = -3*t**3 + 4*t**2 + t
-                q3 = t**3 - t**2
-                x = 0.5 * (p0[0]*q0 + p1[0]*q1 + p2[0]*q2 + p3[0]*q3)
-                y = 0.5 * (p0[1]*q0 + p1[1]*q1 + p2[1]*q2 + p3[1]*q3)
-                curve.append((x, y))
-        return curve
-
-    def paint_track(self, surface, color, points, width):
-        radius = width // 2
-        for p in points:
-            pygame.draw.circle(surface, color, (int(p[0]), int(p[1])), radius)
-
-    def generate_scenery(self, mask_surface, num_trees):
-        width, height = mask_surface.get_size()
-        count = 0
-        attempts = 0
-        while count < num_trees and attempts < num_trees * 10:
-            attempts += 1
-            x = random.randint(0, width - 1)
-            y = random.randint(0, height - 1)
+    def load_car(self, type_key):
+        started = time.perf_counter()
+        self.car_sprites[type_key] = None
+        filename = CAR_FILES.get(type_key)
+        if filename and os.path.exists(filename):
             try:
-                col = mask_surface.get_at((x, y))
-                if col[0] < 20 and col[1] < 20 and col[2] < 20:
-                    scale = random.uniform(0.7, 1.1)
-                    self.scenery_objects.append({"pos": (x, y), "scale": scale})
-                    count += 1
-            except: pass
-
-    def generate_procedural_track(self):
-        MAP_SIZE = 20000
-        TRACK_WIDTH = 400 
-        KERB_WIDTH = 480
-
-        vis = pygame.Surface((MAP_SIZE, MAP_SIZE))
-        mask_surf = pygame.Surface((MAP_SIZE, MAP_SIZE))
-        vis.fill(GREEN) 
-        mask_surf.fill(BLACK) 
-        
-        # --- TRACK LAYOUT ---
-        points = [
-    (12100, 3625),
-    (18725, 10800),
-    (12700, 10800),
-    (12100, 3550),
-]
-        smooth_points = self.catmull_rom_spline(points, steps=100)
-        
-        self.paint_track(vis, KERB_RED, smooth_points, KERB_WIDTH)
-        self.paint_track(vis, KERB_WHITE, smooth_points, KERB_WIDTH - 40)
-        self.paint_track(vis, ASPHALT, smooth_points, TRACK_WIDTH)
-        self.paint_track(mask_surf, WHITE, smooth_points, 550) 
-        
-        dash_length = 80   
-        gap_length = 80    
-        cycle_length = dash_length + gap_length
-        current_distance = 0
-        
-        for i in range(len(smooth_points) - 1):
-            p1 = smooth_points[i]
-            p2 = smooth_points[i+1]
-            dist = math.hypot(p2[0] - p1[0], p2[1] - p1[1])
-            if (current_distance % cycle_length) < dash_length:
-                pygame.draw.line(vis, WHITE, p1, p2, 12) 
-            current_distance += dist
-
-        # --- AUTO-CROP & MODERN MINIMAP ---
-        all_x = [p[0] for p in smooth_points]
-        all_y = [p[1] for p in smooth_points]
-        min_x, max_x = min(all_x), max(all_x)
-        min_y, max_y = min(all_y), max(all_y)
-        
-        padding = 500
-        crop_x = max(0, min_x - padding)
-        crop_y = max(0, min_y - padding)
-        crop_w = min(MAP_SIZE - crop_x, (max_x - min_x) + padding * 2)
-        crop_h = min(MAP_SIZE - crop_y, (max_y - min_y) + padding * 2)
-        
-        # Transparent surface
-        minimap_surf = pygame.Surface((crop_w, crop_h), pygame.SRCALPHA)
-        offset_points = [(p[0] - crop_x, p[1] - crop_y) for p in smooth_points]
-        
-        # Draw single smooth white line for the GPS look (Thicker: 120px)
-        pygame.draw.lines(minimap_surf, (255, 255, 255, 255), True, offset_points, 120)
-        minimap = pygame.transform.smoothscale(minimap_surf, (250, 250))
-        
-        # --- START LINE & SPAWN ---
-        p0 = smooth_points[0]
-        p1 = smooth_points[5] 
-        dx = p1[0] - p0[0]
-        dy = p1[1] - p0[1]
-        
-        track_angle = math.degrees(math.atan2(-dy, dx))
-        car_spawn_angle = track_angle 
-        line_rot_angle = track_angle - 90
-
-        length = math.hypot(dx, dy)
-        dir_x = dx / length
-        dir_y = dy / length
-        right_x = -dir_y
-        right_y = dir_x
-        
-        spacing = 60
-        spawn_1 = (p0[0] - right_x * spacing, p0[1] - right_y * spacing)
-        spawn_2 = (p0[0] + right_x * spacing, p0[1] + right_y * spacing)
-
-        check_size = 40
-        line_thickness = 80
-        line_surf = pygame.Surface((TRACK_WIDTH, line_thickness), pygame.SRCALPHA)
-        for x in range(0, TRACK_WIDTH, check_size):
-            for y in range(0, line_thickness, check_size):
-                color = WHITE if (x // check_size + y // check_size) % 2 == 0 else BLACK
-                pygame.draw.rect(line_surf, color, (x, y, check_size, check_size))
-        
-        rot_line = pygame.transform.rotate(line_surf, line_rot_angle)
-        line_rect = rot_line.get_rect(center=(int(p0[0]), int(p0[1])))
-        vis.blit(rot_line, line_rect)
-
-        mid_index = len(smooth_points) // 2
-        mid_p = smooth_points[mid_index]
-
-        meta = {
-            "start_rect": pygame.Rect(p0[0]-200, p0[1]-200, 400, 400), 
-            "check_rect": pygame.Rect(mid_p[0]-300, mid_p[1]-300, 600, 600), 
-            "spawn_p1": spawn_1, 
-            "spawn_p2": spawn_2, 
-            "start_angle": car_spawn_angle,
-            "crop_offset": (crop_x, crop_y),
-            "crop_size": (crop_w, crop_h)
-        }
-        
-        return {"vis": vis, "mask": mask_surf, "mini": minimap, "meta": meta}
-
-# --- SOUND ---
-class SoundManager:
-    def __init__(self):
-        pygame.mixer.init()
-        self.sounds = {}
-        # Checks for .wav, .mp3, and .ogg
-        self.extensions = [".wav", ".mp3", ".ogg"]
-        self.sound_files = {
-            "drift": "skid", 
-            "crash": "crash",
-            "start": "start", 
-            "eng_v6": "eng_v6", 
-            "eng_v8": "eng_v8",
-            "eng_v10": "eng_v10",
-            "eng_w16": "eng_w16"
-        }
-        
-        for name, filename in self.sound_files.items():
-            loaded = False
-            for ext in self.extensions:
-                full_path = filename + ext
-                if os.path.exists(full_path):
-                    try:
-                        # print(f"Loading sound: {full_path}")
-                        s = pygame.mixer.Sound(full_path)
-                        if "drift" in name: s.set_volume(0.4)
-                        else: s.set_volume(0.7)
-                        self.sounds[name] = s
-                        loaded = True
-                        break
-                    except Exception as e:
-                        print(f"Error loading {full_path}: {e}")
-            if not loaded:
-                self.sounds[name] = None
-            
-    def play(self, name):
-        if self.sounds.get(name): self.sounds[name].play()
-        
-    def get(self, name):
-        return self.sounds.get(name)
+                raw = pygame.image.load(filename)
+                raw = self.aggressive_clean_image(raw) 
+                # The race sprite gets rotated all the time, so no RLE for it
+                self.car_sprites[type_key] = surfaces.prepare_sprite(
+                    self.scale_keep_aspect(raw, 55, 100, rotate=True), f"car {type_key}", rle=False)
+                self.car_previews[type_key] = surfaces.prepare_sprite(
+                    self.scale_keep_aspect(raw, 180, 300, rotate=False), f"preview {type_key}")
+            except: self.car_sprites[type_key] = None
+        report_deferred(f"car {type_key}", started)
+
+    def load_tree(self):
+        started = time.perf_counter()
+        tree = None
+        for t_name in ["tree.png", "tree.jpg"]:
+            if os.path.exists(t_name):
+                try:
+                    raw_tree = pygame.image.load(t_name)
+                    raw_tree = self.aggressive_clean_image(raw_tree)
+                    tree = surfaces.prepare_sprite(self.scale_keep_aspect(raw_tree, 180, 180), "tree")
+                    break
+                except: pass
+        report_deferred("tree", started)
+        return tree
 
 # --- UI CLASSES ---
 class TextInput:
@@ -375,10 +259,8 @@ class Button:
         self.hovered = False
         
     def draw(self, screen):
-        s = pygame.Surface((self.rect.w, self.rect.h), pygame.SRCALPHA)
         fill_col = (*self.base_color, 150) if self.hovered else (40, 40, 50, 200)
-        s.fill(fill_col)
-        screen.blit(s, (self.rect.x, self.rect.y))
+        screen.blit(panel_surface(self.rect.w, self.rect.h, fill_col), (self.rect.x, self.rect.y))
         pygame.draw.rect(screen, self.base_color, self.rect, 2)
         txt_surf = self.font.render(self.text, True, WHITE)
         txt_rect = txt_surf.get_rect(center=self.rect.center)
@@ -387,187 +269,306 @@ class Button:
     def check_click(self, pos):
         return self.rect.collidepoint(pos)
 
+class Minimap:
+    """GPS-style track overview rasterized straight from the centreline.
+
+    The track is drawn once into `base` at minimap resolution. `layer` is base
+    plus trails and car markers, and each update only restores and repaints
+    the small rects whose markers or trail dots changed.
+    """
+    SECTOR_COLORS = [(255, 255, 255), (255, 215, 0), (0, 200, 255), (255, 120, 200)]
+    TRAIL_LEN = 40
+    TRAIL_STEP = 3   # Minimap pixels a car must move before a new trail dot
+    MARKER_R = 5
+
+    def __init__(self, track, size=MINIMAP_SIZE, trails=MINIMAP_TRAILS, sectors=MINIMAP_SECTORS):
+        meta = track["meta"]
+        real_w, real_h = meta["crop_size"]
+        offset_x, offset_y = meta["crop_offset"]
+        # world -> minimap: m = world * scale + offset
+        self.sx = size / real_w
+        self.sy = size / real_h
+        self.ox = -offset_x * self.sx
+        self.oy = -offset_y * self.sy
+        self.trails = trails
+        self.size = size
+
+        self.base = surfaces.translucent((size, size))
+        pts = [self.to_map(x, y) for x, y in track["centreline"]]
+        width = max(2, round(120 * min(self.sx, self.sy)))
+        cuts = sorted(meta["check_indices"]) if sectors else []
+        bounds = [0] + cuts + [len(pts)]
+        for i in range(len(bounds) - 1):
+            # Each sector runs up to and including the first point of the next
+            seg = pts[bounds[i]:bounds[i+1] + 1] if i < len(bounds) - 2 else pts[bounds[i]:] + pts[:1]
+            if len(seg) < 2: continue
+            color = self.SECTOR_COLORS[i % len(self.SECTOR_COLORS)]
+            pygame.draw.lines(self.base, color, False, seg, width)
+            pygame.draw.aalines(self.base, color, False, seg)
+        self.layer = self.base.copy()
+        surfaces.check(self.layer, "minimap", dynamic=True)
+        self.markers = {}  # car id -> (pos, color)
+        self.trail_dots = {} # car id -> list of positions, oldest first
+
+    def to_map(self, x, y):
+        return (x * self.sx + self.ox, y * self.sy + self.oy)
+
+    def marker_rect(self, pos, r):
+        return pygame.Rect(pos[0] - r, pos[1] - r, r * 2 + 1, r * 2 + 1)
+
+    def update(self, cars):
+        dirty = []
+        for car in cars:
+            mx, my = self.to_map(car.pos.x, car.pos.y)
+            pos = (int(mx), int(my))
+            old = self.markers.get(id(car))
+            if old and old[0] == pos: continue
+            if old: dirty.append(self.marker_rect(old[0], self.MARKER_R))
+            dirty.append(self.marker_rect(pos, self.MARKER_R))
+            self.markers[id(car)] = (pos, car.color)
+            if self.trails:
+                dots = self.trail_dots.setdefault(id(car), [])
+                if not dots or abs(dots[-1][0] - pos[0]) + abs(dots[-1][1] - pos[1]) >= self.TRAIL_STEP:
+                    dots.append(pos)
+                    dirty.append(self.marker_rect(pos, 2))
+                    if len(dots) > self.TRAIL_LEN:
+                        dirty.append(self.marker_rect(dots.pop(0), 2))
+        if not dirty: return
+
+        for r in dirty:
+            self.layer.blit(self.base, r, r)
+        # Repaint whatever overlaps the restored areas: trails first, markers on top
+        for car_id, dots in self.trail_dots.items():
+            color = self.markers[car_id][1]
+            for i, dot in enumerate(dots):
+                if self.marker_rect(dot, 2).collidelist(dirty) != -1:
+                    fade = 60 + 140 * i // len(dots)
+                    pygame.draw.circle(self.layer, (*color, fade), dot, 2)
+        for pos, color in self.markers.values():
+            if self.marker_rect(pos, self.MARKER_R).collidelist(dirty) != -1:
+                pygame.draw.circle(self.layer, color, pos, self.MARKER_R)
+
+    def draw(self, screen, x, y):
+        screen.blit(self.layer, (x, y))
+
 # --- CAR CLASS ---
-class Car:
-    def __init__(self, x, y, angle, car_type, color, controls, parts, audio, sprite):
-        self.pos = pygame.math.Vector2(x, y)
-        self.vel = pygame.math.Vector2(0, 0)
-        self.angle = angle 
-        self.type = car_type
+# controls -> (left, right, throttle, brake)
+KEYMAPS = {
+    "P1": (pygame.K_a, pygame.K_d, pygame.K_w, pygame.K_s),
+    "P2": (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN),
+    "P3": (pygame.K_j, pygame.K_l, pygame.K_i, pygame.K_k),
+    "P4": (pygame.K_KP4, pygame.K_KP6, pygame.K_KP8, pygame.K_KP5),
+}
+
+class Car(CarPhysics):
+    __slots__ = ("controls", "audio", "sprite", "color", "engine_sound_name", "channel_id",
+                 "mouse_throttle", "rot_img", "rot_angle")
+
+    def __init__(self, x, y, angle, car_type, color, controls, parts, audio, sprite, voice=None):
+        super().__init__(x, y, angle, car_type, parts)
         self.controls = controls
         self.audio = audio
         self.sprite = sprite 
         self.color = color
         
-        stats = CHASSIS_STATS[car_type]
-        eng = ENGINES[parts['eng']]
-        tyre = TYRES[parts['tyre']]
-        brk = BRAKES[parts['brk']]
-        
-        self.mass = stats["mass"]
-        self.max_speed = stats["base_spd"] * eng["spd_mult"]
-        self.accel = stats["accel"] * eng["acc_mult"] 
-        self.grip = stats["base_grip"] * tyre["grip_mult"] 
-        self.turn_rate = stats["turn"] * tyre["turn_mult"] 
-        self.brake_power = brk["power"]
-        
         # --- AUDIO SYSTEM ---
-        self.engine_sound_name = stats["sfx"]
-        self.sound_obj = self.audio.get(self.engine_sound_name)
-        
-        self.channel_id = 0 if controls == "P1" else 1
-        self.engine_channel = pygame.mixer.Channel(self.channel_id)
-        
-        if self.sound_obj:
-            self.engine_channel.play(self.sound_obj, loops=-1)
-            self.engine_channel.set_volume(0) 
+        self.engine_sound_name = self.setup.sfx
+        self.channel_id = voice if voice is not None else (0 if controls == "P1" else 1)
+        self.audio.engine_start(self.channel_id, self.engine_sound_name)
         
         self.mouse_throttle = 0.0
-        self.laps = 1
-        self.checkpoint_passed = False
-        self.finished = False
+        self.rot_img = None
+        self.rot_angle = None
 
     def stop_audio(self):
-        if self.engine_channel:
-            self.engine_channel.fadeout(500)
-
-    def update(self, mask_surface, meta_data):
-        if self.finished:
-            self.vel *= 0.95
-            self.pos += self.vel
-            self.engine_channel.set_volume(0)
-            return
+        self.audio.engine_stop(self.channel_id, 500)
 
+    def read_input(self):
         keys = pygame.key.get_pressed()
         turning = 0
         throttle = 0 
         brake = False
         
-        if self.controls == "P1":
-            if keys[pygame.K_a]: turning = 1
-            if keys[pygame.K_d]: turning = -1
-            if keys[pygame.K_w]: throttle = 1  
-            if keys[pygame.K_s]: brake = True  
-        elif self.controls == "P2": 
-            if keys[pygame.K_LEFT]: turning = 1
-            if keys[pygame.K_RIGHT]: turning = -1
-            if keys[pygame.K_UP]: throttle = 1    
-            if keys[pygame.K_DOWN]: brake = True 
+        keymap = KEYMAPS.get(self.controls)
+        if keymap:
+            left, right, gas, stop = keymap
+            if keys[left]: turning = 1
+            if keys[right]: turning = -1
+            if keys[gas]: throttle = 1
+            if keys[stop]: brake = True
+        if self.controls == "P2": 
             m_but = pygame.mouse.get_pressed()
             if m_but[0]: turning = 1
             if m_but[2]: turning = -1
             if m_but[1]: brake = True
             if throttle == 0 and not brake:
                 if self.mouse_throttle > 0: throttle = self.mouse_throttle
+        return turning, throttle, brake
 
-        rad = math.radians(self.angle)
-        forward = pygame.math.Vector2(math.cos(rad), -math.sin(rad))
-        right = pygame.math.Vector2(-math.sin(rad), -math.cos(rad))
+    def update_audio(self, throttle, events):
+        if self.finished:
+            self.audio.engine_update(self.channel_id, 0.0, 0.0)
+            return
         
         # --- ENGINE VOLUME LOGIC ---
-        speed_ratio = self.vel.length() / self.max_speed
-        if self.sound_obj:
-            if throttle > 0:
-                vol = 0.3 + (speed_ratio * 0.7)
-            else:
-                vol = speed_ratio * 0.5
-            
-            if self.vel.length() < 0.5:
-                vol = 0
-                
-            self.engine_channel.set_volume(min(1.0, vol))
-
+        # Pitch follows speed_ratio inside the audio engine's loop crossfade
+        speed_ratio = self.vel.length() / self.setup.max_speed
         if throttle > 0:
-            self.vel += forward * self.accel * throttle
+            vol = 0.3 + (speed_ratio * 0.7)
+        else:
+            vol = speed_ratio * 0.5
         
-        if brake:
-            if self.vel.dot(forward) > 0.5: 
-                self.vel -= self.vel * self.brake_power
-            else: 
-                self.vel -= forward * (self.accel * 0.5)
-
-        if throttle == 0 and not brake:
-            self.vel *= 0.99
-
-        if self.vel.length() > 0.5:
-            d = 1 if self.vel.dot(forward) > -0.1 else -1
-            self.angle += turning * self.turn_rate * (self.vel.length() / (self.max_speed * 0.8)) * d
-
-        vel_forward = self.vel.dot(forward)
-        vel_lateral = self.vel.dot(right)
-        vel_lateral *= (1.0 - self.grip) 
-        if abs(vel_lateral) > 2.0:
-            if random.randint(0, 100) < 10: self.audio.play("drift")
-        self.vel = (forward * vel_forward) + (right * vel_lateral)
-
-        if self.vel.length() > self.max_speed: 
-            self.vel.scale_to_length(self.max_speed)
-
-        next_pos = self.pos + self.vel
-        try:
-            if 0 <= next_pos.x < mask_surface.get_width() and 0 <= next_pos.y < mask_surface.get_height():
-                col = mask_surface.get_at((int(next_pos.x), int(next_pos.y)))
-                if col[0] < 50: 
-                    self.vel *= -0.5
-                    self.audio.play("crash")
-        except: self.vel *= -0.5
-
-        self.pos += self.vel
-
-        car_rect = pygame.Rect(self.pos.x, self.pos.y, 40, 40)
-        if car_rect.colliderect(meta_data["check_rect"]): self.checkpoint_passed = True
-        if car_rect.colliderect(meta_data["start_rect"]) and self.checkpoint_passed:
-            self.laps += 1
-            self.checkpoint_passed = False
+        if self.vel.length() < 0.5:
+            vol = 0
+            
+        self.audio.engine_update(self.channel_id, speed_ratio, min(1.0, vol))
+        for name in events:
+            self.audio.play(name) # Rate-limited by the audio engine
+
+    def rotated(self):
+        # Rotated once per heading change and reused by every view the car is in
+        if self.rot_angle != self.angle:
+            if self.sprite:
+                self.rot_img = pygame.transform.rotate(self.sprite, self.angle)
+            else:
+                w, h = 50, 90
+                s = surfaces.opaque((w, h))
+                s.fill(KEY_COLOR)
+                pygame.draw.rect(s, self.color, (0, 0, w, h), border_radius=5)
+                pygame.draw.rect(s, BLACK, (5, 20, 40, 20))
+                # Rotating a keyed surface fills the new corners with the key
+                s = surfaces.prepare_keyed(s, KEY_COLOR, "car")
+                self.rot_img = pygame.transform.rotate(s, self.angle - 90)
+            self.rot_angle = self.angle
+            surfaces.check(self.rot_img, "car", dynamic=True)
+        return self.rot_img
 
     def draw(self, surface, cam_x, cam_y):
-        if self.sprite:
-            rot_img = pygame.transform.rotate(self.sprite, self.angle)
-            new_rect = rot_img.get_rect(center=(self.pos.x - cam_x, self.pos.y - cam_y))
-            surface.blit(rot_img, new_rect.topleft)
-        else:
-            w, h = 50, 90
-            s = pygame.Surface((w, h), pygame.SRCALPHA)
-            pygame.draw.rect(s, self.color, (0, 0, w, h), border_radius=5)
-            pygame.draw.rect(s, BLACK, (5, 20, 40, 20))
-            rot_img = pygame.transform.rotate(s, self.angle - 90)
-            rect = rot_img.get_rect(center=(self.pos.x - cam_x, self.pos.y - cam_y))
-            surface.blit(rot_img, rect.topleft)
+        rot_img = self.rotated()
+        rect = rot_img.get_rect(center=(self.pos.x - cam_x, self.pos.y - cam_y))
+        surface.blit(rot_img, rect.topleft)
+
+class GhostCar(Car):
+    """Translucent replay of a stored lap, drawn like a Car but never simulated."""
+    __slots__ = ("trace", "driver")
+
+    def __init__(self, sprite, color, trace=None, driver=""):
+        # No CarPhysics setup or engine sound: only what drawing needs
+        self.pos = pygame.math.Vector2(0, 0)
+        self.angle = 0
+        self.color = color
+        self.sprite = None
+        if sprite:
+            self.sprite = sprite.copy()
+            self.sprite.fill((255, 255, 255, GHOST_ALPHA), special_flags=pygame.BLEND_RGBA_MULT)
+        self.rot_img = None
+        self.rot_angle = None
+        self.trace = trace
+        self.driver = driver
+
+    def follow(self, lap_ms):
+        """Move to where the trace was `lap_ms` into its lap. False if there's no trace."""
+        pose = self.trace.pose_at(lap_ms) if self.trace else None
+        if pose:
+            self.pos.update(pose[0], pose[1])
+            self.angle = pose[2]
+        return pose is not None
+
+    def rotated(self):
+        img = super().rotated()
+        if not self.sprite: img.set_alpha(GHOST_ALPHA, pygame.RLEACCEL)
+        return img
+
+# --- VIEWPORTS ---
+def split_screen(n, w=SCREEN_WIDTH, h=SCREEN_HEIGHT):
+    """Screen rects for n local views: full, side by side, or quarters."""
+    if n <= 1: return [pygame.Rect(0, 0, w, h)]
+    if n == 2: return [pygame.Rect(0, 0, w//2, h), pygame.Rect(w//2, 0, w - w//2, h)]
+    top = [pygame.Rect(0, 0, w//2, h//2), pygame.Rect(w//2, 0, w - w//2, h//2)]
+    # Three players: the third gets the whole bottom half
+    if n == 3: return top + [pygame.Rect(0, h//2, w, h - h//2)]
+    return top + [pygame.Rect(0, h//2, w//2, h - h//2), pygame.Rect(w//2, h//2, w - w//2, h - h//2)]
+
+class Viewport:
+    """A slice of the screen whose camera follows one car."""
+
+    def __init__(self, rect, car, name, color):
+        self.rect = rect
+        self.car = car
+        self.name = name
+        self.color = color
+
+    def offset(self):
+        # world -> screen: screen = world - offset, car centred in the rect
+        return (self.car.pos.x - self.rect.w/2 - self.rect.x,
+                self.car.pos.y - self.rect.h/2 - self.rect.y)
+
+    def world_rect(self, pad_w=0, pad_h=0):
+        """The world area this view shows, grown by half a sprite on each side."""
+        ox, oy = self.offset()
+        return pygame.Rect(int(ox + self.rect.x - pad_w//2), int(oy + self.rect.y - pad_h//2),
+                           self.rect.w + pad_w, self.rect.h + pad_h)
 
 # --- GAME ENGINE ---
 class Game:
-    def __init__(self):
-        pygame.init()
-        # Allocate enough channels (2 for cars + 6 for SFX)
-        pygame.mixer.set_num_channels(8)
+    def __init__(self, connect=None):
+        # Only what the menu needs; the mixer is opened by the audio thread
+        pygame.display.init()
+        pygame.font.init()
+        startup_mark("pygame init")
         
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
         pygame.display.set_caption("Speed Show - Modern Edition")
         self.clock = pygame.time.Clock()
+        # Race detail follows the measured frame time unless QUALITY_LOCK pins it
+        self.quality = QualityController(FPS, None if QUALITY_LOCK is None else level_index(QUALITY_LOCK))
+        self.debug_overlay = DEBUG_OVERLAY
+        startup_mark("window")
         self.assets = AssetManager(self.screen)
-        self.db = DatabaseManager()
+        # Saves on its own thread so the win screen never waits on disk; the
+        # database is opened by the first save
+        self.db = ResultWriter()
         self.state = "MENU"
         
-        self.p1_data = {"name": "", "type": "F1", "parts": {"eng": 0, "tyre": 1, "brk": 0}}
-        self.p2_data = {"name": "", "type": "DRIFT", "parts": {"eng": 0, "tyre": 1, "brk": 0}}
+        self.players = [{"name": "", "type": DEFAULT_CARS[i], "parts": Parts()}
+                        for i in range(MAX_LOCAL_PLAYERS)]
+        self.num_players = 2
+        self.setup_index = 0 # Which player's setup screen is showing
+        self.time_trial = False # Solo laps against the stored best-lap ghost
+        self.ghost = None
+        self.ghost_lookup = None # BestLapLookup started in setup, collected once the race runs
+        self.recorder = None
+        self.lap_start = 0 # Tick the current lap started on
+        self.lap_count = 0
+        self.last_lap_ms = None
+        self.best_lap_ms = None
         
-        self.race_start_time = 0
-        self.start_sequence_time = 0
-        self.race_active = False 
-        self.car1 = None
-        self.car2 = None
+        # Races run on fixed physics ticks from the moment the lights start;
+        # race times are counted in ticks, never read off the wall clock
+        self.tick = 0
+        self.tick_debt = 0.0 # Fraction of a tick owed to the next frame
+        self.replay = None   # Inputs and state hashes of the local race
+        self.cars = []      # Local cars, same order as self.players
+        self.viewports = []
         self.winner = None
         self.win_time_str = ""
         self.saved_db = False 
+        self.connect = connect # HOST[:PORT] of a LAN race server
+        self.net = None
+        self.remote_cars = {}
         
         cx = SCREEN_WIDTH // 2
-        self.input_p1 = TextInput(cx - 100, 220, 200, 40, self.assets.font_big)
-        self.input_p2 = TextInput(cx - 100, 220, 200, 40, self.assets.font_big)
+        self.inputs = [TextInput(cx - 100, 220, 200, 40, self.assets.font_big) for _ in range(MAX_LOCAL_PLAYERS)]
         
-        self.btn_start = Button(cx-100, 400, 200, 60, "START", self.assets.font_big, NEON_ORANGE)
-        self.btn_exit = Button(cx-100, 500, 200, 60, "EXIT", self.assets.font_big, GREY)
-        self.btn_p1_next = Button(cx-100, 650, 200, 50, "NEXT >", self.assets.font_big, NEON_ORANGE)
-        self.btn_p2_race = Button(cx-100, 650, 200, 50, "RACE!", self.assets.font_big, NEON_TEAL)
+        self.btn_start = Button(cx-100, 390, 200, 60, "START", self.assets.font_big, NEON_ORANGE)
+        self.btn_trial = Button(cx-100, 460, 200, 60, "TIME TRIAL", self.assets.font_big, NEON_CYAN)
+        self.btn_track_prev = Button(cx-250, 290, 50, 50, "<", self.assets.font_big)
+        self.btn_track_next = Button(cx+200, 290, 50, 50, ">", self.assets.font_big)
+        self.btn_exit = Button(cx-100, 530, 200, 60, "EXIT", self.assets.font_big, GREY)
+        self.btn_players_prev = Button(cx-250, 600, 50, 50, "<", self.assets.font_big)
+        self.btn_players_next = Button(cx+200, 600, 50, 50, ">", self.assets.font_big)
+        self.btn_next = Button(cx-100, 650, 200, 50, "NEXT >", self.assets.font_big, NEON_ORANGE)
+        self.btn_race = Button(cx-100, 650, 200, 50, "RACE!", self.assets.font_big, NEON_TEAL)
         self.btn_car_prev = Button(cx-250, 300, 50, 150, "<", self.assets.font_header)
         self.btn_car_next = Button(cx+200, 300, 50, 150, ">", self.assets.font_header)
         
@@ -585,110 +586,293 @@ class Game:
             mx, my = pygame.mouse.get_pos()
             for event in pygame.event.get():
                 if event.type == pygame.QUIT: running = False
-                if self.state == "P1_SETUP": self.input_p1.handle_event(event)
-                if self.state == "P2_SETUP": self.input_p2.handle_event(event)
-                if event.type == pygame.KEYDOWN and self.state == "RACE" and event.key == pygame.K_ESCAPE:
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F3: self.debug_overlay = not self.debug_overlay
+                if self.state == "SETUP": self.inputs[self.setup_index].handle_event(event)
+                if event.type == pygame.KEYDOWN and self.state in ("RACE", "NET_WAIT") and event.key == pygame.K_ESCAPE:
                     # FIX: Stop engine sounds when returning to menu
-                    if self.car1: self.car1.stop_audio()
-                    if self.car2: self.car2.stop_audio()
+                    for car in self.race_cars(): car.stop_audio()
+                    self.leave_net()
                     self.state = "MENU"
 
                 if event.type == pygame.MOUSEBUTTONDOWN:
                     if self.state == "MENU":
-                        if self.btn_start.check_click((mx, my)): self.state = "P1_SETUP"
+                        if self.btn_start.check_click((mx, my)) or self.btn_trial.check_click((mx, my)):
+                            self.time_trial = self.btn_trial.check_click((mx, my)) and not self.connect
+                            self.enter_setup()
+                        if self.btn_track_prev.check_click((mx, my)): self.assets.select_track(-1)
+                        if self.btn_track_next.check_click((mx, my)): self.assets.select_track(1)
+                        if not self.connect:
+                            if self.btn_players_prev.check_click((mx, my)): self.cycle_players(-1)
+                            if self.btn_players_next.check_click((mx, my)): self.cycle_players(1)
                         if self.btn_exit.check_click((mx, my)): running = False
-                    elif self.state == "P1_SETUP":
-                        if self.btn_p1_next.check_click((mx, my)):
-                            self.p1_data["name"] = self.input_p1.text if self.input_p1.text else "Player 1"
-                            self.state = "P2_SETUP"
-                        if self.btn_car_prev.check_click((mx, my)): self.cycle_car(1, -1)
-                        if self.btn_car_next.check_click((mx, my)): self.cycle_car(1, 1)
-                        for item in self.part_btns:
-                            if item["btn"].check_click((mx, my)): self.cycle_part(1, item["act"])
-                    elif self.state == "P2_SETUP":
-                        if self.btn_p2_race.check_click((mx, my)):
-                            self.p2_data["name"] = self.input_p2.text if self.input_p2.text else "Player 2"
-                            self.start_race()
-                        if self.btn_car_prev.check_click((mx, my)): self.cycle_car(2, -1)
-                        if self.btn_car_next.check_click((mx, my)): self.cycle_car(2, 1)
-                        for item in self.part_btns:
-                            if item["btn"].check_click((mx, my)): self.cycle_part(2, item["act"])
+                    elif self.state == "SETUP":
+                        i = self.setup_index
+                        if self.setup_button().check_click((mx, my)):
+                            self.players[i]["name"] = self.inputs[i].text if self.inputs[i].text else f"Player {i+1}"
+                            if self.connect: self.join_net_race()
+                            elif not self.time_trial and i + 1 < self.num_players: self.setup_index += 1
+                            else: self.start_race()
+                        elif self.btn_car_prev.check_click((mx, my)): self.cycle_car(i + 1, -1)
+                        elif self.btn_car_next.check_click((mx, my)): self.cycle_car(i + 1, 1)
+                        else:
+                            for item in self.part_btns:
+                                if item["btn"].check_click((mx, my)): self.cycle_part(i + 1, item["act"])
                     elif self.state == "WIN":
                         if pygame.mouse.get_pressed()[0]: self.state = "MENU"
 
             self.screen.fill(BLACK)
             if self.state == "MENU": self.draw_menu(mx, my)
-            elif self.state == "P1_SETUP": self.draw_setup_screen(mx, my, 1)
-            elif self.state == "P2_SETUP": self.draw_setup_screen(mx, my, 2)
+            elif self.state == "SETUP": self.draw_setup_screen(mx, my, self.setup_index + 1)
             elif self.state == "RACE": 
                 self.update_race()
                 self.draw_race()
+            elif self.state == "NET_WAIT":
+                self.update_net_wait()
+            elif self.state == "LOADING":
+                self.draw_loading()
+                if self.assets.track_data: self.start_race()
+                elif self.assets.tracks.error: self.state = "MENU"
             elif self.state == "WIN":
                 self.draw_win()
+            if self.debug_overlay: self.draw_debug_overlay()
 
             pygame.display.flip()
-            self.clock.tick(FPS)
+            report_startup()
+            frame_ms = self.clock.tick(FPS)
+            if self.state == "RACE": self.quality.frame(frame_ms, self.clock.get_rawtime())
+        self.leave_net()
+        self.assets.sounds.shutdown()
+        self.db.close()
         pygame.quit()
 
+    def enter_setup(self):
+        # Audio and the track get going while the players pick their cars
+        started = time.perf_counter()
+        self.assets.sounds.start()
+        report_deferred("audio", started)
+        self.assets.load_track()
+        # The ghost's lap is looked up off the main thread while cars are picked
+        self.ghost_lookup = None
+        if self.time_trial and self.assets.track_names:
+            self.ghost_lookup = BestLapLookup(self.assets.track_names[self.assets.track_index])
+        self.setup_index = 0
+        self.state = "SETUP"
+
+    def cycle_players(self, direction):
+        self.num_players = (self.num_players - 1 + direction) % MAX_LOCAL_PLAYERS + 1
+
     def cycle_car(self, p_num, direction):
         keys = list(CHASSIS_STATS.keys())
-        data = self.p1_data if p_num == 1 else self.p2_data
+        data = self.players[p_num - 1]
         curr = keys.index(data["type"])
         data["type"] = keys[(curr + direction) % len(keys)]
 
     def cycle_part(self, p_num, act):
-        data = self.p1_data if p_num == 1 else self.p2_data
+        data = self.players[p_num - 1]
         parts = data["parts"]
-        if "eng" in act: parts["eng"] = (parts["eng"] + (1 if "u" in act else -1)) % len(ENGINES)
-        if "tyr" in act: parts["tyre"] = (parts["tyre"] + (1 if "u" in act else -1)) % len(TYRES)
-        if "brk" in act: parts["brk"] = (parts["brk"] + (1 if "u" in act else -1)) % len(BRAKES)
+        if "eng" in act: parts.eng = (parts.eng + (1 if "u" in act else -1)) % len(ENGINES)
+        if "tyr" in act: parts.tyre = (parts.tyre + (1 if "u" in act else -1)) % len(TYRES)
+        if "brk" in act: parts.brk = (parts.brk + (1 if "u" in act else -1)) % len(BRAKES)
+
+    def setup_button(self):
+        last = self.connect or self.time_trial or self.setup_index + 1 >= self.num_players
+        return self.btn_race if last else self.btn_next
 
     def start_race(self):
-        meta = self.assets.track_data["meta"]
-        s1 = self.assets.car_sprites.get(self.p1_data["type"])
-        s2 = self.assets.car_sprites.get(self.p2_data["type"])
-        self.car1 = Car(*meta["spawn_p1"], meta["start_angle"], self.p1_data["type"], NEON_ORANGE, "P1", self.p1_data["parts"], self.assets.sounds, s1)
-        self.car2 = Car(*meta["spawn_p2"], meta["start_angle"], self.p2_data["type"], NEON_TEAL, "P2", self.p2_data["parts"], self.assets.sounds, s2)
-        self.start_sequence_time = pygame.time.get_ticks()
-        self.race_active = False 
+        track = self.assets.track_data
+        if not track:
+            # Still building in the background; start as soon as it's ready
+            self.assets.load_track()
+            self.state = "LOADING"
+            return
+        meta = track["meta"]
+        surfaces.check(track["vis"], "track")
+        self.cars = []
+        count = 1 if self.time_trial else self.num_players
+        for i, data in enumerate(self.players[:count]):
+            sprite = self.assets.car_sprite(data["type"])
+            self.cars.append(Car(*meta["spawns"][i], meta["start_angle"], data["type"], PLAYER_COLORS[i],
+                                 f"P{i+1}", data["parts"], self.assets.sounds, sprite, voice=i))
+        self.viewports = [Viewport(rect, car, data["name"], car.color)
+                          for rect, car, data in zip(split_screen(len(self.cars)), self.cars, self.players)]
+        self.minimap = Minimap(track)
+        self.quality.reset()
+        self.tick = 0
+        self.tick_debt = 0.0
+        self.lap_start = COUNTDOWN_TICKS
+        self.replay = Replay(track["name"], self.assets.tracks.specs[track["name"]].digest(),
+                             [(data["type"], data["parts"].key(), i) for i, data in enumerate(self.players[:count])],
+                             TOTAL_LAPS)
+        self.saved_db = False
+        self.ghost = None
+        if self.time_trial:
+            self.start_time_trial(track)
         self.state = "RACE"
         # PLAY START SOUND ONCE
         self.assets.sounds.play("start")
 
+    # --- TIME TRIAL ---
+    def start_time_trial(self, track):
+        data = self.players[0]
+        if not self.ghost_lookup or self.ghost_lookup.track != track["name"]:
+            self.ghost_lookup = BestLapLookup(track["name"])
+        self.ghost = GhostCar(self.assets.car_sprite(data["type"]), WHITE)
+        self.collect_ghost()
+        self.ghost.follow(0)
+        self.recorder = LapRecorder()
+        self.lap_count = self.cars[0].laps
+        self.last_lap_ms = None
+        self.best_lap_ms = None
+        # Laps go to ghost_laps, not the race_results win table
+        self.saved_db = True
+
+    def collect_ghost(self):
+        """Give the ghost the stored best lap once the lookup has it; until then it has no trace."""
+        if not self.ghost_lookup.done(): return
+        best = self.ghost_lookup.best(self.players[0]["type"])
+        self.ghost_lookup = None
+        # A lap driven while the lookup ran may already beat it
+        if best and (not self.ghost.trace or best[1].lap_ms < self.ghost.trace.lap_ms):
+            self.ghost.driver, self.ghost.trace = best
+
+    def update_time_trial(self):
+        if self.ghost_lookup: self.collect_ghost()
+        car = self.cars[0]
+        lap_ms = (self.tick - self.lap_start) * 1000 // TICK_RATE
+        self.recorder.add(lap_ms, car.pos.x, car.pos.y, car.angle)
+        if car.laps != self.lap_count:
+            data = self.players[0]
+            trace = self.recorder.finish(lap_ms)
+            save_lap(self.db, self.assets.track_data["name"], data["type"], data["name"], trace)
+            if not self.ghost.trace or lap_ms < self.ghost.trace.lap_ms:
+                self.ghost.trace, self.ghost.driver = trace, data["name"]
+            self.last_lap_ms = lap_ms
+            if self.best_lap_ms is None or lap_ms < self.best_lap_ms: self.best_lap_ms = lap_ms
+            self.lap_count = car.laps
+            self.lap_start = self.tick
+            self.recorder = LapRecorder()
+            lap_ms = 0
+        self.ghost.follow(lap_ms)
+
+    def race_cars(self):
+        return self.cars + [c for c in self.remote_cars.values() if c not in self.cars]
+
+    # --- LAN RACE ---
+    def join_net_race(self):
+        from netplay import NetClient
+        data = self.players[0]
+        self.net = NetClient(self.connect, data["name"], data["type"], data["parts"])
+        self.remote_cars = {}
+        self.cars = []
+        self.state = "NET_WAIT"
+
+    def leave_net(self):
+        if self.net:
+            self.net.close()
+            self.net = None
+        self.remote_cars = {}
+
+    def update_net_wait(self):
+        from netplay import PHASE_COUNTDOWN
+        net = self.net
+        net.poll()
+        net.tick(0)
+        if net.track_name and net.track_name != self.assets.tracks.current_name:
+            # Only when the server names a different track, not every frame
+            self.assets.select_track_by_name(net.track_name)
+            self.assets.load_track()
+        track = self.assets.track_data
+        status = "CONNECTING..." if net.pid is None else f"WAITING FOR PLAYERS ({len(net.roster)})"
+        if net.pid is not None and track and track["name"] != net.track_name:
+            status = f"LOADING {net.track_name}..."
+        draw_text(self.screen, status, self.assets.font_header, NEON_ORANGE, SCREEN_WIDTH//2, SCREEN_HEIGHT//2, True)
+        if net.pid is None or not track or track["name"] != net.track_name or net.phase < PHASE_COUNTDOWN:
+            return
+        meta = track["meta"]
+        data = self.players[0]
+        sprite = self.assets.car_sprite(data["type"])
+        car = Car(*meta["spawns"][net.pid], meta["start_angle"], data["type"], NEON_ORANGE,
+                  "P1", data["parts"], self.assets.sounds, sprite, voice=0)
+        net.attach(car, track["collision"], meta)
+        self.cars = [car]
+        # Only the local car gets a view, so it has the whole screen
+        self.viewports = [Viewport(split_screen(1)[0], car, data["name"], car.color)]
+        self.minimap = Minimap(track)
+        self.replay = None # The server's recording is the one that counts
+        self.tick_debt = 0.0
+        self.saved_db = False
+        self.state = "RACE"
+        self.assets.sounds.play("start")
+
+    def update_net_race(self, ticks):
+        from netplay import PHASE_FINISHED, NO_WINNER
+        net = self.net
+        net.poll()
+        local = self.cars[0]
+        # One input and one predicted step per server tick, like a local race
+        for _ in range(ticks):
+            turning, throttle, brake = local.read_input()
+            events = net.tick(encode_input(turning, throttle, brake))
+            local.update_audio(throttle, events)
+
+        colors = [NEON_TEAL, YELLOW, RED]
+        for pid, (name, car_type) in net.roster.items():
+            if pid == net.pid: continue
+            state = net.remote_state(pid)
+            if not state: continue
+            car = self.remote_cars.get(pid)
+            if not car:
+                n = len(self.remote_cars)
+                car = Car(state[0], state[1], state[4], car_type if car_type in CHASSIS_STATS else "F1",
+                          colors[n % len(colors)], "NET", Parts(),
+                          self.assets.sounds, self.assets.car_sprite(car_type), voice=n + 1)
+                self.remote_cars[pid] = car
+            car.set_state(state)
+            car.update_audio(1, [])
+
+        # Server clock drives the lights and the timer
+        self.tick = net.clock
+        if net.phase == PHASE_FINISHED and net.winner != NO_WINNER:
+            name, car_type = net.roster.get(net.winner, ("?", "?"))
+            self.winner, self.win_car = name, car_type
+            # Only the winner's machine records the result
+            self.saved_db = self.saved_db or net.winner != net.pid
+            self.finish_race(self.race_ms())
+            self.leave_net()
+
     def update_race(self):
-        now = pygame.time.get_ticks()
-        time_diff = now - self.start_sequence_time
-        
-        # Countdown Logic (Visual only, Sound is played in start_race)
-        if time_diff < 4000: # Assuming 4 sec audio file
-            pass # Waiting for Go
-        elif not self.race_active:
-            self.race_active = True
-            self.race_start_time = now 
-        
-        mask = self.assets.track_data["mask"]
-        meta = self.assets.track_data["meta"]
-        
-        if self.race_active:
-            self.car1.update(mask, meta)
-            self.car2.update(mask, meta)
-        
-        if self.car1.pos.distance_to(self.car2.pos) < 45:
-            col_vec = (self.car1.pos - self.car2.pos).normalize()
-            force = 10.0
-            total = self.car1.mass + self.car2.mass
-            self.car1.vel += col_vec * (force * (self.car2.mass/total))
-            self.car2.vel -= col_vec * (force * (self.car1.mass/total))
-            self.car1.pos += col_vec * 5
-            self.assets.sounds.play("crash")
-
-        elapsed = now - self.race_start_time
-        if self.car1.laps > TOTAL_LAPS: 
-            self.winner = self.p1_data["name"]; self.win_car = self.p1_data["type"]
-            self.finish_race(elapsed)
-        elif self.car2.laps > TOTAL_LAPS: 
-            self.winner = self.p2_data["name"]; self.win_car = self.p2_data["type"]
-            self.finish_race(elapsed)
+        # Fixed ticks whatever the frame rate: a slow frame runs a few, and a
+        # longer stall is skipped rather than replayed at high speed
+        self.tick_debt += self.clock.get_time() * TICK_RATE / 1000
+        due = int(self.tick_debt)
+        self.tick_debt -= due
+        if self.net:
+            self.update_net_race(min(due, MAX_CATCHUP))
+            return
+        for _ in range(min(due, MAX_CATCHUP)):
+            if self.state != "RACE": break
+            self.race_tick()
+
+    def race_tick(self):
+        self.tick += 1
+        if self.tick <= COUNTDOWN_TICKS: return # Lights; the start sound was played in start_race
+        track = self.assets.track_data
+        inputs = [encode_input(*car.read_input()) for car in self.cars]
+        events, touched = step_race(self.cars, inputs, track["collision"], track["meta"])
+        self.replay.record(inputs, self.cars)
+        for car, bits, car_events in zip(self.cars, inputs, events):
+            car.update_audio(decode_input(bits)[1], car_events)
+        if touched: self.assets.sounds.play("crash")
+        if self.ghost: self.update_time_trial()
+
+        for car, data in zip(self.cars, self.players):
+            if car.laps > TOTAL_LAPS: 
+                self.winner = data["name"]; self.win_car = data["type"]
+                self.finish_race(self.best_lap_ms if self.ghost else self.race_ms())
+                break
+
+    def race_ms(self):
+        return max(0, self.tick - COUNTDOWN_TICKS) * 1000 // TICK_RATE
 
     def finish_race(self, elapsed_ms):
         mins = elapsed_ms // 60000
@@ -697,33 +881,54 @@ class Game:
         self.win_time_str = f"{mins:02}:{secs:02}:{mils:02}"
         
         # FIX: Stop engine sounds immediately on win
-        if self.car1: self.car1.stop_audio()
-        if self.car2: self.car2.stop_audio()
+        for car in self.race_cars(): car.stop_audio()
         
         if not self.saved_db:
             self.db.save_result(self.winner, self.win_car, self.win_time_str)
             self.saved_db = True
+        if self.replay:
+            # `python3 replay.py verify` re-runs this and checks every tick
+            self.replay.result = {"winner": self.winner, "car": self.win_car, "time": self.win_time_str}
+            try:
+                self.replay.save(LAST_RACE)
+            except OSError as e:
+                print(f"Could not save replay: {e}")
+            self.replay = None
         self.state = "WIN"
 
     def draw_menu(self, mx, my):
         draw_text(self.screen, "SPEED SHOW", self.assets.font_header, YELLOW, SCREEN_WIDTH//2, 150, True)
         draw_text(self.screen, "", self.assets.font_ui, WHITE, SCREEN_WIDTH//2, 220, True)
-        for btn in [self.btn_start, self.btn_exit]:
+        names = self.assets.track_names
+        track_name = names[self.assets.track_index] if names else "NO TRACKS"
+        draw_text(self.screen, "TRACK", self.assets.font_ui, WHITE, SCREEN_WIDTH//2, 275, True)
+        draw_text(self.screen, track_name, self.assets.font_big, NEON_CYAN, SCREEN_WIDTH//2, 315, True)
+        if names and self.assets.tracks.loading():
+            draw_text(self.screen, "building...", self.assets.font_ui, GREY, SCREEN_WIDTH//2, 350, True)
+        buttons = [self.btn_start, self.btn_trial, self.btn_exit, self.btn_track_prev, self.btn_track_next]
+        if self.connect:
+            draw_text(self.screen, f"LAN: {self.connect}", self.assets.font_big, NEON_CYAN, SCREEN_WIDTH//2, 625, True)
+        else:
+            draw_text(self.screen, f"PLAYERS: {self.num_players}", self.assets.font_big, NEON_CYAN, SCREEN_WIDTH//2, 625, True)
+            buttons += [self.btn_players_prev, self.btn_players_next]
+        for btn in buttons:
             btn.hovered = btn.check_click((mx, my))
             btn.draw(self.screen)
 
+    def draw_loading(self):
+        draw_text(self.screen, "LOADING TRACK...", self.assets.font_header, NEON_ORANGE, SCREEN_WIDTH//2, SCREEN_HEIGHT//2, True)
+
     def draw_setup_screen(self, mx, my, player_num):
         cx = SCREEN_WIDTH // 2
-        color = NEON_ORANGE if player_num == 1 else NEON_TEAL
-        data = self.p1_data if player_num == 1 else self.p2_data
+        color = PLAYER_COLORS[player_num - 1]
+        data = self.players[player_num - 1]
         
         draw_glass_panel(self.screen, cx-300, 50, 600, 620, color)
         draw_text(self.screen, f"PLAYER {player_num} SETUP", self.assets.font_header, color, cx, 100, True)
         draw_text(self.screen, "DRIVER NAME:", self.assets.font_ui, WHITE, cx, 180, True)
-        if player_num == 1: self.input_p1.draw(self.screen)
-        else: self.input_p2.draw(self.screen)
+        self.inputs[player_num - 1].draw(self.screen)
         
-        prev = self.assets.car_previews.get(data["type"])
+        prev = self.assets.car_preview(data["type"])
         if prev: 
             r = prev.get_rect(center=(cx, 370))
             self.screen.blit(prev, r)
@@ -738,132 +943,190 @@ class Game:
         self.btn_car_next.draw(self.screen)
         
         parts = data["parts"]
-        draw_text(self.screen, f"ENGINE: {ENGINES[parts['eng']]['name']}", self.assets.font_ui, WHITE, cx, 500, True)
-        draw_text(self.screen, f"TYRES: {TYRES[parts['tyre']]['name']}", self.assets.font_ui, WHITE, cx, 550, True)
-        draw_text(self.screen, f"BRAKES: {BRAKES[parts['brk']]['name']}", self.assets.font_ui, WHITE, cx, 600, True)
+        draw_text(self.screen, f"ENGINE: {ENGINES[parts.eng].name}", self.assets.font_ui, WHITE, cx, 500, True)
+        draw_text(self.screen, f"TYRES: {TYRES[parts.tyre].name}", self.assets.font_ui, WHITE, cx, 550, True)
+        draw_text(self.screen, f"BRAKES: {BRAKES[parts.brk].name}", self.assets.font_ui, WHITE, cx, 600, True)
         
         for item in self.part_btns:
             item["btn"].hovered = item["btn"].check_click((mx, my))
             item["btn"].draw(self.screen)
             
-        btn = self.btn_p1_next if player_num == 1 else self.btn_p2_race
+        btn = self.setup_button()
         btn.hovered = btn.check_click((mx, my))
         btn.draw(self.screen)
 
     def draw_race(self):
-        vis = self.assets.track_data["vis"]
-        
-        # --- PLAYER 1 VIEW ---
-        cam1_x = self.car1.pos.x - SCREEN_WIDTH/4
-        cam1_y = self.car1.pos.y - SCREEN_HEIGHT/2
-        self.screen.set_clip(pygame.Rect(0, 0, SCREEN_WIDTH//2, SCREEN_HEIGHT))
-        self.screen.blit(vis, (-cam1_x, -cam1_y))
-        
-        if self.assets.tree_img:
-            for tree in self.assets.scenery_objects:
-                tx, ty = tree['pos']
-                if abs(tx - self.car1.pos.x) < 1000 and abs(ty - self.car1.pos.y) < 800:
-                    t_rect = self.assets.tree_img.get_rect(center=(tx - cam1_x, ty - cam1_y))
-                    self.screen.blit(self.assets.tree_img, t_rect)
-
-        self.car1.draw(self.screen, cam1_x, cam1_y)
-        self.car2.draw(self.screen, cam1_x, cam1_y)
-        
-        draw_glass_panel(self.screen, 10, 10, 250, 90, NEON_ORANGE)
-        draw_text(self.screen, self.p1_data["name"], self.assets.font_big, NEON_ORANGE, 20, 20)
-        draw_text(self.screen, f"LAP: {self.car1.laps}/{TOTAL_LAPS}", self.assets.font_ui, WHITE, 20, 60)
-        speed = min(1.0, self.car1.vel.length() / 60.0)
-        pygame.draw.rect(self.screen, GREY, (20, 85, 200, 8))
-        pygame.draw.rect(self.screen, NEON_ORANGE, (20, 85, 200*speed, 8))
-        draw_text(self.screen, f"{int(self.car1.vel.length()*3)} KMH", self.assets.font_ui, WHITE, 230, 80)
+        track = self.assets.track_data
+        vis = track["vis"]
+        level = self.quality.level
+        tree = self.assets.tree_sprite(level.tree_scale * SCALE_MAX) if level.tree_density > 0 else None
+        pad_w, pad_h = tree.get_size() if tree else (0, 0) # The biggest tree decides the margin
+        cars = self.race_cars()
         
-        # --- PLAYER 2 VIEW ---
-        cam2_x = self.car2.pos.x - SCREEN_WIDTH*3/4
-        cam2_y = self.car2.pos.y - SCREEN_HEIGHT/2
-        self.screen.set_clip(pygame.Rect(SCREEN_WIDTH//2, 0, SCREEN_WIDTH//2, SCREEN_HEIGHT))
-        self.screen.blit(vis, (-cam2_x, -cam2_y))
+        # One culling pass for every view; each view then keeps what it overlaps
+        areas = [view.world_rect(pad_w, pad_h) for view in self.viewports]
+        scenery = track["scenery_grid"].query_rects(areas) if tree else []
+        if level.tree_density < 1.0:
+            scenery = [t for t in scenery if keeps_tree(t[0], t[1], level.tree_density)]
+        sizes = {} # Scenery scale -> (sprite, half width, half height)
         
-        if self.assets.tree_img:
-            for tree in self.assets.scenery_objects:
-                tx, ty = tree['pos']
-                if abs(tx - self.car2.pos.x) < 1000 and abs(ty - self.car2.pos.y) < 800:
-                    t_rect = self.assets.tree_img.get_rect(center=(tx - cam2_x, ty - cam2_y))
-                    self.screen.blit(self.assets.tree_img, t_rect)
-
-        self.car1.draw(self.screen, cam2_x, cam2_y)
-        self.car2.draw(self.screen, cam2_x, cam2_y)
-        
-        hud_x = SCREEN_WIDTH - 260
-        draw_glass_panel(self.screen, hud_x, 10, 250, 90, NEON_TEAL)
-        draw_text(self.screen, self.p2_data["name"], self.assets.font_big, NEON_TEAL, hud_x+10, 20)
-        draw_text(self.screen, f"LAP: {self.car2.laps}/{TOTAL_LAPS}", self.assets.font_ui, WHITE, hud_x+10, 60)
-        speed2 = min(1.0, self.car2.vel.length() / 60.0)
-        pygame.draw.rect(self.screen, GREY, (hud_x+10, 85, 200, 8))
-        pygame.draw.rect(self.screen, NEON_TEAL, (hud_x+10, 85, 200*speed2, 8))
-        draw_text(self.screen, f"{int(self.car2.vel.length()*3)} KMH", self.assets.font_ui, WHITE, hud_x-80, 80)
+        for view, area in zip(self.viewports, areas):
+            off_x, off_y = view.offset()
+            self.screen.set_clip(view.rect)
+            self.screen.blit(vis, (-off_x, -off_y))
+            
+            if tree:
+                # Lower levels leave out the trees towards the edges of the view
+                cx, cy = view.car.pos
+                reach2 = level.tree_range ** 2 * (view.rect.w ** 2 + view.rect.h ** 2) / 4
+                for tx, ty, s in scenery:
+                    if area.collidepoint(tx, ty) and (tx - cx) ** 2 + (ty - cy) ** 2 <= reach2:
+                        if s not in sizes:
+                            sprite = self.assets.tree_sprite(level.tree_scale * s)
+                            sizes[s] = (sprite, sprite.get_width() // 2, sprite.get_height() // 2)
+                        sprite, tw, th = sizes[s]
+                        self.screen.blit(sprite, (tx - off_x - tw, ty - off_y - th))
+
+            car_area = area.inflate(100, 100)
+            if self.ghost and self.ghost.trace and car_area.collidepoint(self.ghost.pos.x, self.ghost.pos.y):
+                self.ghost.draw(self.screen, off_x, off_y)
+            for car in cars:
+                if car_area.collidepoint(car.pos.x, car.pos.y): car.draw(self.screen, off_x, off_y)
+            
+            self.draw_hud(view)
 
         self.screen.set_clip(None)
-        pygame.draw.line(self.screen, BLACK, (SCREEN_WIDTH//2, 0), (SCREEN_WIDTH//2, SCREEN_HEIGHT), 5)
+        # Split lines between views
+        for view in self.viewports:
+            if view.rect.x > 0:
+                pygame.draw.line(self.screen, BLACK, view.rect.topleft, view.rect.bottomleft, 5)
+            if view.rect.y > 0:
+                pygame.draw.line(self.screen, BLACK, view.rect.topleft, view.rect.topright, 5)
         
         self.draw_minimap()
         
-        elapsed = pygame.time.get_ticks() - self.start_sequence_time
+        elapsed = self.tick * 1000 // TICK_RATE
         if elapsed < 3000:
             box_x = SCREEN_WIDTH//2 - 120
-            draw_glass_panel(self.screen, box_x, 150, 240, 100, BLACK)
+            draw_glass_panel(self.screen, box_x, 150, 240, 100, BLACK, level.glass)
             lights = 1 if elapsed < 1000 else (2 if elapsed < 2000 else 3)
             for i in range(3):
                 col = RED if i < lights else (50, 0, 0)
                 pygame.draw.circle(self.screen, col, (box_x + 40 + i*80, 200), 30)
         elif elapsed < 4000:
             box_x = SCREEN_WIDTH//2 - 120
-            draw_glass_panel(self.screen, box_x, 150, 240, 100, BLACK)
+            draw_glass_panel(self.screen, box_x, 150, 240, 100, BLACK, level.glass)
             for i in range(3):
                 pygame.draw.circle(self.screen, GREEN, (box_x + 40 + i*80, 200), 30)
             self.draw_timer()
         else:
             self.draw_timer()
+        if self.ghost: self.draw_lap_times()
+
+    def draw_lap_times(self):
+        x = SCREEN_WIDTH - 260
+        draw_glass_panel(self.screen, x, 10, 250, 90, WHITE, self.quality.level.glass)
+        lap = (self.tick - self.lap_start) * 1000 // TICK_RATE if self.tick > COUNTDOWN_TICKS else 0
+        best = self.ghost.trace.lap_ms if self.ghost.trace else None
+        draw_text(self.screen, f"LAP   {format_time(lap)}", self.assets.font_ui, WHITE, x+10, 18)
+        draw_text(self.screen, f"LAST  {format_time(self.last_lap_ms)}", self.assets.font_ui, WHITE, x+10, 44)
+        draw_text(self.screen, f"BEST  {format_time(best)}  {self.ghost.driver}", self.assets.font_ui, YELLOW, x+10, 70)
+
+    def draw_hud(self, view):
+        car = view.car
+        # Views on the right edge keep their panel in the outer corner
+        right = view.rect.x > 0 and view.rect.right == SCREEN_WIDTH
+        hud_x = view.rect.right - 260 if right else view.rect.x + 10
+        hud_y = view.rect.y + 10
+        draw_glass_panel(self.screen, hud_x, hud_y, 250, 90, view.color, self.quality.level.glass)
+        draw_text(self.screen, view.name, self.assets.font_big, view.color, hud_x+10, hud_y+10)
+        draw_text(self.screen, f"LAP: {car.laps}/{TOTAL_LAPS}", self.assets.font_ui, WHITE, hud_x+10, hud_y+50)
+        speed = min(1.0, car.vel.length() / 60.0)
+        pygame.draw.rect(self.screen, GREY, (hud_x+10, hud_y+75, 200, 8))
+        pygame.draw.rect(self.screen, view.color, (hud_x+10, hud_y+75, 200*speed, 8))
+        kmh_x = hud_x-80 if right else hud_x+220
+        draw_text(self.screen, f"{int(car.vel.length()*3)} KMH", self.assets.font_ui, WHITE, kmh_x, hud_y+70)
 
     def draw_timer(self):
-        race_time = pygame.time.get_ticks() - self.race_start_time
+        race_time = self.race_ms()
         mins = race_time // 60000
         secs = (race_time // 1000) % 60
         mils = (race_time % 1000) // 10
         timer_str = f"{mins:02}:{secs:02}:{mils:02}"
-        draw_glass_panel(self.screen, SCREEN_WIDTH//2 - 100, SCREEN_HEIGHT-60, 200, 50, BLACK)
+        draw_glass_panel(self.screen, SCREEN_WIDTH//2 - 100, SCREEN_HEIGHT-60, 200, 50, BLACK, self.quality.level.glass)
         draw_text(self.screen, timer_str, self.assets.font_big, YELLOW, SCREEN_WIDTH//2, SCREEN_HEIGHT-35, True)
 
     def draw_minimap(self):
-        track_mini = self.assets.track_data["mini"]
-        meta = self.assets.track_data["meta"]
-        
-        map_w, map_h = track_mini.get_size()
-        real_w, real_h = meta["crop_size"]
-        offset_x, offset_y = meta["crop_offset"]
-        
-        map_x = (SCREEN_WIDTH // 2) - (map_w // 2)
-        map_y = 10
-        
-        # --- NEW: NO BLACK BOX, JUST THE TRANSPARENT TRACK ---
-        self.screen.blit(track_mini, (map_x, map_y))
-        
-        scale_x = map_w / real_w 
-        scale_y = map_h / real_h
-        
-        p1_x = map_x + ((self.car1.pos.x - offset_x) * scale_x)
-        p1_y = map_y + ((self.car1.pos.y - offset_y) * scale_y)
-        pygame.draw.circle(self.screen, NEON_ORANGE, (int(p1_x), int(p1_y)), 5)
-        
-        p2_x = map_x + ((self.car2.pos.x - offset_x) * scale_x)
-        p2_y = map_y + ((self.car2.pos.y - offset_y) * scale_y)
-        pygame.draw.circle(self.screen, NEON_TEAL, (int(p2_x), int(p2_y)), 5)
+        # --- NO BLACK BOX, JUST THE TRANSPARENT TRACK ---
+        self.minimap.update(self.race_cars())
+        self.minimap.draw(self.screen, (SCREEN_WIDTH // 2) - (self.minimap.size // 2), 10)
+
+    def draw_debug_overlay(self):
+        q = self.quality
+        mode = "locked" if q.locked else "auto"
+        draw_glass_panel(self.screen, 10, SCREEN_HEIGHT - 70, 260, 60, GREY)
+        draw_text(self.screen, f"FPS {self.clock.get_fps():.0f}   work {self.clock.get_rawtime()} ms",
+                  self.assets.font_ui, WHITE, 20, SCREEN_HEIGHT - 64)
+        draw_text(self.screen, f"QUALITY {q.level.name} ({mode}) {q.index + 1}/{len(QUALITY_LEVELS)}",
+                  self.assets.font_ui, NEON_CYAN, 20, SCREEN_HEIGHT - 38)
 
     def draw_win(self):
         draw_glass_panel(self.screen, SCREEN_WIDTH//2-300, 200, 600, 300, BLACK)
-        draw_text(self.screen, f"{self.winner} WINS!", self.assets.font_header, NEON_CYAN, SCREEN_WIDTH//2, 250, True)
-        draw_text(self.screen, f"TIME: {self.win_time_str}", self.assets.font_big, WHITE, SCREEN_WIDTH//2, 320, True)
-        draw_text(self.screen, "Stats Saved!", self.assets.font_ui, GREEN, SCREEN_WIDTH//2, 400, True)
+        if self.time_trial:
+            draw_text(self.screen, "TIME TRIAL", self.assets.font_header, NEON_CYAN, SCREEN_WIDTH//2, 250, True)
+            draw_text(self.screen, f"BEST LAP: {self.win_time_str}", self.assets.font_big, WHITE, SCREEN_WIDTH//2, 320, True)
+            draw_text(self.screen, "Ghost Saved!", self.assets.font_ui, GREEN, SCREEN_WIDTH//2, 400, True)
+        else:
+            draw_text(self.screen, f"{self.winner} WINS!", self.assets.font_header, NEON_CYAN, SCREEN_WIDTH//2, 250, True)
+            draw_text(self.screen, f"TIME: {self.win_time_str}", self.assets.font_big, WHITE, SCREEN_WIDTH//2, 320, True)
+            draw_text(self.screen, "Stats Saved!", self.assets.font_ui, GREEN, SCREEN_WIDTH//2, 400, True)
         draw_text(self.screen, "Click to Menu", self.assets.font_ui, WHITE, SCREEN_WIDTH//2, 450, True)
 
+    # --- RENDER BENCHMARK ---
+    def bench_render(self, frames):
+        """Print the best-of-3 draw_race() time with 1, 2 and 4 views on the first track."""
+        self.assets.load_track()
+        self.assets.tracks.wait()
+        track = self.assets.track_data
+        if not track: return
+        cl = track["centreline"]
+        print(f"{track['name']}: {len(track['scenery'])} trees, {frames} frames per run, quality {self.quality.level.name}")
+        for n in (1, 2, 4):
+            self.num_players = n
+            self.start_race()
+            self.tick = COUNTDOWN_TICKS # Past the start lights
+            best = None
+            for run in range(3):
+                pygame.event.pump()
+                started = time.perf_counter()
+                for frame in range(frames):
+                    # Cars spread round the lap, so each view shows different scenery
+                    for i, car in enumerate(self.cars):
+                        car.pos.update(cl[(frame * 3 + i * len(cl) // 5) % len(cl)])
+                        car.angle = (frame * 2 + i * 40) % 360
+                    self.draw_race()
+                ms = (time.perf_counter() - started) * 1000 / frames
+                best = ms if best is None else min(best, ms)
+            print(f"  {n} view(s): {best:.2f} ms/frame")
+
 if __name__ == "__main__":
-    Game().run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Speed Show racing game")
+    parser.add_argument("--connect", metavar="HOST[:PORT]", help="Join a LAN race server (see netplay.py)")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print how long each startup step takes, and each deferred load as it happens")
+    parser.add_argument("--debug-blits", action="store_true",
+                        help="Report surfaces that take a slow blit path (format conversion, needless alpha, no RLE)")
+    parser.add_argument("--bench-render", type=int, metavar="FRAMES",
+                        help="Time FRAMES race frames with 1, 2 and 4 views instead of playing")
+    parser.add_argument("--quality", choices=["auto"] + [level.name.lower() for level in QUALITY_LEVELS],
+                        help="Render at one quality level instead of adapting to the frame rate")
+    parser.add_argument("--debug-overlay", action="store_true", help="Start with the FPS / quality overlay on (F3)")
+    args = parser.parse_args()
+    PROFILE_STARTUP = args.profile_startup
+    if args.quality: QUALITY_LOCK = None if args.quality == "auto" else args.quality
+    DEBUG_OVERLAY = DEBUG_OVERLAY or args.debug_overlay
+    surfaces.DEBUG_BLITS = args.debug_blits
+    if args.bench_render:
+        Game().bench_render(args.bench_render)
+    else:
+        Game(connect=args.connect).run()
\ No newline at end of file
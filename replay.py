@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""replay.py — Recorded races, and a tool that re-runs them to check them.
+
+A replay holds everything a race depends on: the track (name and spec
+digest), each car's type, parts and grid slot, and the input byte every car
+used on every tick. After each tick it also stores physics.state_hash() of
+every car. Feeding the inputs back through physics.step_race() must give
+the same hashes. The first tick that doesn't is where the two runs
+diverged, which is how a recorded lap time is trusted and a desync pinned
+down.
+
+On disk: a short JSON header, then the zlib-compressed input and hash
+arrays (about 15 kB per car per minute, nearly all of it hashes).
+
+Run:
+  python3 replay.py verify replays/last_race.rpl [more.rpl ...]
+  python3 replay.py info replays/last_race.rpl
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+from physics import TICK_RATE, CarPhysics, Parts, state_hash, step_race
+from track_library import load_layout, load_library
+
+REPLAY_DIR = "replays"
+LAST_RACE = os.path.join(REPLAY_DIR, "last_race.rpl")
+
+MAGIC = b"SSRP"
+VERSION = 1
+_HEADER = struct.Struct("<4sBI") # magic, version, JSON header length
+
+
+def format_ticks(ticks):
+    ms = ticks * 1000 // TICK_RATE
+    return f"{ms // 60000:02}:{(ms // 1000) % 60:02}:{(ms % 1000) // 10:02}"
+
+
+class Replay:
+    def __init__(self, track, digest, cars, laps, result=None):
+        self.track = track   # Track name
+        self.digest = digest # TrackSpec.digest() at recording time
+        self.cars = cars     # [(car type, (eng, tyre, brk), spawn index), ...]
+        self.laps = laps
+        self.result = result or {} # What the recording side saw, e.g. winner and ticks
+        self.inputs = [array("B") for _ in cars]
+        self.hashes = [array("I") for _ in cars]
+
+    @property
+    def ticks(self):
+        return len(self.inputs[0]) if self.inputs else 0
+
+    def record(self, inputs, cars):
+        """Append one tick: the input bytes just simulated and the cars after it."""
+        for i, car in enumerate(cars):
+            self.inputs[i].append(inputs[i])
+            self.hashes[i].append(state_hash(car))
+
+    # --- FILES ---
+    def to_bytes(self):
+        header = json.dumps({"track": self.track, "digest": self.digest, "laps": self.laps,
+                             "cars": self.cars, "ticks": self.ticks, "result": self.result}).encode()
+        body = array("B")
+        for channel in self.inputs: body.frombytes(channel.tobytes())
+        hashes = array("I")
+        for channel in self.hashes: hashes.extend(channel)
+        if sys.byteorder == "big": hashes.byteswap()
+        return _HEADER.pack(MAGIC, VERSION, len(header)) + header + zlib.compress(body.tobytes() + hashes.tobytes(), 6)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, size = _HEADER.unpack_from(data)
+        if magic != MAGIC: raise ValueError("not a replay file")
+        if version != VERSION: raise ValueError(f"unknown replay version {version}")
+        head = json.loads(data[_HEADER.size:_HEADER.size + size])
+        cars = [(t, tuple(parts), spawn) for t, parts, spawn in head["cars"]]
+        replay = cls(head["track"], head["digest"], cars, head["laps"], head["result"])
+        raw = zlib.decompress(data[_HEADER.size + size:])
+        n, ticks = len(cars), head["ticks"]
+        if len(raw) != n * ticks * 5: raise ValueError("truncated replay")
+        hashes = array("I")
+        hashes.frombytes(raw[n * ticks:])
+        if sys.byteorder == "big": hashes.byteswap()
+        for i in range(n):
+            replay.inputs[i].frombytes(raw[i * ticks:(i + 1) * ticks])
+            replay.hashes[i] = hashes[i * ticks:(i + 1) * ticks]
+        return replay
+
+    def save(self, path=LAST_RACE):
+        folder = os.path.dirname(path)
+        if folder: os.makedirs(folder, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+# --- RE-SIMULATION ---
+def replay_cars(replay, meta):
+    """Fresh cars on the grid, as they were when the recording started."""
+    return [CarPhysics(*meta["spawns"][spawn], meta["start_angle"], car_type, Parts(*parts))
+            for car_type, parts, spawn in replay.cars]
+
+
+def verify(replay, track):
+    """Re-run a replay on a track dict (load_layout is enough).
+
+    Returns (divergence, cars, lap_ticks): divergence is None or (tick, car
+    index) of the first hash that differs, cars are the re-simulated cars
+    where the run stopped, and lap_ticks[i] the ticks at which car i
+    completed each lap.
+    """
+    collision, meta = track["collision"], track["meta"]
+    cars = replay_cars(replay, meta)
+    lap_ticks = [[] for _ in cars]
+    for t in range(replay.ticks):
+        laps = [car.laps for car in cars]
+        step_race(cars, [inputs[t] for inputs in replay.inputs], collision, meta)
+        for i, car in enumerate(cars):
+            if car.laps != laps[i]: lap_ticks[i].append(t + 1)
+            if state_hash(car) != replay.hashes[i][t]:
+                return (t, i), cars, lap_ticks
+    return None, cars, lap_ticks
+
+
+def describe(replay):
+    cars = ", ".join(f"{t} ({'/'.join(map(str, parts))})" for t, parts, _ in replay.cars)
+    return f"{replay.track}, {len(replay.cars)} car(s): {cars}; {replay.ticks} ticks ({format_ticks(replay.ticks)})"
+
+
+def verify_file(path, specs):
+    try:
+        replay = Replay.load(path)
+    except (OSError, ValueError, zlib.error) as e:
+        print(f"{path}: cannot read: {e}")
+        return False
+    spec = specs.get(replay.track)
+    if not spec:
+        print(f"{path}: track {replay.track!r} is not in the library")
+        return False
+    print(f"{path}: {describe(replay)}")
+    if spec.digest() != replay.digest:
+        print("  warning: the track has changed since this was recorded")
+    divergence, cars, lap_ticks = verify(replay, load_layout(spec))
+    if divergence:
+        tick, i = divergence
+        car = cars[i]
+        print(f"  DIVERGED at tick {tick} ({format_ticks(tick)} into the race): car {i} ({replay.cars[i][0]})")
+        print(f"  re-simulated: pos ({car.pos.x:.6f}, {car.pos.y:.6f}) vel ({car.vel.x:.6f}, {car.vel.y:.6f}) "
+              f"angle {car.angle:.6f} lap {car.laps}")
+        return False
+    print(f"  OK: all {replay.ticks} ticks match")
+    for i, ticks in enumerate(lap_ticks):
+        if not ticks: continue
+        laps = [format_ticks(b - a) for a, b in zip([0] + ticks, ticks)]
+        print(f"  car {i} ({replay.cars[i][0]}) laps: {'  '.join(laps)}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check recorded races by re-simulating them")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_verify = sub.add_parser("verify", help="Re-run replays and report the first tick that differs")
+    p_verify.add_argument("files", nargs="+")
+    p_info = sub.add_parser("info", help="Print what a replay holds")
+    p_info.add_argument("file")
+    args = parser.parse_args()
+
+    if args.cmd == "info":
+        replay = Replay.load(args.file)
+        print(describe(replay))
+        print(f"track digest {replay.digest}, {replay.laps} laps, result {replay.result}")
+        return
+    specs = load_library()
+    ok = [verify_file(path, specs) for path in args.files]
+    sys.exit(0 if all(ok) else 1)
+
+
+if __name__ == "__main__":
+    main()
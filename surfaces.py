@@ -0,0 +1,126 @@
+"""surfaces.py — Display-format surfaces and the blit paths they take.
+
+pygame blits fastest between surfaces that share the display's pixel
+layout. An opaque surface is copied row by row; a colorkey or per-pixel
+alpha surface marked RLEACCEL is run-length encoded on its first blit, after
+which transparent runs are skipped and opaque runs copied without blending.
+The slow paths are a source in another layout (converted on every blit), an
+alpha channel that is opaque everywhere (blended for nothing) and a static
+sprite with no RLE.
+
+Render code makes and prepares its surfaces here so they come out in the
+right layout once. With DEBUG_BLITS on (--debug-blits), every surface that
+goes through check() is classified against the display and the first slow
+path per label is printed.
+"""
+
+import pygame
+
+DEBUG_BLITS = False
+OPAQUE_FLOOR = 0xF0 # Alpha at or above this is snapped to fully opaque
+RLE_WORTH = 0.25    # Fraction of clear or solid pixels that makes RLE pay off
+
+_reported = set() # (label, reason) already printed
+
+
+def display_ready():
+    return pygame.display.get_surface() is not None
+
+
+def same_layout(a, b):
+    """True if pixels of `a` can be copied to `b` without converting them."""
+    return a.get_bitsize() == b.get_bitsize() and a.get_masks()[:3] == b.get_masks()[:3]
+
+
+# --- CREATION ---
+def opaque(size):
+    """Surface in the display's layout with no alpha (plain 32-bit without a display)."""
+    surface = pygame.Surface(size)
+    display = pygame.display.get_surface()
+    # Surface() copies the display's layout when there is one; converting
+    # anyway would briefly hold two copies of a world-sized track image
+    if display and not same_layout(surface, display): surface = surface.convert()
+    return surface
+
+
+def translucent(size):
+    """Per-pixel alpha surface in the display's layout, filled transparent."""
+    surface = pygame.Surface(size, pygame.SRCALPHA)
+    return surface.convert_alpha() if display_ready() else surface
+
+
+def prepare_opaque(surface, label="opaque"):
+    """Drop the alpha channel of a surface that covers every pixel anyway."""
+    if display_ready(): surface = surface.convert()
+    check(surface, label)
+    return surface
+
+
+def prepare_sprite(surface, label="sprite", rle=True):
+    """Display-format copy of an alpha sprite with its near-opaque pixels made solid.
+
+    Scaling leaves the inside of a sprite at alpha 253 or so, which turns
+    every pixel into a blend; snapped to 255 those become copies. Leave
+    `rle` off for surfaces that are modified or rotated after this, since
+    touching the pixels of an RLE surface decodes it again.
+    """
+    surface = surface.convert_alpha() if display_ready() else surface.copy()
+    solid = pygame.mask.from_surface(surface, OPAQUE_FLOOR - 1)
+    if solid.count():
+        full = surface.copy()
+        full.fill((0, 0, 0, 255), special_flags=pygame.BLEND_RGBA_MAX)
+        solid.to_surface(surface, setsurface=full, unsetcolor=None)
+    if rle: surface.set_alpha(255, pygame.RLEACCEL)
+    check(surface, label, dynamic=not rle)
+    return surface
+
+
+def prepare_keyed(surface, key, label="keyed", alpha=None):
+    """Opaque surface whose `key` colour is see-through, RLE encoded.
+
+    For sprites with hard edges; pygame.transform.rotate keeps the key and
+    fills the new corners with it. `alpha` adds whole-surface translucency.
+    """
+    if display_ready(): surface = surface.convert()
+    surface.set_colorkey(key, pygame.RLEACCEL)
+    if alpha is not None: surface.set_alpha(alpha, pygame.RLEACCEL)
+    check(surface, label)
+    return surface
+
+
+# --- DEBUG ---
+def blit_path(src, dst=None):
+    """(path name, reason it's slow or None) for blitting src onto dst (the display by default)."""
+    dst = dst or pygame.display.get_surface()
+    flags = src.get_flags()
+    rle = bool(flags & (pygame.RLEACCEL | pygame.RLEACCELOK))
+    per_pixel = src.get_masks()[3] != 0
+    if src.get_colorkey() is not None: name = "colorkey"
+    elif per_pixel: name = "per-pixel alpha"
+    elif src.get_alpha() not in (None, 255): name = "surface alpha"
+    else: name = "opaque copy"
+    if rle: name += " (RLE)"
+    if dst is not None and not same_layout(src, dst):
+        return name, f"{src.get_bitsize()}-bit source is converted on every blit"
+    if per_pixel and src.get_width() and src.get_height():
+        total = src.get_width() * src.get_height()
+        solid = pygame.mask.from_surface(src, 254).count()
+        if solid == total and src.get_colorkey() is None:
+            return name, "alpha channel is opaque everywhere"
+        if not rle and (solid + total - pygame.mask.from_surface(src, 0).count()) / total >= RLE_WORTH:
+            return name, "mostly clear or solid pixels but no RLE"
+    return name, None
+
+
+def check(surface, label, dynamic=False):
+    """With DEBUG_BLITS on, print the first slow path seen for `label`.
+
+    `dynamic` surfaces are redrawn or replaced all the time, so RLE (which
+    is paid for again after every change) isn't expected of them.
+    """
+    if not DEBUG_BLITS or not display_ready(): return
+    name, reason = blit_path(surface)
+    if reason and dynamic and "RLE" in reason: reason = None
+    if reason and (label, reason) not in _reported:
+        _reported.add((label, reason))
+        print(f"Slow blit: {label} {surface.get_size()} via {name}: {reason}")
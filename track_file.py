@@ -0,0 +1,131 @@
+"""track_file.py — Flat binary track files that any process can map read-only.
+
+A track file is a small JSON header followed by typed arrays, each starting
+on a 64-byte boundary, all little-endian:
+
+    magic "SSTK", version, JSON length    (struct "<4sBI")
+    JSON header                           name, digest, meta, ... and the
+                                          section table {name: [typecode,
+                                          offset from the data start, count]}
+    padding, then the sections
+
+TrackFile maps the file with mmap and hands out memoryview (or NumPy) views
+straight onto the mapping, so opening one copies nothing: every process that
+maps the same file shares one physical copy of its pages, and attaching
+costs a header parse. track_library writes the bake cache in this format and
+decides what goes in it.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+MAGIC = b"SSTK"
+VERSION = 1
+ALIGN = 64 # Section alignment: a cache line, and enough for any NumPy dtype
+_HEADER = struct.Struct("<4sBI") # magic, version, JSON header length
+
+_NUMPY_TYPES = {"d": "<f8", "f": "<f4", "i": "<i4", "I": "<u4"}
+
+
+def _aligned(n):
+    return -(-n // ALIGN) * ALIGN
+
+
+def write(path, header, sections):
+    """Write `header` (a JSON-able dict) and `sections` ({name: array}) to `path`.
+
+    The file is written next to `path` and renamed over it, so a process
+    mapping `path` at the same time sees the old file or the new one, never
+    half of either.
+    """
+    table = {}
+    offset = 0
+    for name, data in sections.items():
+        if data.typecode not in _NUMPY_TYPES: raise ValueError(f"unsupported typecode {data.typecode!r}")
+        table[name] = [data.typecode, offset, len(data)]
+        offset = _aligned(offset + len(data) * data.itemsize)
+    head = json.dumps(dict(header, sections=table)).encode()
+    start = _aligned(_HEADER.size + len(head))
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, len(head)) + head)
+            for name, data in sections.items():
+                f.write(bytes(start + table[name][1] - f.tell()))
+                if sys.byteorder == "big":
+                    data = array(data.typecode, data)
+                    data.byteswap()
+                f.write(data.tobytes())
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp): os.remove(tmp)
+        raise
+
+
+class PointList:
+    """Read-only sequence of (x, y) tuples over a flat [x0, y0, x1, y1, ...] buffer."""
+    __slots__ = ("xy",)
+
+    def __init__(self, xy):
+        self.xy = xy
+
+    def __len__(self):
+        return len(self.xy) // 2
+
+    def __getitem__(self, i):
+        if i < 0: i += len(self)
+        return self.xy[2 * i], self.xy[2 * i + 1]
+
+    def __iter__(self):
+        return zip(self.xy[0::2], self.xy[1::2])
+
+
+class TrackFile:
+    """A track file mapped read-only.
+
+    The mapping stays alive as long as any view of it does, so callers can
+    keep the views and drop the TrackFile.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < _HEADER.size: raise ValueError("not a track file")
+        magic, version, size = _HEADER.unpack_from(self._map)
+        if magic != MAGIC: raise ValueError("not a track file")
+        if version != VERSION: raise ValueError(f"unknown track file version {version}")
+        self.header = json.loads(self._map[_HEADER.size:_HEADER.size + size])
+        self._start = _aligned(_HEADER.size + size)
+        self.sections = self.header.pop("sections")
+        for name, (code, offset, count) in self.sections.items():
+            if self._start + offset + count * array(code).itemsize > len(self._map):
+                raise ValueError(f"truncated track file (section {name})")
+
+    def _span(self, name):
+        code, offset, count = self.sections[name]
+        begin = self._start + offset
+        return code, begin, begin + count * array(code).itemsize
+
+    def view(self, name):
+        """Zero-copy memoryview of a section (a copy on big-endian machines)."""
+        code, begin, end = self._span(name)
+        if sys.byteorder == "big":
+            data = array(code, self._map[begin:end])
+            data.byteswap()
+            return data
+        return memoryview(self._map)[begin:end].cast(code)
+
+    def numpy(self, name):
+        """Read-only NumPy array of a section, sharing the mapping. Needs numpy."""
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("TrackFile.numpy() needs the numpy package: pip install numpy") from None
+        code, offset, count = self.sections[name]
+        return numpy.frombuffer(self._map, _NUMPY_TYPES[code], count, self._start + offset)
@@ -0,0 +1,551 @@
+"""track_library.py — Track definitions, baking and on-demand loading.
+
+Every circuit lives in its own JSON file inside tracks/ (see TrackSpec for the
+format). The game never holds more than one built track: TrackLoader builds
+the selected one in a background thread and drops the previous one first.
+
+Cheap-to-store but slow-to-compute artifacts (centreline and its arc
+lengths, meta, the collision index and scenery) are baked to track_cache/
+keyed by a digest of the spec, so only the large world surfaces are
+repainted when a track is selected again. The bake is a flat binary file
+(see track_file.py) that load_layout() maps read-only: the game, a server
+and any number of tool or simulation processes on one machine share a
+single copy of it.
+"""
+
+import hashlib
+import json
+import math
+import os
+import threading
+from array import array
+
+import pygame
+
+import surfaces
+import track_file
+from scenery import SceneryGrid, SceneryLayer, scatter_band
+
+TRACK_DIR = "tracks"
+BAKE_DIR = "track_cache"
+BAKE_VERSION = 5
+MAP_SIZE = 20000
+
+# COLORS (track paint)
+WHITE = (255, 255, 255)
+BLACK = (10, 10, 15)
+GREEN = (34, 100, 34)
+ASPHALT = (40, 40, 45)
+KERB_RED = (200, 0, 0)
+KERB_WHITE = (220, 220, 220)
+
+
+class TrackSpec:
+    """One entry of the track library.
+
+    JSON layout (all keys but "name" and "points" are optional):
+        name           display name shown in the menu
+        points         closed list of [x, y] control points in world pixels
+        track_width    asphalt width
+        kerb_width     kerb band width (drawn under the asphalt)
+        wall_width     drivable width; anything further from the centreline is wall
+        scenery_seed   seed for tree placement, so every run looks the same
+        scenery_count  number of trees to place
+        scenery_band   width of the off-track strip trees are scattered in
+        checkpoints    list of {"at": 0..1 fraction along the lap, "size": px}
+                       that must all be crossed in order before a lap counts
+    """
+
+    def __init__(self, name, points, track_width=400, kerb_width=480, wall_width=550,
+                 scenery_seed=0, scenery_count=1500, scenery_band=1500, checkpoints=None,
+                 map_size=MAP_SIZE):
+        self.name = name
+        self.points = [(int(p[0]), int(p[1])) for p in points]
+        self.track_width = track_width
+        self.kerb_width = kerb_width
+        self.wall_width = wall_width
+        self.scenery_seed = scenery_seed
+        self.scenery_count = scenery_count
+        self.scenery_band = scenery_band
+        self.checkpoints = checkpoints if checkpoints else [{"at": 0.5, "size": 600}]
+        self.map_size = map_size
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["name"], data["points"],
+            track_width=data.get("track_width", 400),
+            kerb_width=data.get("kerb_width", 480),
+            wall_width=data.get("wall_width", 550),
+            scenery_seed=data.get("scenery_seed", 0),
+            scenery_count=data.get("scenery_count", 1500),
+            scenery_band=data.get("scenery_band", 1500),
+            checkpoints=data.get("checkpoints"),
+            map_size=data.get("map_size", MAP_SIZE),
+        )
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "points": [list(p) for p in self.points],
+            "track_width": self.track_width,
+            "kerb_width": self.kerb_width,
+            "wall_width": self.wall_width,
+            "scenery_seed": self.scenery_seed,
+            "scenery_count": self.scenery_count,
+            "scenery_band": self.scenery_band,
+            "checkpoints": self.checkpoints,
+            "map_size": self.map_size,
+        }
+
+    def digest(self):
+        """Short hash of everything that changes the built track."""
+        raw = json.dumps([BAKE_VERSION, self.to_dict()], sort_keys=True)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def slugify(name):
+    slug = "".join(ch.lower() if ch.isalnum() else "_" for ch in name).strip("_")
+    return slug or "track"
+
+
+def load_spec(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return TrackSpec.from_dict(json.load(f))
+
+
+def save_spec(spec, track_dir=TRACK_DIR):
+    """Write `spec` to track_dir/<slug>.json and return the path."""
+    os.makedirs(track_dir, exist_ok=True)
+    path = os.path.join(track_dir, slugify(spec.name) + ".json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(spec.to_dict(), f, indent=2)
+    return path
+
+
+def load_library(track_dir=TRACK_DIR):
+    """Read every track spec in `track_dir`. Only the small JSON is parsed here."""
+    specs = {}
+    if not os.path.isdir(track_dir):
+        return specs
+    for filename in sorted(os.listdir(track_dir)):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            spec = load_spec(os.path.join(track_dir, filename))
+            specs[spec.name] = spec
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Skipping track {filename}: {e}")
+    return specs
+
+
+# --- GEOMETRY ---
+def catmull_rom_spline(points, steps=30):
+    points = [points[-1]] + list(points) + [points[0], points[1]]
+    curve = []
+    for i in range(len(points) - 3):
+        curve.extend(catmull_rom_segment(points[i], points[i+1], points[i+2], points[i+3], steps))
+    return curve
+
+
+def catmull_rom_segment(p0, p1, p2, p3, steps=30):
+    """Samples of the curve between p1 and p2 (p2 itself excluded)."""
+    seg = []
+    for t in range(steps):
+        t /= steps
+        q0 = -t**3 + 2*t**2 - t
+        q1 = 3*t**3 - 5*t**2 + 2
+        q2 = -3*t**3 + 4*t**2 + t
+        q3 = t**3 - t**2
+        x = 0.5 * (p0[0]*q0 + p1[0]*q1 + p2[0]*q2 + p3[0]*q3)
+        y = 0.5 * (p0[1]*q0 + p1[1]*q1 + p2[1]*q2 + p3[1]*q3)
+        seg.append((x, y))
+    return seg
+
+
+def arc_lengths(centreline):
+    """Distance along the closed centreline to each sample, then the lap length."""
+    lengths = array("d", [0.0])
+    s = 0.0
+    n = len(centreline)
+    for i in range(n):
+        (x0, y0), (x1, y1) = centreline[i], centreline[(i + 1) % n]
+        s += math.hypot(x1 - x0, y1 - y0)
+        lengths.append(s)
+    return lengths
+
+
+def paint_track(surface, color, points, width):
+    radius = width // 2
+    for p in points:
+        pygame.draw.circle(surface, color, (int(p[0]), int(p[1])), radius)
+
+
+class CentrelineIndex:
+    """Uniform-grid bucket of centreline samples for fast distance queries.
+
+    The track is painted as discs centred on these samples, so "within r of a
+    sample" is the same test the painted mask answers, without touching pixels.
+
+    The grid covers the centreline's bounding box, `cols` x `rows` cells from
+    cell (gx0, gy0). Buckets are stored flat: `xy` holds the samples as
+    [x, y, x, y, ...] sorted row by row, cell by cell, and cell c is the slice
+    starts[c]:starts[c + 1]. A run of cells in one row is then one slice, and
+    the index is two arrays that go into a track file as they are.
+    """
+
+    def __init__(self, centreline, cell=400):
+        gx = [int(x // cell) for x, _ in centreline]
+        gy = [int(y // cell) for _, y in centreline]
+        gx0, gy0 = min(gx), min(gy)
+        cols, rows = max(gx) - gx0 + 1, max(gy) - gy0 + 1
+        cells = [(gy[i] - gy0) * cols + gx[i] - gx0 for i in range(len(centreline))]
+        starts = array("I", bytes(4 * (cols * rows + 1)))
+        for c in cells: starts[c + 1] += 1
+        for c in range(cols * rows): starts[c + 1] += starts[c]
+        xy = array("d")
+        for i in sorted(range(len(centreline)), key=cells.__getitem__):
+            xy.extend(centreline[i])
+        self.cell, self.gx0, self.gy0, self.cols, self.rows = cell, gx0, gy0, cols, rows
+        self.starts, self.xy = starts, xy
+
+    @classmethod
+    def from_arrays(cls, cell, gx0, gy0, cols, rows, starts, xy):
+        """Wrap existing arrays or views (e.g. from a TrackFile) without copying."""
+        index = cls.__new__(cls)
+        index.cell, index.gx0, index.gy0, index.cols, index.rows = cell, gx0, gy0, cols, rows
+        index.starts, index.xy = starts, xy
+        return index
+
+    def near(self, x, y, radius):
+        """True if any centreline sample lies within `radius` of (x, y)."""
+        cell = self.cell
+        r2 = radius * radius
+        span = int(radius // cell) + 1
+        cx, cy = int(x // cell) - self.gx0, int(y // cell) - self.gy0
+        cols = self.cols
+        lo, hi = max(0, cx - span), min(cols, cx + span + 1)
+        if lo >= hi: return False
+        starts, xy = self.starts, self.xy
+        for gy in range(max(0, cy - span), min(self.rows, cy + span + 1)):
+            row = gy * cols
+            for i in range(2 * starts[row + lo], 2 * starts[row + hi], 2):
+                if (xy[i] - x) ** 2 + (xy[i + 1] - y) ** 2 <= r2:
+                    return True
+        return False
+
+
+class TrackCollision:
+    """Wall test straight from the centreline: off the painted discs is wall.
+
+    Same answer the old full-map mask surface gave (outside the map is open),
+    at a fraction of the memory, and usable without any surfaces at all.
+    """
+
+    def __init__(self, centreline, wall_width, map_size=MAP_SIZE, index=None):
+        self.index = index or CentrelineIndex(centreline)
+        self.radius = wall_width // 2
+        self.map_size = map_size
+
+    def is_wall(self, x, y):
+        if not (0 <= x < self.map_size and 0 <= y < self.map_size):
+            return False
+        return not self.index.near(x, y, self.radius)
+
+
+# --- BUILDING ---
+def generate_scenery(spec, centreline, index=None):
+    """Seeded blue-noise scatter of trees in the off-track band."""
+    index = index or CentrelineIndex(centreline)
+    inner = spec.wall_width / 2 + 90 # Keep tree canopies off the wall
+    return scatter_band(centreline, index, inner, inner + spec.scenery_band,
+                        spec.scenery_count, spec.scenery_seed, spec.map_size)
+
+
+def build_layout(spec):
+    """Everything about a track that doesn't need the big world surfaces."""
+    smooth_points = catmull_rom_spline(spec.points, steps=100)
+    map_size = spec.map_size
+
+    # --- AUTO-CROP ---
+    all_x = [p[0] for p in smooth_points]
+    all_y = [p[1] for p in smooth_points]
+    min_x, max_x = min(all_x), max(all_x)
+    min_y, max_y = min(all_y), max(all_y)
+
+    padding = 500
+    crop_x = max(0, min_x - padding)
+    crop_y = max(0, min_y - padding)
+    crop_w = min(map_size - crop_x, (max_x - min_x) + padding * 2)
+    crop_h = min(map_size - crop_y, (max_y - min_y) + padding * 2)
+
+    # --- START LINE & SPAWN ---
+    p0 = smooth_points[0]
+    p1 = smooth_points[5]
+    dx = p1[0] - p0[0]
+    dy = p1[1] - p0[1]
+
+    track_angle = math.degrees(math.atan2(-dy, dx))
+    length = math.hypot(dx, dy)
+    right_x = -dy / length
+    right_y = dx / length
+
+    spacing = 60
+    spawn_1 = (p0[0] - right_x * spacing, p0[1] - right_y * spacing)
+    spawn_2 = (p0[0] + right_x * spacing, p0[1] + right_y * spacing)
+    # Second grid row for 3-4 cars, one car length behind the first
+    back_x, back_y = -dx / length * 150, -dy / length * 150
+    spawns = [spawn_1, spawn_2,
+              (spawn_1[0] + back_x, spawn_1[1] + back_y),
+              (spawn_2[0] + back_x, spawn_2[1] + back_y)]
+
+    check_rects = []
+    check_indices = []
+    for cp in spec.checkpoints:
+        idx = int(cp["at"] * len(smooth_points)) % len(smooth_points)
+        cx, cy = smooth_points[idx]
+        size = cp.get("size", 600)
+        check_rects.append((cx - size/2, cy - size/2, size, size))
+        check_indices.append(idx)
+
+    meta = {
+        "start_rect": (p0[0]-200, p0[1]-200, 400, 400),
+        "check_rects": check_rects,
+        "check_indices": check_indices,
+        "spawn_p1": spawn_1,
+        "spawn_p2": spawn_2,
+        "spawns": spawns,
+        "start_angle": track_angle,
+        "crop_offset": (crop_x, crop_y),
+        "crop_size": (crop_w, crop_h),
+    }
+    return {"centreline": smooth_points, "meta": meta}
+
+
+def inflate_meta(meta):
+    """Turn the plain tuples of a (possibly baked) meta dict into pygame Rects."""
+    meta = dict(meta)
+    meta["start_rect"] = pygame.Rect(meta["start_rect"])
+    meta["check_rects"] = [pygame.Rect(r) for r in meta["check_rects"]]
+    meta["check_rect"] = meta["check_rects"][0]
+    meta["spawn_p1"] = tuple(meta["spawn_p1"])
+    meta["spawn_p2"] = tuple(meta["spawn_p2"])
+    meta["spawns"] = [tuple(s) for s in meta["spawns"]]
+    meta["crop_offset"] = tuple(meta["crop_offset"])
+    meta["crop_size"] = tuple(meta["crop_size"])
+    return meta
+
+
+def paint_world(spec, centreline, start_angle, cancel=None):
+    """The world surface; None if `cancel` (a threading.Event) gets set part way."""
+    map_size = spec.map_size
+    vis = surfaces.opaque((map_size, map_size))
+    vis.fill(GREEN)
+
+    for color, width in ((KERB_RED, spec.kerb_width), (KERB_WHITE, spec.kerb_width - 40),
+                         (ASPHALT, spec.track_width)):
+        if cancel and cancel.is_set(): return None
+        paint_track(vis, color, centreline, width)
+
+    dash_length = 80
+    gap_length = 80
+    cycle_length = dash_length + gap_length
+    current_distance = 0
+
+    for i in range(len(centreline) - 1):
+        p1 = centreline[i]
+        p2 = centreline[i+1]
+        dist = math.hypot(p2[0] - p1[0], p2[1] - p1[1])
+        if (current_distance % cycle_length) < dash_length:
+            pygame.draw.line(vis, WHITE, p1, p2, 12)
+        current_distance += dist
+
+    check_size = 40
+    line_thickness = 80
+    line_surf = pygame.Surface((spec.track_width, line_thickness), pygame.SRCALPHA)
+    for x in range(0, spec.track_width, check_size):
+        for y in range(0, line_thickness, check_size):
+            color = WHITE if (x // check_size + y // check_size) % 2 == 0 else BLACK
+            pygame.draw.rect(line_surf, color, (x, y, check_size, check_size))
+
+    p0 = centreline[0]
+    rot_line = pygame.transform.rotate(line_surf, start_angle - 90)
+    line_rect = rot_line.get_rect(center=(int(p0[0]), int(p0[1])))
+    vis.blit(rot_line, line_rect)
+    return vis
+
+
+# --- BAKE CACHE ---
+def bake_path(spec, bake_dir=BAKE_DIR):
+    return os.path.join(bake_dir, f"{slugify(spec.name)}-{spec.digest()}.trk")
+
+
+def save_baked(spec, layout, index, scenery, bake_dir=BAKE_DIR):
+    """Write the track file for `spec`; returns its path, or None if it couldn't be written."""
+    header = {
+        "name": spec.name,
+        "digest": spec.digest(),
+        "wall_width": spec.wall_width,
+        "map_size": spec.map_size,
+        "meta": layout["meta"],
+        "grid": [index.cell, index.gx0, index.gy0, index.cols, index.rows],
+    }
+    centreline = array("d")
+    for p in layout["centreline"]: centreline.extend(p)
+    sections = {
+        "centreline": centreline,
+        "arc": arc_lengths(layout["centreline"]),
+        "grid_starts": index.starts,
+        "grid_xy": index.xy,
+        "scenery_x": scenery.xs,
+        "scenery_y": scenery.ys,
+        "scenery_scale": scenery.scales,
+    }
+    path = bake_path(spec, bake_dir)
+    try:
+        os.makedirs(bake_dir, exist_ok=True)
+        track_file.write(path, header, sections)
+        return path
+    except OSError as e:
+        print(f"Could not bake {spec.name}: {e}")
+        return None
+
+
+def open_layout(path):
+    """Map a track file read-only; the same dict as load_layout(), built on views of the file.
+
+    Nothing is copied, so attaching takes a millisecond or two however many
+    processes already have the file open.
+    """
+    f = track_file.TrackFile(path)
+    head = f.header
+    index = CentrelineIndex.from_arrays(*head["grid"], f.view("grid_starts"), f.view("grid_xy"))
+    return {
+        "name": head["name"],
+        "meta": inflate_meta(head["meta"]),
+        "centreline": track_file.PointList(f.view("centreline")),
+        "arc": f.view("arc"),
+        "collision": TrackCollision(None, head["wall_width"], head["map_size"], index),
+        "scenery": SceneryLayer.wrap(f.view("scenery_x"), f.view("scenery_y"), f.view("scenery_scale")),
+    }
+
+
+def load_layout(spec, bake_dir=BAKE_DIR):
+    """Everything but the world surfaces: enough to simulate a race headless.
+
+    "arc" holds the distance along the lap to each centreline sample, with
+    the lap length last.
+    """
+    path = bake_path(spec, bake_dir)
+    if os.path.exists(path):
+        try:
+            return open_layout(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring stale bake for {spec.name}: {e}")
+
+    layout = build_layout(spec)
+    index = CentrelineIndex(layout["centreline"])
+    scenery = generate_scenery(spec, layout["centreline"], index)
+    if save_baked(spec, layout, index, scenery, bake_dir):
+        return open_layout(path)
+    return {
+        "name": spec.name,
+        "meta": inflate_meta(layout["meta"]),
+        "centreline": layout["centreline"],
+        "arc": arc_lengths(layout["centreline"]),
+        "collision": TrackCollision(None, spec.wall_width, spec.map_size, index),
+        "scenery": scenery,
+    }
+
+
+def build_track(spec, bake_dir=BAKE_DIR, cancel=None):
+    """Build the full track dict used by the game, reusing the bake if valid.
+
+    Returns None if `cancel` (a threading.Event) is set before it's done.
+    """
+    track = load_layout(spec, bake_dir)
+    if cancel and cancel.is_set(): return None
+    track["vis"] = paint_world(spec, track["centreline"], track["meta"]["start_angle"], cancel)
+    if track["vis"] is None: return None
+    track["scenery_grid"] = SceneryGrid(track["scenery"])
+    return track
+
+
+# --- LOADER ---
+class TrackLoader:
+    """Keeps exactly one built track and builds the next one in the background.
+
+    Builds run one at a time: a new request cancels the build in progress
+    and waits for it to stop before painting, so there is never more than
+    one world surface being held, and a cancelled build's result is dropped.
+    """
+
+    def __init__(self, track_dir=TRACK_DIR, bake_dir=BAKE_DIR):
+        self.bake_dir = bake_dir
+        self.specs = load_library(track_dir)
+        self.current = None
+        self.current_name = None
+        self.error = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._cancel = None # Event of the newest build
+        self._result = None # (cancel event, track or exception) of a finished build
+
+    def names(self):
+        return list(self.specs.keys())
+
+    def request(self, name):
+        """Start building `name` unless it is already built or being built."""
+        if name == self.current_name and (self.current or self.loading() or self.ready()):
+            return
+        cancel = threading.Event()
+        with self._lock:
+            if self._cancel: self._cancel.set()
+            self._cancel = cancel
+            self._result = None
+            # Drop the old surfaces before allocating new ones
+            self.current = None
+            self.current_name = name
+            self.error = None
+        spec = self.specs[name]
+        self._thread = threading.Thread(target=self._build, args=(spec, cancel, self._thread), daemon=True)
+        self._thread.start()
+
+    def _build(self, spec, cancel, previous):
+        if previous: previous.join() # Let a cancelled build let go of its world first
+        if cancel.is_set(): return
+        try:
+            track = build_track(spec, self.bake_dir, cancel)
+        except Exception as e:
+            track = e
+        with self._lock:
+            # A newer request may have replaced us while we were building
+            if not cancel.is_set():
+                self._result = (cancel, track)
+
+    def loading(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def ready(self):
+        """Whether a finished build is waiting for poll()."""
+        with self._lock:
+            return self._result is not None and not self._result[0].is_set()
+
+    def poll(self):
+        """Return the built track once it is ready, otherwise None."""
+        with self._lock:
+            result, self._result = self._result, None
+            if result:
+                cancel, result = result
+                if cancel.is_set(): result = None # Superseded after it finished
+        if isinstance(result, Exception):
+            self.error = result
+            print(f"Failed to build track {self.current_name}: {result}")
+        elif result is not None:
+            self.current = result
+        return self.current
+
+    def wait(self):
+        if self._thread:
+            self._thread.join()
+        return self.poll()